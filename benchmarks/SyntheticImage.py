@@ -0,0 +1,259 @@
+#
+#   SyntheticImage.py
+#
+#   SyntheticImage - Builds a deterministic fake process memory image
+#   for benchmarking the readers and the search engines
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from __future__ import print_function
+from builtins import range
+import random
+from bisect import bisect_right
+from struct import pack
+
+from NativDebugging.Interfaces import ReadError
+from NativDebugging.MemReaderBase import MemReaderBase
+from NativDebugging.Utilities import subtractRanges
+
+PAGE_READONLY       = 0x02
+PAGE_READWRITE      = 0x04
+PAGE_EXECUTE_READ   = 0x20
+PAGE_SIZE           = 0x1000
+
+# Every heap node looks like:
+#   +0x00 next node pointer (NULL terminated)
+#   +0x08 running index
+#   +0x0c 'NODE' magic
+#   +0x10 pointer to the node name in the strings region
+#   +0x18 pointer to a vtable in the tables region
+NODE_SIZE   = 0x20
+NODE_MAGIC  = b'NODE'
+IMAGE_BASE  = 0x400000
+TABLES_BASE = 0x10000000
+HEAP_BASE   = 0x20000000
+STRINGS_BASE = 0x30000000
+ROOTS_BASE  = 0x40000000
+# Odd, so half of the UTF16 strings of the region start at odd addresses
+LONG_STRINGS_BASE = 0x50000001
+SPARSE_BASE = 0x60000000
+NUM_VTABLES = 0x10
+VTABLE_SIZE = 0x40
+
+class SyntheticImage( MemReaderBase ):
+    """
+    Memory reader over a set of in memory regions that are generated from a seed,
+    so every run of the benchmarks looks at exactly the same memory.
+    The layout is 64bit little endian and made of:
+        image   - An executable region with code like bytes and a 'MZ' header
+        tables  - Read only vtables that point into the image
+        heap    - Linked lists of NODE_SIZE nodes scattered in random order
+        strings - Ascii and UTF16 names of the nodes
+        roots   - Pointers to the head of every list
+    """
+    def __init__(self, heapSize=0x100000, numLists=8, seed=0x1337):
+        MemReaderBase.__init__(self)
+        self._POINTER_SIZE = 8
+        self._DEFAULT_DATA_SIZE = 4
+        self._ENDIANITY = '<'
+        self.heapSize = heapSize - (heapSize % NODE_SIZE)
+        self.numLists = numLists
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._regions = []
+        self._untouchedPages = []
+        self._build()
+
+    def _build(self):
+        rand = self._random
+        image = bytearray(rand.getrandbits(8) for i in range(0x4000))
+        image[0:2] = b'MZ'
+        self.vtables = [TABLES_BASE + i * VTABLE_SIZE for i in range(NUM_VTABLES)]
+        tables = b''.join(
+                pack('<Q', IMAGE_BASE + 0x1000 + rand.randrange(0, 0x2000, 0x10))
+                for i in range(NUM_VTABLES * VTABLE_SIZE // 8))
+
+        numNodes = self.heapSize // NODE_SIZE
+        strings = bytearray()
+        namesAddresses = []
+        for i in range(numNodes):
+            namesAddresses.append(STRINGS_BASE + len(strings))
+            name = 'node_%06d' % i
+            if i % 4:
+                strings += name.encode('ascii') + b'\x00'
+            else:
+                strings += name.encode('utf-16-le') + b'\x00\x00'
+            while len(strings) % 8:
+                strings += b'\x00'
+
+        # Scatter the nodes so following a list jumps all over the heap
+        slots = list(range(numNodes))
+        rand.shuffle(slots)
+        heap = bytearray(self.heapSize)
+        self.listsHeads = []
+        self.listsLengths = []
+        nodesPerList = numNodes // self.numLists
+        for listIndex in range(self.numLists):
+            listSlots = slots[listIndex * nodesPerList:(listIndex + 1) * nodesPerList]
+            if not listSlots:
+                continue
+            self.listsHeads.append(HEAP_BASE + listSlots[0] * NODE_SIZE)
+            self.listsLengths.append(len(listSlots))
+            for index, slot in enumerate(listSlots):
+                if index + 1 < len(listSlots):
+                    nextNode = HEAP_BASE + listSlots[index + 1] * NODE_SIZE
+                else:
+                    nextNode = 0
+                offset = slot * NODE_SIZE
+                heap[offset:offset + NODE_SIZE] = pack('<QL4sQQ',
+                        nextNode,
+                        index,
+                        NODE_MAGIC,
+                        namesAddresses[slot],
+                        self.vtables[slot % NUM_VTABLES])
+        roots = b''.join(pack('<Q', head) for head in self.listsHeads)
+
+        self._addRegion(IMAGE_BASE,   bytes(image),   'image.exe', PAGE_EXECUTE_READ)
+        self._addRegion(TABLES_BASE,  tables,         'tables',    PAGE_READONLY)
+        self._addRegion(HEAP_BASE,    bytes(heap),    'heap',      PAGE_READWRITE)
+        self._addRegion(STRINGS_BASE, bytes(strings), 'strings',   PAGE_READONLY)
+        self._addRegion(ROOTS_BASE,   roots,          'roots',     PAGE_READWRITE)
+
+    def addLongStrings(self, size=0x40000):
+        """
+        Adds a region of ascii and UTF16 strings from a few characters to a few pages long,
+        which is longer than the overlap of the chunks strings are extracted in
+        """
+        rand = self._random
+        data = bytearray()
+        while len(data) < size:
+            length = rand.choice([1, 3, 5, 0x100, 0xfff, 0x1000, 0x1001, 0x2345, 0x5000])
+            text = bytes(bytearray(rand.randrange(0x20, 0x7f) for i in range(length)))
+            if rand.random() < 0.5:
+                data += text
+            else:
+                data += text.decode('ascii').encode('utf-16-le')
+            data += b'\x01' * rand.randint(1, 9)
+        self._addRegion(LONG_STRINGS_BASE, bytes(data[:size]), 'longStrings', PAGE_READONLY)
+
+    def addSparseRegion(self, size=0x40000):
+        """
+        Adds a region that most of its pages were never touched, like a large allocation of a
+        process. Those pages are zeros, and getResidentRuns leaves them out.
+        """
+        rand = self._random
+        data = bytearray(size)
+        for offset in range(0, size, PAGE_SIZE):
+            if rand.random() < 0.25:
+                data[offset:offset + PAGE_SIZE] = bytearray(rand.getrandbits(8) for i in range(PAGE_SIZE))
+            else:
+                self._untouchedPages.append((SPARSE_BASE + offset, PAGE_SIZE))
+        self._addRegion(SPARSE_BASE, bytes(data), 'sparse', PAGE_READWRITE)
+
+    def _addRegion(self, address, data, name, attributes):
+        self._regions.append((address, data, name, attributes))
+        self._regions.sort()
+        self._regionsStarts = [region[0] for region in self._regions]
+
+    def _findRegion(self, addr):
+        index = bisect_right(self._regionsStarts, addr) - 1
+        if index < 0:
+            return None
+        region = self._regions[index]
+        if addr >= region[0] + len(region[1]):
+            return None
+        return region
+
+    def readMemory(self, addr, length):
+        region = self._findRegion(addr)
+        if None == region:
+            raise ReadError(addr)
+        offset = addr - region[0]
+        if offset + length > len(region[1]):
+            raise ReadError(region[0] + len(region[1]))
+        return region[1][offset:offset + length]
+
+    def isAddressValid(self, addr):
+        return None != self._findRegion(addr)
+
+    def getResidentRuns(self, ranges):
+        return subtractRanges(ranges, self._untouchedPages)
+
+    def getMemoryMap(self):
+        return dict([(address, (name, len(data), attributes)) for address, data, name, attributes in self._regions])
+
+    def getRegionData(self, name):
+        for address, data, regionName, attributes in self._regions:
+            if name == regionName:
+                return address, data
+        raise Exception("No region named %s" % name)
+
+    def writeRawFile(self, fileName, regionName='heap'):
+        """ Writes a single region as is, to be opened with FileReader """
+        address, data = self.getRegionData(regionName)
+        with open(fileName, 'wb') as outFile:
+            outFile.write(data)
+        return address
+
+    def writeNativDump(self, fileName):
+        """ Writes all regions in the NativDebugging dump format """
+        self.dumpToFile(fileName)
+
+    def writeMiniDump(self, fileName):
+        """
+        Writes all regions as a minimal MiniDump file made of a SystemInfo stream,
+        an empty ModuleList stream and a Memory64List stream
+        """
+        SYSTEM_INFO_STREAM      = 7
+        MODULE_LIST_STREAM      = 4
+        MEMORY64_LIST_STREAM    = 9
+        HEADER_SIZE     = 0x20
+        DIRECTORY_SIZE  = 12
+        SYSTEM_INFO_SIZE = 56
+        numStreams = 3
+        systemInfoRva = HEADER_SIZE + DIRECTORY_SIZE * numStreams
+        moduleListRva = systemInfoRva + SYSTEM_INFO_SIZE
+        memoryListRva = moduleListRva + 4
+        memoryListSize = 0x10 + 0x10 * len(self._regions)
+        baseRva = memoryListRva + memoryListSize
+        # PROCESSOR_ARCHITECTURE_AMD64
+        systemInfo = pack('<HHHBBLLLLLHH', 9, 6, 0, 1, 1, 10, 0, 0, 2, 0, 0, 0) + b'\x00' * 24
+        header = b'MDMP' + pack('<LLLLLQ', 0xa793, numStreams, HEADER_SIZE, 0, 0, 0)
+        directory = pack('<LLL', SYSTEM_INFO_STREAM, SYSTEM_INFO_SIZE, systemInfoRva) + \
+                pack('<LLL', MODULE_LIST_STREAM, 4, moduleListRva) + \
+                pack('<LLL', MEMORY64_LIST_STREAM, memoryListSize, memoryListRva)
+        memoryList = pack('<QQ', len(self._regions), baseRva) + \
+                b''.join(pack('<QQ', address, len(data)) for address, data, name, attributes in self._regions)
+        with open(fileName, 'wb') as outFile:
+            outFile.write(header)
+            outFile.write(directory)
+            outFile.write(systemInfo)
+            outFile.write(pack('<L', 0))
+            outFile.write(memoryList)
+            for address, data, name, attributes in self._regions:
+                outFile.write(data)
+
+__all__ = [
+        "SyntheticImage",
+        "NODE_SIZE",
+        "NODE_MAGIC",
+        "IMAGE_BASE",
+        "TABLES_BASE",
+        "HEAP_BASE",
+        "STRINGS_BASE",
+        "ROOTS_BASE",
+        "LONG_STRINGS_BASE",
+        "SPARSE_BASE" ]
@@ -0,0 +1,999 @@
+#
+#   runBenchmarks.py
+#
+#   Runs the readers and the search engines over synthetic memory images,
+#   checks the result of every benchmark and compares the timings with a
+#   saved baseline
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+# Usage:
+#   python runBenchmarks.py --sizes 0x40000,0x100000 --repeat 3 --output results.json
+#   python runBenchmarks.py --save-baseline baseline.json
+#   python runBenchmarks.py --baseline baseline.json --threshold 1.25
+
+from __future__ import print_function
+from builtins import range
+import os
+import sys
+import re
+import json
+import struct
+import random
+import hashlib
+import shutil
+import tempfile
+import argparse
+import platform
+import subprocess
+import time
+
+if hasattr(time, 'perf_counter'):
+    _timer = time.perf_counter
+else:
+    _timer = time.time
+
+from NativDebugging.Interfaces import ReadError
+from NativDebugging.Utilities import subtractRanges
+from NativDebugging.Patterns.Finder import *
+from NativDebugging.Patterns.StructView import compileView, refreshViews
+from NativDebugging.File.FileReader import FileReader
+from NativDebugging.File.ImageReader import ImageReader
+from NativDebugging.Patterns.PE import ImageDosHeader
+from NativDebugging.MemoryDump.Reader import DumpReader, loadDump
+from NativDebugging.MemoryDump.MiniDump import MiniDump
+from NativDebugging.Win32.DifferentialSearch import newDifferentialSearch
+from NativDebugging.ChangeTracker import HashChangeTracker
+from NativDebugging.ScanJob import ScanJob
+from NativDebugging.MemoryServer import MemoryServer, MemoryClient, COUNT, READ_REQUEST
+from NativDebugging.ReadAhead import ReadAheadReader
+from NativDebugging.Signatures import SignatureSet
+from NativDebugging.StringsIndex import buildStringsIndex, extractStrings
+from NativDebugging.PointerGraph import exportPointerGraph, PointerGraph, IS_NUMPY_FOUND
+from NativDebugging.VtableScanner import findVtables
+from NativDebugging.Linux.ProcMaps import MapsTracker, parseMaps
+from NativDebugging.Linux.SharedMemReader import SharedMemReader
+from NativDebugging.Linux.PageMap import PageMap
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from SyntheticImage import *
+
+BENCHMARKS = []
+IS_LINUX = sys.platform.startswith('linux')
+
+def benchmark(name, expected):
+    """
+    Registers a benchmark, that must return the expected result.
+    expected is the result itself, or a function of (image, files) that computes it without
+    the code that is measured. Benchmarks that can not run on this platform return None.
+    """
+    def _benchmark(func):
+        BENCHMARKS.append((name, func, expected))
+        return func
+    return _benchmark
+
+def digest(value):
+    """ Short fingerprint of a result that is too large to be printed and saved """
+    return hashlib.sha1(repr(value).encode('utf8')).hexdigest()
+
+def fileDigest(fileName):
+    with open(fileName, 'rb') as inFile:
+        return (os.path.getsize(fileName), hashlib.sha1(inFile.read()).hexdigest())
+
+def heapNodes(image):
+    """ (next, index, magic, name, vtable) of every slot of the heap by its address, unpacked from the heap data """
+    address, heap = image.getRegionData('heap')
+    return dict([(address + offset, struct.unpack_from('<QL4sQQ', heap, offset)) for offset in range(0, len(heap), NODE_SIZE)])
+
+def listNodes(nodes, head):
+    result = []
+    while 0 != head:
+        result.append(head)
+        head = nodes[head][0]
+    return result
+
+def allListsNodes(image, files):
+    return sum(image.listsLengths)
+
+def firstListNodes(image, files):
+    return image.listsLengths[0]
+
+def indexesSum(image, files):
+    # Every list is indexed from zero
+    return sum([length * (length - 1) // 2 for length in image.listsLengths])
+
+def walkLists(reader, image):
+    """ Follows every list from the roots table, returns number of visited nodes """
+    count = 0
+    for listIndex in range(len(image.listsHeads)):
+        node = reader.readAddr(ROOTS_BASE + listIndex * 8)
+        while 0 != node:
+            reader.readUInt32(node + 8)
+            count += 1
+            node = reader.readAddr(node)
+    return count
+
+@benchmark('SyntheticImage.walkLists', allListsNodes)
+def benchSyntheticWalk(image, files):
+    return walkLists(image, image)
+
+@benchmark('FileReader.readUInt32', indexesSum)
+def benchFileReader(image, files):
+    reader = FileReader(files['raw'], loading_address=HEAP_BASE, pointer_size=8, endianity='<')
+    total = 0
+    for addr in range(HEAP_BASE, HEAP_BASE + image.heapSize, NODE_SIZE):
+        total += reader.readUInt32(addr + 8)
+    return total
+
+def magicStringsLength(image, files):
+    # The same strings read by the reader of the image
+    return sum([len(image.readString(addr, maxSize=4)) for addr in range(HEAP_BASE + 0xc, HEAP_BASE + image.heapSize, NODE_SIZE)])
+
+@benchmark('FileReader.readString', magicStringsLength)
+def benchFileReaderStrings(image, files):
+    reader = FileReader(files['raw'], loading_address=HEAP_BASE, pointer_size=8, endianity='<')
+    # The names are not part of the raw file, so read the magic of every node as a string
+    count = 0
+    for addr in range(HEAP_BASE + 0xc, HEAP_BASE + image.heapSize, NODE_SIZE):
+        count += len(reader.readString(addr, maxSize=4))
+    return count
+
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'Win32')
+IMAGES_NAMES = ['memReaderx86.exe', 'memReaderAMD64.exe', 'DetoursAMD64.dll']
+
+def imagesSections(image, files):
+    # NumberOfSections of the IMAGE_FILE_HEADER, that follows the 'PE\0\0' at e_lfanew
+    count = 0
+    for name in IMAGES_NAMES:
+        with open(os.path.join(IMAGES_DIR, name), 'rb') as imageFile:
+            data = imageFile.read(0x1000)
+        peOffset = struct.unpack_from('<L', data, 0x3c)[0]
+        count += struct.unpack_from('<H', data, peOffset + 6)[0]
+    return count
+
+@benchmark('ImageReader.parseHeaders', imagesSections)
+def benchImageReader(image, files):
+    # Loads the PE files that come with the Win32 reader, and searches their headers at the image base
+    count = 0
+    for name in IMAGES_NAMES:
+        reader = ImageReader(os.path.join(IMAGES_DIR, name))
+        header = CreatePatternsFinder(reader).searchOne(ImageDosHeader, reader.getImageBase())
+        count += header.PE.FileHeader.NumberOfSections
+        reader.close()
+    return count
+
+# Modules that should only be loaded when they are used
+LAZY_MODULES = ['distorm3', 'PyQt4', 'rpyc', 'numpy', 'future.utils', 'subprocess']
+IMPORT_READERS = 'import NativDebugging.File.FileReader, NativDebugging.Patterns.Finder, NativDebugging.MemoryDump.Reader'
+
+def runFreshInterpreter(code):
+    """ Runs code in a new interpreter, that has the same modules path as this one """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([path for path in sys.path if path])
+    return subprocess.check_output([sys.executable, '-c', code], env=env).decode('ascii').strip()
+
+@benchmark('Import.interpreter', '')
+def benchImportInterpreter(image, files):
+    # Startup of a bare interpreter, the part of the import benchmarks that is not ours
+    return runFreshInterpreter('pass')
+
+@benchmark('Import.readers', '')
+def benchImportReaders(image, files):
+    # What a short lived batch worker pays before reading anything, returns the heavy modules it loaded
+    return runFreshInterpreter('import sys\n%s\nprint(",".join([x for x in %r if x in sys.modules]))' % (IMPORT_READERS, LAZY_MODULES))
+
+def regionsCount(image, files):
+    return len(image.getMemoryMap())
+
+@benchmark('DumpReader.load', regionsCount)
+def benchDumpLoad(image, files):
+    return len(DumpReader(files['ndmd']).getMemoryMap())
+
+@benchmark('DumpReader.walkLists', allListsNodes)
+def benchDumpWalk(image, files):
+    return walkLists(DumpReader(files['ndmd']), image)
+
+def heapWords(image):
+    heap = image.getRegionData('heap')[1]
+    return list(struct.unpack('<%dQ' % (len(heap) // 8), heap))
+
+def validHeapWords(image, files):
+    return len([value for value in heapWords(image) if image.isAddressValid(value)])
+
+@benchmark('DumpReader.isAddressValid', validHeapWords)
+def benchDumpIsAddressValid(image, files):
+    # Every word of the heap as a candidate pointer, like RecursiveFind checks them
+    reader = DumpReader(files['ndmd'])
+    isAddressValid = reader.isAddressValid
+    return sum([1 for value in heapWords(image) if isAddressValid(value)])
+
+@benchmark('PageTable.isValidArray', validHeapWords)
+def benchPageTableArray(image, files):
+    reader = DumpReader(files['ndmd'])
+    return int(reader.getPageTable().isValidArray(heapWords(image)).sum())
+
+MAPS_DATA = {}
+
+def mapsData(numRegions, changed=None):
+    """ Content of a maps file of a process with many mappings, with the permissions of one changed """
+    if (numRegions, changed) in MAPS_DATA:
+        return MAPS_DATA[(numRegions, changed)]
+    lines = []
+    for i in range(numRegions):
+        start = 0x10000000 + i * 0x3000
+        permissions = 'rw-p'
+        if i == changed:
+            permissions = 'r--p'
+        pathName = ''
+        if i % 3:
+            pathName = '/usr/lib/lib%d.so' % (i % 300)
+        lines.append('%x-%x %s %08x 08:01 %d %s\n' % (start, start + 0x2000, permissions, i * 0x1000, i, pathName))
+    MAPS_DATA[(numRegions, changed)] = ''.join(lines).encode('ascii')
+    return MAPS_DATA[(numRegions, changed)]
+
+@benchmark('ProcMaps.parse', 50000)
+def benchProcMapsParse(image, files):
+    return len(parseMaps(mapsData(50000)))
+
+# The tracker and the number of refreshes, so every run refreshes an already read map
+MAPS_TRACKER = [None, 0]
+
+@benchmark('ProcMaps.incrementalRefresh', 1)
+def benchProcMapsRefresh(image, files):
+    # A monitor that rereads the maps of a process with 50K mappings, after a single mprotect
+    tracker = MAPS_TRACKER[0]
+    if None == tracker:
+        tracker = MapsTracker(0)
+        tracker.refresh(mapsData(50000))
+        MAPS_TRACKER[0] = tracker
+    MAPS_TRACKER[1] = (MAPS_TRACKER[1] + 1) % 2
+    return len(tracker.refresh(mapsData(50000, changed=(None, 1234)[MAPS_TRACKER[1]])))
+
+def attachImageToSharedMemory(image):
+    """
+    Copies every region of the image to a new System V segment, and attaches all of them
+    at the addresses of the regions. Returns the reader and the list of shmids to remove.
+    """
+    import ctypes
+    libc = ctypes.CDLL(None)
+    libc.shmat.restype = ctypes.c_void_p
+    libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+    libc.shmdt.argtypes = [ctypes.c_void_p]
+    shmids = []
+    memInfos = []
+    try:
+        for address, size, name, attributes in image.getMemoryRegions():
+            shmid = libc.shmget(0, size, 0o1600) # IPC_PRIVATE, IPC_CREAT | 0600
+            if 0 > shmid:
+                raise Exception("Failed to create a shared memory segment")
+            shmids.append(shmid)
+            localAddress = libc.shmat(shmid, None, 0)
+            ctypes.memmove(localAddress, image.readMemory(address, size), size)
+            libc.shmdt(localAddress)
+            memInfos.append((shmid, address, size))
+        return SharedMemReader(memInfos), shmids
+    except Exception:
+        removeSharedMemory(shmids)
+        raise
+
+def removeSharedMemory(shmids):
+    import ctypes
+    libc = ctypes.CDLL(None)
+    for shmid in shmids:
+        libc.shmctl(shmid, 0, None) # IPC_RMID
+
+# A sparse anonymous mapping of this process, and its address
+SPARSE_MAPPING = [None, 0]
+
+def sparseMappingRuns(image, files):
+    # Every touched page is a run of its own
+    if not IS_LINUX:
+        return None
+    return 0x40000000 // 0x100000
+
+@benchmark('PageMap.getResidentRuns', sparseMappingRuns)
+def benchPageMapResidentRuns(image, files):
+    # Finds the touched pages of a 1GB heap with one page in 0x100 touched
+    if not IS_LINUX:
+        return None
+    import mmap
+    import ctypes
+    if None == SPARSE_MAPPING[0]:
+        mapping = mmap.mmap(-1, 0x40000000, flags=mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS | getattr(mmap, 'MAP_NORESERVE', 0))
+        for offset in range(0, len(mapping), 0x100000):
+            mapping[offset:offset + 1] = b'\x01'
+        SPARSE_MAPPING[0] = mapping
+        SPARSE_MAPPING[1] = ctypes.addressof(ctypes.c_char.from_buffer(mapping))
+    pageMap = PageMap(os.getpid())
+    try:
+        return len(pageMap.getResidentRuns(SPARSE_MAPPING[1], 0x40000000))
+    finally:
+        pageMap.close()
+
+def linuxListsNodes(image, files):
+    if not IS_LINUX:
+        return None
+    return allListsNodes(image, files)
+
+@benchmark('SharedMemReader.walkLists', linuxListsNodes)
+def benchSharedMemWalk(image, files):
+    if not IS_LINUX:
+        return None
+    reader, shmids = attachImageToSharedMemory(image)
+    try:
+        return walkLists(reader, image)
+    finally:
+        reader.detach()
+        removeSharedMemory(shmids)
+
+def heapWordsSum(image, files):
+    if not IS_LINUX or not IS_NUMPY_FOUND:
+        return None
+    return sum(heapWords(image)) % (1 << 64)
+
+@benchmark('SharedMemReader.readArray', heapWordsSum)
+def benchSharedMemArray(image, files):
+    # Sums the heap as an array of words that is not copied out of the shared memory
+    if not IS_LINUX or not IS_NUMPY_FOUND:
+        return None
+    reader, shmids = attachImageToSharedMemory(image)
+    try:
+        words = reader.readArray(HEAP_BASE, image.heapSize // 8, 'Q')
+        total = int(words.sum(dtype='uint64'))
+        del words
+        return total
+    finally:
+        reader.detach()
+        removeSharedMemory(shmids)
+
+def regionsData(image):
+    return [image.readMemory(address, size) for address, size, name, attributes in image.getMemoryRegions()]
+
+def searchNeedles(image):
+    # The node magic and two of the vtables
+    return [b'NODE', struct.pack('<Q', image.vtables[0]), struct.pack('<Q', image.vtables[1])]
+
+def needlesCount(image, files):
+    # The regions of the image are not adjacent, so nothing is found across two of them
+    count = 0
+    for data in regionsData(image):
+        for needle in searchNeedles(image):
+            pos = data.find(needle)
+            while -1 != pos:
+                count += 1
+                pos = data.find(needle, pos + 1)
+    return count
+
+@benchmark('MemReaderBase.searchBytes', needlesCount)
+def benchSearchBytes(image, files):
+    return len(list(DumpReader(files['ndmd']).searchBytes(searchNeedles(image), chunkSize=0x10000)))
+
+# The node magic followed by name pointers of different low bytes
+NAME_LOW_BYTES = [(i * 8) & 0xff for i in range(100)]
+
+def signaturesCount(image, files):
+    count = 0
+    for data in regionsData(image):
+        for lowByte in NAME_LOW_BYTES:
+            count += len(re.findall(b'NODE' + re.escape(struct.pack('B', lowByte)) + b'.{5}\x00\x00', data, re.DOTALL))
+    return count
+
+@benchmark('Signatures.scan', signaturesCount)
+def benchSignatures(image, files):
+    # A hundred signatures in one pass
+    signatures = SignatureSet('nodes')
+    for i, lowByte in enumerate(NAME_LOW_BYTES):
+        signatures.add('node%02x' % i, '4E 4F 44 45 %02x ?? [2] ?? ?? 00 00' % lowByte)
+    return len(list(signatures.scan(DumpReader(files['ndmd']))))
+
+def nodeStrings(image, files):
+    # The name of every slot, and the magic of every node, that makes a string with what follows it
+    return image.heapSize // NODE_SIZE + allListsNodes(image, files)
+
+@benchmark('StringsIndex.build', nodeStrings)
+def benchStringsIndex(image, files):
+    index = buildStringsIndex(DumpReader(files['ndmd']), os.path.join(files['dir'], 'strings.index'))
+    # Node names are all in the strings region
+    count = len(list(index.find('node', isCaseSensitive=False)))
+    index.close()
+    return count
+
+def longStringsImage(image):
+    reader = SyntheticImage(heapSize=0x4000, seed=image.seed)
+    reader.addLongStrings()
+    return reader
+
+def longStrings(image, files):
+    # All the region in a single chunk
+    strings = list(extractStrings(longStringsImage(image), nameFilter='longStrings', chunkSize=0x100000))
+    return (len(strings), digest(strings))
+
+@benchmark('StringsIndex.chunkSizes', longStrings)
+def benchStringsChunkSizes(image, files):
+    # Strings longer than the overlap of the chunks must come out the same for any chunk size
+    reader = longStringsImage(image)
+    results = []
+    for chunkSize, workers in ((0x1000, None), (0x1001, None), (0x1fff, 4), (0x2345, None), (0x10000, 4)):
+        results.append(list(extractStrings(reader, nameFilter='longStrings', chunkSize=chunkSize, workers=workers)))
+        if results[0] != results[-1]:
+            raise Exception("Strings of chunks of 0x%x bytes differ from those of chunks of 0x1000 bytes" % chunkSize)
+    return (len(results[0]), digest(results[0]))
+
+def numpyListsNodes(image, files):
+    if not IS_NUMPY_FOUND:
+        return None
+    return allListsNodes(image, files)
+
+@benchmark('PointerGraph.export', numpyListsNodes)
+def benchPointerGraph(image, files):
+    if not IS_NUMPY_FOUND:
+        return None
+    directory = os.path.join(files['dir'], 'pointerGraph')
+    nodes = [(HEAP_BASE + offset, NODE_SIZE) for offset in range(0, image.heapSize, NODE_SIZE)]
+    exportPointerGraph(DumpReader(files['ndmd']), directory, objects=nodes)
+    graph = PointerGraph(directory)
+    return int(graph.reachable(graph.externalRoots()).sum())
+
+def vtablesCount(image, files):
+    if not IS_NUMPY_FOUND:
+        return None
+    return len(image.vtables)
+
+@benchmark('VtableScanner.findVtables', vtablesCount)
+def benchVtableScanner(image, files):
+    if not IS_NUMPY_FOUND:
+        return None
+    return len(findVtables(DumpReader(files['ndmd']), minCount=2, maxInstances=0x10))
+
+@benchmark('MiniDump.load', regionsCount)
+def benchMiniDumpLoad(image, files):
+    return len(MiniDump(files['mdmp']).getMemoryMap())
+
+@benchmark('MiniDump.walkLists', allListsNodes)
+def benchMiniDumpWalk(image, files):
+    return walkLists(MiniDump(files['mdmp']), image)
+
+@benchmark('MemoryClient.walkLists', allListsNodes)
+def benchMemoryClientWalk(image, files):
+    server = MemoryServer(image, ('127.0.0.1', 0))
+    server.serveInThread(0.01)
+    try:
+        client = MemoryClient(server.getAddress())
+        count = walkLists(client, image)
+        client.close()
+    finally:
+        server.close()
+    return count
+
+@benchmark('ReadAheadReader.sequentialScan', indexesSum)
+def benchReadAheadScan(image, files):
+    server = MemoryServer(image, ('127.0.0.1', 0), maxCachedPages=0)
+    server.serveInThread(0.01)
+    try:
+        client = MemoryClient(server.getAddress())
+        reader = ReadAheadReader(client)
+        total = 0
+        for addr in range(HEAP_BASE, HEAP_BASE + image.heapSize, NODE_SIZE):
+            total += reader.readUInt32(addr + 8)
+        client.close()
+    finally:
+        server.close()
+    return total
+
+# Small enough for the heap to be read in many pieces, and the requests to be sent in many round trips
+SMALL_REQUESTS_LIMITS = {
+        'maxReadLength'     : 0x100,
+        'maxBatchLength'    : 0x1000,
+        'maxPayloadLength'  : COUNT.size + 0x10 * READ_REQUEST.size }
+
+def splitRequests(image):
+    # All the heap at once, reads of any length, and reads that can not be done
+    requests = [(HEAP_BASE, image.heapSize)]
+    requests += [(HEAP_BASE + i * 0x33, i) for i in range(0x300)]
+    requests += [(STRINGS_BASE - 0x10, 0x20), (ROOTS_BASE, 0x1000000), (HEAP_BASE + image.heapSize - 0x10, 0x20)]
+    addresses = list(range(HEAP_BASE - 0x1000, HEAP_BASE + image.heapSize + 0x1000, 0x40))
+    return requests, addresses
+
+def splitRequestsResults(image, files):
+    requests, addresses = splitRequests(image)
+    datas = []
+    for address, length in requests:
+        try:
+            datas.append(image.readMemory(address, length))
+        except ReadError:
+            datas.append(None)
+    return (len(datas), digest((datas, [image.isAddressValid(address) for address in addresses])))
+
+@benchmark('MemoryClient.requestSplitting', splitRequestsResults)
+def benchMemoryClientSplitting(image, files):
+    # The server closes a connection that sends more than its limits, so the client must split
+    server = MemoryServer(image, ('127.0.0.1', 0), maxCachedPages=0, **SMALL_REQUESTS_LIMITS)
+    server.serveInThread(0.01)
+    try:
+        client = MemoryClient(server.getAddress(), **SMALL_REQUESTS_LIMITS)
+        requests, addresses = splitRequests(image)
+        datas = client.readMemoryBatch(requests)
+        isValid = client.isAddressValidBatch(addresses)
+        client.close()
+    finally:
+        server.close()
+    return (len(datas), digest((datas, isValid)))
+
+def namesLength(image, files):
+    nodes = heapNodes(image)
+    return sum([len('node_%06d' % ((node - HEAP_BASE) // NODE_SIZE)) for head in image.listsHeads for node in listNodes(nodes, head)])
+
+@benchmark('MemReaderBase.readString', namesLength)
+def benchReadString(image, files):
+    count = 0
+    for head in image.listsHeads:
+        node = head
+        while 0 != node:
+            nameAddr = image.readAddr(node + 0x10)
+            if 0 == image.readUInt8(nameAddr + 1):
+                count += len(image.readString(nameAddr, isUnicode=True))
+            else:
+                count += len(image.readString(nameAddr))
+            node = image.readAddr(node)
+    return count
+
+def nodePattern():
+    return [
+        SHAPE('next',   0,      n_pointer(isNullValid=True)),
+        SHAPE('index',  8,      n_uint32()),
+        SHAPE('magic',  0xc,    n_string(fixedValue=NODE_MAGIC, isPrintable=False)),
+        SHAPE('name',   0x10,   n_pointer()),
+        SHAPE('vtable', 0x18,   n_pointer(valueRange=(TABLES_BASE, TABLES_BASE + 0x1000)))]
+
+@benchmark('PatternFinder.searchNodes', allListsNodes)
+def benchPatternFinder(image, files):
+    patFinder = CreatePatternsFinder(image)
+    pattern = nodePattern()
+    count = 0
+    for head in image.listsHeads:
+        node = head
+        while 0 != node:
+            if None != patFinder.searchOne(pattern, node):
+                count += 1
+            node = image.readAddr(node)
+    return count
+
+@benchmark('PatternFinder.followList', firstListNodes)
+def benchPatternFinderList(image, files):
+    patFinder = CreatePatternsFinder(image)
+    pattern = [
+        SHAPE('index',  8,      n_uint32()),
+        SHAPE('magic',  0xc,    n_string(fixedValue=NODE_MAGIC, isPrintable=False)),
+        SHAPE('name',   0x10,   n_pointer()) ]
+    count = 0
+    for head in image.listsHeads[:1]:
+        node = head
+        while 0 != node:
+            if None != patFinder.searchOne(pattern, node):
+                count += 1
+            node = image.readAddr(node)
+    return count
+
+def listNodePattern(patFinder, address, context):
+    return [
+        SHAPE('next',   0,      n_struct_ptr(listNodePattern, isNullValid=True)),
+        SHAPE('index',  8,      n_uint32()),
+        SHAPE('magic',  0xc,    n_string(fixedValue=NODE_MAGIC, isPrintable=False)) ]
+
+@benchmark('PatternFinder.pointerChain', firstListNodes)
+def benchPatternFinderChain(image, files):
+    patFinder = CreatePatternsFinder(image)
+    result = patFinder.searchOne([SHAPE('head', 0, n_struct_ptr(listNodePattern))], ROOTS_BASE)
+    count = 0
+    node = result.head
+    while node._val:
+        count += 1
+        node = node.next
+    return count
+
+def sharedNodePattern(patFinder, address, context):
+    # Every node is reached twice, which is exponential without the memo
+    return [
+        SHAPE('next',   0,          n_struct_ptr(sharedNodePattern, isNullValid=True)),
+        SHAPE('again',  (0, None),  n_struct_ptr(sharedNodePattern, isNullValid=True), fromStart=True),
+        SHAPE('index',  8,          n_uint32()) ]
+
+@benchmark('PatternFinder.memoizedGraph', firstListNodes)
+def benchPatternFinderMemo(image, files):
+    patFinder = CreatePatternsFinder(image, memoSize=0x10000)
+    patFinder.searchOne([SHAPE('head', 0, n_struct_ptr(sharedNodePattern))], ROOTS_BASE)
+    return patFinder.memo.getStats()['misses']
+
+class GeneratorPatternFinder( PatternFinder ):
+    """
+    The search engine as it was before the explicit stack matcher, a generator per shape that
+    recurses with the rest of the pattern. Sub searches go through it as well.
+    """
+    def __init__(self, memReader):
+        PatternFinder.__init__(self, memReader)
+        self._search = self._generatorSearch
+
+    def _generatorSearch(self, pattern, startAddress, lastAddress=0, context=None):
+        shape = pattern[0]
+        for shapeAddress, shapeOffset in shape.getValidRange(startAddress, lastAddress, context):
+            for _ in shape.isValid(self, shapeAddress, shapeOffset, context):
+                if len(pattern) > 1:
+                    shapeEnd = shapeAddress
+                    if None != getattr(shape, 'data', None):
+                        shapeEnd += len(shape.data)
+                    for result in self._search(pattern[1:], startAddress, shapeEnd, context):
+                        yield result
+                else:
+                    yield context
+
+def contextSnapshot(value):
+    """ Everything that was found, as the context is changed by the search that goes on """
+    if isinstance(value, SearchContext):
+        names = sorted([x for x in value.__dict__.keys() if not x.startswith('_')])
+        return (getattr(value, '_val', None), tuple([(x, contextSnapshot(getattr(value, x))) for x in names]))
+    if isinstance(value, list):
+        return [contextSnapshot(x) for x in value]
+    return value
+
+def stringPattern(patFinder, address, context):
+    return [SHAPE('text', 0, n_string(isPrintable=True))]
+
+def chainPattern(depth):
+    def _chainPattern(patFinder, address, context):
+        pattern = [
+            SHAPE('index',  (8, None),  n_uint32(), fromStart=True),
+            SHAPE('magic',  (0, None),  n_string(fixedValue=NODE_MAGIC, isPrintable=False)),
+            SHAPE('name',   (0, None),  n_struct_ptr(stringPattern)) ]
+        if depth:
+            pattern.insert(0, SHAPE('next', 0, n_struct_ptr(chainPattern(depth - 1), isNullValid=True)))
+        return pattern
+    return _chainPattern
+
+def matcherPatterns():
+    return [
+        # Every ordered pair of different pointers of a node
+        [   SHAPE('first',  (0, 0x18), n_pointer()),
+            SHAPE('second', (0, 0x18), n_pointer(), fromStart=True),
+            ASSERT(lambda patFinder, context: context.first != context.second) ],
+        chainPattern(3),
+        [   SHAPE('words',  0,      n_array(3, n_uint32)),
+            SHAPE('magic',  (0, 8), n_string(fixedValue=NODE_MAGIC, isPrintable=False)),
+            SHAPE('object', 0,      n_struct([
+                SHAPE('name',   0,      n_pointer()),
+                SHAPE('vtable', (0, 8), n_pointer(valueRange=(TABLES_BASE, HEAP_BASE))) ])) ],
+        [   SHAPE('any',    (0, 0x1c, 4),   n_uint32(), lambda context, value: 0 == value % 3),
+            SHAPE('name',   (0, 0x10),      n_pointer(valueRange=(STRINGS_BASE, ROOTS_BASE))) ] ]
+
+def allMatches(patFinder, image):
+    """ Every match of the patterns from every node of the first list """
+    matches = []
+    for patternIndex, pattern in enumerate(matcherPatterns()):
+        node = image.listsHeads[0]
+        while 0 != node:
+            for context in patFinder.search(pattern, node):
+                matches.append((patternIndex, node, contextSnapshot(context)))
+            node = image.readAddr(node)
+    return (len(matches), digest(matches))
+
+def generatorEngineMatches(image, files):
+    return allMatches(GeneratorPatternFinder(image), image)
+
+@benchmark('PatternFinder.backtracking', generatorEngineMatches)
+def benchPatternFinderBacktracking(image, files):
+    # Patterns that match in many ways, must give the matches of the old engine in the same order
+    return allMatches(CreatePatternsFinder(image), image)
+
+def listsCount(image, files):
+    return len(image.listsHeads)
+
+@benchmark('StructView.refreshViews', listsCount)
+def benchStructViews(image, files):
+    patFinder = CreatePatternsFinder(image)
+    pattern = nodePattern()
+    views = [compileView(image, patFinder.searchOne(pattern, head)) for head in image.listsHeads]
+    for i in range(1000):
+        refreshViews(views)
+    return len(views)
+
+@benchmark('Patterns.walkList', allListsNodes)
+def benchWalkList(image, files):
+    count = 0
+    for head in image.listsHeads:
+        for node in walkList(image, head, 0, NODE_SIZE):
+            count += 1
+    return count
+
+@benchmark('ScanJob.scanPattern', lambda image, files: image.heapSize // NODE_SIZE)
+def benchScanJob(image, files):
+    # The magic is exactly at 0xc, so every node is found once
+    patFinder = CreatePatternsFinder(image)
+    pattern = [SHAPE('magic', (0xc, None), n_string(fixedValue=NODE_MAGIC, isPrintable=False))]
+    job = ScanJob(image, regions=[(HEAP_BASE, image.heapSize)], progressInterval=None)
+    return len(list(job.scanPattern(patFinder, pattern, alignment=8)))
+
+def nodesOffsetsLists(image, depth=16):
+    # Every list is followed to a growing depth, and then to every field of the node
+    offsetsLists = []
+    for listIndex in range(len(image.listsHeads)):
+        for nodeDepth in range(depth):
+            for field in (0x10, 0x18):
+                offsetsLists.append([listIndex * 8] + [0] * nodeDepth + [field])
+    return offsetsLists
+
+def offsetsListsTargets(image, files):
+    # The name or vtable pointer of the node at that depth of the list
+    nodes = heapNodes(image)
+    targets = []
+    for offsets in nodesOffsetsLists(image):
+        node = image.listsHeads[offsets[0] // 8]
+        for i in range(len(offsets) - 2):
+            node = nodes[node][0]
+        targets.append(nodes[node][{0x10 : 3, 0x18 : 4}[offsets[-1]]])
+    return (len(targets), digest(targets))
+
+@benchmark('MemReaderBase.resolveOffsetsList', offsetsListsTargets)
+def benchResolveOffsetsList(image, files):
+    results = [image.resolveOffsetsList(ROOTS_BASE, offsets, isLookingForCycles=False) for offsets in nodesOffsetsLists(image)]
+    return (len(results), digest([result[-1] for result in results]))
+
+@benchmark('MemReaderBase.resolveOffsetsLists', offsetsListsTargets)
+def benchResolveOffsetsLists(image, files):
+    results = image.resolveOffsetsLists(ROOTS_BASE, nodesOffsetsLists(image))[0]
+    return (len(results), digest([result[-1] for result in results]))
+
+def recursiveFindTarget(image):
+    # The vtable of the head of the first list, so there is at least one to find
+    return heapNodes(image)[image.listsHeads[0]][4]
+
+def vtableFields(image, files):
+    # The vtable fields of the first two nodes of every list, that are the two hops from the roots
+    nodes = heapNodes(image)
+    target = recursiveFindTarget(image)
+    return sorted([node + 0x18 for head in image.listsHeads for node in listNodes(nodes, head)[:2] if target == nodes[node][4]])
+
+@benchmark('RecursiveFind.vtable', vtableFields)
+def benchRecursiveFind(image, files):
+    results = image.recursiveFind(recursiveFindTarget(image), ROOTS_BASE, [len(image.listsHeads) * 8, NODE_SIZE, NODE_SIZE], hops=2, targetLength=8, alignment=8)
+    return sorted([result[0] for result in results])
+
+def writableThrees(image, files):
+    # Aligned dwords of 3 in the writable regions, that are the heap and the roots
+    count = 0
+    for name in ('heap', 'roots'):
+        data = image.getRegionData(name)[1]
+        count += struct.unpack('<%dL' % (len(data) // 4), data).count(3)
+    return count
+
+@benchmark('DifferentialSearch.searchUInt32', writableThrees)
+def benchDifferentialSearch(image, files):
+    searcher = newDifferentialSearch(image)
+    searcher.searchUInt32(3)
+    return len(searcher)
+
+@benchmark('DifferentialSearch.removeChangedMemory', 0)
+def benchDifferentialSearchChanged(image, files):
+    searcher = newDifferentialSearch(image)
+    searcher.removeChangedMemory()
+    searcher.removeUnchangedMemory()
+    return len(searcher)
+
+@benchmark('HashChangeTracker.getDirtyRanges', 0)
+def benchHashChangeTracker(image, files):
+    tracker = HashChangeTracker(image)
+    tracker.reset()
+    return len(tracker.getDirtyRanges())
+
+def serialDump(image, files):
+    # The dump the other benchmarks read, DumpBase.roundTrip checks it has all the memory
+    return fileDigest(files['ndmd'])
+
+@benchmark('DumpBase.dumpToFile', serialDump)
+def benchDumpToFile(image, files):
+    outFileName = os.path.join(files['dir'], 'dumpToFile.ndmd')
+    image.dumpToFile(outFileName)
+    return fileDigest(outFileName)
+
+@benchmark('DumpBase.dumpToFile.workers', serialDump)
+def benchDumpToFileWorkers(image, files):
+    outFileName = os.path.join(files['dir'], 'dumpToFileWorkers.ndmd')
+    image.dumpToFile(outFileName, workers=4)
+    return fileDigest(outFileName)
+
+def serialCompressedDump(image, files):
+    outFileName = os.path.join(files['dir'], 'serialCompressed.ndmd')
+    image.dumpToFile(outFileName, compressionLevel=1)
+    return fileDigest(outFileName)
+
+@benchmark('DumpBase.dumpToFile.compressed', serialCompressedDump)
+def benchDumpToFileCompressed(image, files):
+    outFileName = os.path.join(files['dir'], 'dumpToFileCompressed.ndmd')
+    image.dumpToFile(outFileName, compressionLevel=1, compressionWorkers=4)
+    return fileDigest(outFileName)
+
+def sparseImage(image):
+    reader = SyntheticImage(heapSize=0x4000, seed=image.seed)
+    reader.addSparseRegion()
+    return reader
+
+def memorySnapshot(reader):
+    """ The regions, their data and the runs of pages that were touched """
+    regions = reader.getMemoryRegions()
+    return digest([(region, reader.readMemory(region[0], region[1]), reader.getResidentRuns([region[:2]])) for region in regions])
+
+# Ways of dumping that must all be read back the same, the untouched pages are HOLS atoms,
+# and the compressed chunks are ZDAT atoms
+DUMP_OPTIONS = [{}, {'workers' : 4}, {'compressionLevel' : 1}, {'compressionLevel' : 1, 'compressionWorkers' : 4, 'chunkSize' : 0x3000}]
+
+def sparseMemory(image, files):
+    return [memorySnapshot(sparseImage(image))] * len(DUMP_OPTIONS)
+
+@benchmark('DumpBase.roundTrip', sparseMemory)
+def benchDumpRoundTrip(image, files):
+    # The dump of the benchmarks must have all the memory of the image, as must dumps with holes
+    if memorySnapshot(loadDump(files['ndmd'])) != memorySnapshot(image):
+        raise Exception("The dump of the image does not have its memory")
+    reader = sparseImage(image)
+    outFileName = os.path.join(files['dir'], 'roundTrip.ndmd')
+    snapshots = []
+    for options in DUMP_OPTIONS:
+        reader.dumpToFile(outFileName, **options)
+        snapshots.append(memorySnapshot(loadDump(outFileName)))
+    return snapshots
+
+# Ranges and holes of a few pages, small enough to be compared page by page
+SUBTRACT_CASES = 2000
+SUBTRACT_PAGES = 0x40
+
+def subtractCases(seed):
+    """ Sorted ranges that do not overlap, and holes that can overlap, be empty or not be sorted """
+    rand = random.Random(seed)
+    cases = []
+    for i in range(SUBTRACT_CASES):
+        ranges = []
+        address = rand.randint(0, 4)
+        while address < SUBTRACT_PAGES:
+            size = rand.randint(0, 8)
+            ranges.append((address, size))
+            address += size + rand.choice([0, 0, 1, 5])
+        holes = []
+        for j in range(rand.randint(0, 6)):
+            holes.append((rand.randint(0, SUBTRACT_PAGES), rand.randint(0, 12)))
+        cases.append((ranges, holes))
+    return cases
+
+def pagesLeft(image, files):
+    # Every page of the ranges that is in none of the holes
+    results = []
+    for ranges, holes in subtractCases(image.seed):
+        pages = set([page for address, size in ranges for page in range(address, address + size)])
+        pages -= set([page for address, size in holes for page in range(address, address + size)])
+        results.append(sorted(pages))
+    return (len(results), digest(results))
+
+@benchmark('Utilities.subtractRanges', pagesLeft)
+def benchSubtractRanges(image, files):
+    results = []
+    for ranges, holes in subtractCases(image.seed):
+        # Pages of pieces that overlap are counted twice, so the lists would differ
+        results.append(sorted([page for address, size in subtractRanges(ranges, holes) for page in range(address, address + size)]))
+    return (len(results), digest(results))
+
+def timeBenchmark(func, image, files, repeat):
+    times = []
+    result = None
+    for i in range(repeat):
+        startTime = _timer()
+        result = func(image, files)
+        times.append(_timer() - startTime)
+    return min(times), times, result
+
+def runAll(sizes, repeat, namesFilter=None, isVerbose=True):
+    results = {}
+    for heapSize in sizes:
+        image = SyntheticImage(heapSize=heapSize)
+        tempDir = tempfile.mkdtemp(prefix='NativBench')
+        try:
+            files = {
+                    'dir'   : tempDir,
+                    'raw'   : os.path.join(tempDir, 'heap.bin'),
+                    'ndmd'  : os.path.join(tempDir, 'image.ndmd'),
+                    'mdmp'  : os.path.join(tempDir, 'image.dmp') }
+            image.writeRawFile(files['raw'])
+            image.writeNativDump(files['ndmd'])
+            image.writeMiniDump(files['mdmp'])
+            for name, func, expected in BENCHMARKS:
+                if None != namesFilter and not any(x in name for x in namesFilter):
+                    continue
+                key = '%s@0x%x' % (name, heapSize)
+                try:
+                    best, times, result = timeBenchmark(func, image, files, repeat)
+                    if hasattr(expected, '__call__'):
+                        expected = expected(image, files)
+                    if result != expected:
+                        raise Exception("Result %r instead of %r" % (result, expected))
+                except Exception as e:
+                    results[key] = {'error' : '%s: %s' % (type(e).__name__, e)}
+                    if isVerbose:
+                        print('%-48s FAILED %s' % (key, results[key]['error']))
+                    continue
+                results[key] = {'best' : best, 'times' : times, 'result' : repr(result)}
+                if isVerbose:
+                    print('%-48s %10.4fs  (%s)' % (key, best, repr(result)))
+        finally:
+            shutil.rmtree(tempDir, ignore_errors=True)
+    return results
+
+def getFailures(results):
+    return sorted([key for key, result in results.items() if 'error' in result])
+
+def compareWithBaseline(results, baseline, threshold):
+    """ Returns the list of benchmarks that got slower than baseline * threshold """
+    regressions = []
+    for key, current in sorted(results.items()):
+        old = baseline.get(key)
+        if None == old or 'best' not in old or 'best' not in current:
+            continue
+        ratio = current['best'] / max(old['best'], 1e-9)
+        marker = ''
+        if ratio > threshold:
+            regressions.append((key, old['best'], current['best'], ratio))
+            marker = '  <-- REGRESSION'
+        print('%-48s %10.4fs -> %10.4fs  x%.2f%s' % (key, old['best'], current['best'], ratio, marker))
+    return regressions
+
+def parseSizes(sizes):
+    return [int(x, 0) for x in sizes.split(',') if x]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="NativDebugging synthetic memory benchmarks")
+    parser.add_argument('--sizes', default='0x40000,0x100000', help="Comma separated heap sizes")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per benchmark, the best one is reported")
+    parser.add_argument('--filter', default=None, help="Comma separated substrings of benchmarks to run")
+    parser.add_argument('--output', default=None, help="Write the results as json to this file")
+    parser.add_argument('--baseline', default=None, help="Compare with results previously saved")
+    parser.add_argument('--save-baseline', dest='saveBaseline', default=None, help="Save the results as a new baseline")
+    parser.add_argument('--threshold', type=float, default=1.25, help="Slowdown ratio considered a regression")
+    args = parser.parse_args(argv)
+
+    namesFilter = None
+    if args.filter:
+        namesFilter = args.filter.split(',')
+    print("Python %s on %s" % (platform.python_version(), platform.platform()))
+    results = runAll(parseSizes(args.sizes), args.repeat, namesFilter)
+    report = {
+            'python'    : platform.python_version(),
+            'platform'  : platform.platform(),
+            'results'   : results }
+    for outFileName in (args.output, args.saveBaseline):
+        if outFileName:
+            with open(outFileName, 'w') as outFile:
+                json.dump(report, outFile, indent=4, sort_keys=True)
+    status = 0
+    failures = getFailures(results)
+    if failures:
+        print("%d benchmarks failed: %s" % (len(failures), ', '.join(failures)))
+        status = 1
+    if args.baseline:
+        with open(args.baseline, 'r') as baselineFile:
+            baseline = json.load(baselineFile)['results']
+        regressions = compareWithBaseline(results, baseline, args.threshold)
+        if regressions:
+            print("%d benchmarks regressed" % len(regressions))
+            status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#
+#   ChangeTracker.py
+#
+#   ChangeTracker - Finds the pages of memory that changed since a snapshot, by keeping
+#   a hash of every page, for readers the kernel does not track writes for
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+# Usage:
+#   tracker = HashChangeTracker(reader)
+#   tracker.reset()
+#   ...
+#   for address, size in tracker.getDirtyRanges():
+#       print('0x%x 0x%x' % (address, size))
+
+import hashlib
+
+from .Interfaces import ReadError
+from .MemReaderBase import MemReaderBase, SCAN_CHUNK_SIZE, SCAN_PAGE_SIZE
+
+if 'WindowsError' not in globals():
+    class WindowsError(Exception):
+        pass
+
+class HashChangeTracker( object ):
+    """
+    Keeps a hash of every page of the tracked ranges, and finds the pages that changed by
+    reading and hashing them again. Has the same interface as the SoftDirtyTracker of Linux,
+    but reads all the tracked memory on every reset and getDirtyRanges.
+    Pages that could not be read on reset are reported as dirty once they can be read.
+    """
+    IS_KERNEL_TRACKED = False
+
+    def __init__(self, reader, pageSize=SCAN_PAGE_SIZE, attributesMask=MemReaderBase.READ_ATTRIBUTES_MASK):
+        self._reader = reader
+        self._pageSize = pageSize
+        self._attributesMask = attributesMask
+        self._hashes = {}
+        self._ranges = []
+
+    def getPageSize(self):
+        return self._pageSize
+
+    def _hashPages(self, ranges):
+        """ Yields (pageAddress, hash) of every readable page of the ranges """
+        pageSize = self._pageSize
+        chunkSize = max(pageSize, SCAN_CHUNK_SIZE - (SCAN_CHUNK_SIZE % pageSize))
+        sha1 = hashlib.sha1
+        readMemory = self._reader.readMemory
+        for address, size in ranges:
+            end = address + size
+            chunkStart = address
+            while chunkStart < end:
+                # Chunks end on pages boundaries, so a page is never split between two chunks
+                chunkEnd = min(chunkStart - (chunkStart % pageSize) + chunkSize, end)
+                try:
+                    data = readMemory(chunkStart, chunkEnd - chunkStart)
+                except (ReadError, WindowsError):
+                    data = None
+                pageStart = chunkStart - (chunkStart % pageSize)
+                while pageStart < chunkEnd:
+                    start = max(pageStart, chunkStart)
+                    pageEnd = min(pageStart + pageSize, chunkEnd)
+                    if None != data:
+                        yield pageStart, sha1(data[start - chunkStart:pageEnd - chunkStart]).digest()
+                    else:
+                        # Hash it page by page, to skip only the pages that are not readable
+                        try:
+                            yield pageStart, sha1(readMemory(start, pageEnd - start)).digest()
+                        except (ReadError, WindowsError):
+                            pass
+                    pageStart += pageSize
+                chunkStart = chunkEnd
+
+    def reset(self, ranges=None):
+        """ Hashes the pages of the ranges, or of all the memory with the attributes of the tracker """
+        if None == ranges:
+            ranges = self._reader.getMemoryRuns(self._attributesMask)
+        self._ranges = list(ranges)
+        self._hashes = dict(self._hashPages(self._ranges))
+
+    def getDirtyRanges(self, ranges=None):
+        """
+        List of (address, size) of the pages that changed since the last reset, in the
+        (address, size) ranges and clipped to them, or in the ranges of the last reset
+        """
+        if None == ranges:
+            ranges = self._ranges
+        dirty = []
+        pageSize = self._pageSize
+        hashes = self._hashes
+        for address, size in ranges:
+            end = address + size
+            for pageStart, pageHash in self._hashPages([(address, size)]):
+                if hashes.get(pageStart) == pageHash:
+                    continue
+                start = max(pageStart, address)
+                pageEnd = min(pageStart + pageSize, end)
+                if dirty and dirty[-1][0] + dirty[-1][1] == start:
+                    dirty[-1] = (dirty[-1][0], pageEnd - dirty[-1][0])
+                else:
+                    dirty.append((start, pageEnd - start))
+        return dirty
+
+    def close(self):
+        self._hashes = {}
+
+__all__ = [
+        "HashChangeTracker" ]
@@ -19,7 +19,74 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
 from .Interfaces import ReadError
+from .Utilities import subtractRanges
 from struct import pack
+from collections import deque
+import time
+import zlib
+
+# Size of the reads of a dump, big enough for the latency of every read not to matter
+DUMP_CHUNK_SIZE = 0x400000
+# Parts of a chunk that can not be read are zeros in the dump, at this granularity
+DUMP_PAGE_SIZE  = 0x400
+# Number of chunks every stage of the dump can get ahead of the writing
+DUMP_QUEUE_SIZE = 4
+
+DUMP_ITEM_REGION    = 0
+DUMP_ITEM_DATA      = 1
+DUMP_ITEM_HOLE      = 2
+
+def _toBytes(data):
+    if isinstance(data, bytes):
+        return data
+    return data.encode('utf8')
+
+def _orderedMap(function, items, workers, queueSize):
+    """
+    Yields function(item) of every item in order. With workers, the items are processed by
+    that many threads, and up to queueSize items are processed ahead of the one yielded,
+    so no more than that are kept in memory.
+    """
+    if None == workers or 0 >= workers:
+        for item in items:
+            yield function(item)
+        return
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(workers)
+    pending = deque()
+    try:
+        for item in items:
+            if len(pending) >= queueSize:
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(function, (item,)))
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+
+class DumpStatistics( object ):
+    """ Amount of memory a dump read and wrote, and how long it took """
+    def __init__(self):
+        self.regions = 0
+        self.bytesRead = 0
+        self.bytesWritten = 0
+        self.holesSize = 0
+        self.startTime = time.time()
+        self.elapsed = 0
+
+    def stop(self):
+        self.elapsed = time.time() - self.startTime
+
+    @property
+    def throughput(self):
+        """ Bytes of memory dumped in a second, the holes are not counted as they are not read """
+        if 0 >= self.elapsed:
+            return 0
+        return self.bytesRead / self.elapsed
+
+    def __repr__(self):
+        return "Dumped 0x%x bytes of %d regions to 0x%x bytes, skipped 0x%x bytes of holes, in %.2f seconds (%.1f MB/s)" % (
+                self.bytesRead, self.regions, self.bytesWritten, self.holesSize, self.elapsed, self.throughput / 0x100000)
 
 class DumpBase( object ):
     """ Basic functions to save entire memory snapshot to file """
@@ -31,14 +98,84 @@ class DumpBase( object ):
             dict[baseAddress] = (name, regionSize, regionAttributes) """
         raise NotImplementedError("Pure function call")
 
-    def dumpToFile( self, dumpFile, dumpType=None, comments=None, isVerbose=False ):
-        PAGE_SIZE = 0x400
+    def dumpToFile( self, dumpFile, dumpType=None, comments=None, isVerbose=False, workers=None, compressionLevel=None, compressionWorkers=None, chunkSize=DUMP_CHUNK_SIZE, queueSize=DUMP_QUEUE_SIZE ):
+        """
+        Writes all the memory regions to dumpFile, that is a file name or a file object.
+        The memory is read in chunks of chunkSize, that go through a pipeline of reading,
+        compressing and writing in order, with up to queueSize chunks waiting in every stage.
+        workers             - Number of threads that read chunks at the same time, ignored for readers
+                              that are not thread safe. By default the chunks are read by the
+                              thread that writes them.
+        compressionLevel    - zlib level to compress the chunks with, only for DUMP_TYPE_NATIV_DEBUGGING
+        compressionWorkers  - Number of threads that compress chunks at the same time
+        Returns DumpStatistics of the dump.
+        """
         if None == dumpType:
             dumpType = self.DUMP_TYPE_NATIV_DEBUGGING
-        if not isinstance(dumpFile, file):
+        if None != compressionLevel and self.DUMP_TYPE_NATIV_DEBUGGING != dumpType:
+            raise Exception("Only NativDebugging dumps can be compressed")
+        isCompressed = None != compressionLevel
+        if not self.isThreadSafe():
+            # The reader only works from this thread, compressing on other threads is still fine
+            workers = None
+        statistics = DumpStatistics()
+        isFileOpenedHere = False
+        if not hasattr(dumpFile, 'write'):
             dumpFile = open(dumpFile, 'wb')
+            isFileOpenedHere = True
         if self.DUMP_TYPE_NATIV_DEBUGGING == dumpType:
             self._writeDumpHeader(dumpFile)
+        def readItem(item):
+            kind, address, size, info = item
+            if DUMP_ITEM_DATA != kind:
+                return item
+            return (kind, address, size, self._readDumpChunk(address, size, isVerbose))
+        def compressItem(item):
+            kind, address, size, data = item
+            if DUMP_ITEM_DATA != kind:
+                return item
+            return (kind, address, size, zlib.compress(data, compressionLevel))
+        items = _orderedMap(readItem, self._dumpItems(chunkSize), workers, queueSize)
+        if isCompressed:
+            items = _orderedMap(compressItem, items, compressionWorkers, queueSize)
+        holes = []
+        for kind, address, size, info in items:
+            if DUMP_ITEM_REGION == kind:
+                self._writeRegionHoles(dumpFile, dumpType, holes)
+                regionName, regionAttrib, holes = info
+                statistics.regions += 1
+                if self.DUMP_TYPE_NATIV_DEBUGGING == dumpType:
+                    self._writeAtom(dumpFile, b'REGN', [
+                            pack('>Q', address),
+                            pack('>Q', size),
+                            pack('>L', regionAttrib),
+                            self._makeAtom(b'NAME', regionName) ] )
+                    if not isCompressed:
+                        dumpFile.write(b'DATA' + pack('>Q', size))
+            elif DUMP_ITEM_DATA == kind:
+                if isCompressed:
+                    # The chunks of a compressed region are atoms of their own, holes have none
+                    self._writeAtom(dumpFile, b'ZDAT', [pack('>QQ', address, size), info])
+                else:
+                    dumpFile.write(info)
+                statistics.bytesRead += size
+                statistics.bytesWritten += len(info)
+            else:
+                if not isCompressed:
+                    self._writeHole(dumpFile, size)
+                statistics.holesSize += size
+        self._writeRegionHoles(dumpFile, dumpType, holes)
+        if None != comments and self.DUMP_TYPE_NATIV_DEBUGGING == dumpType:
+            self._writeAtom(dumpFile, b'CMNT', comments)
+        if isFileOpenedHere:
+            dumpFile.close()
+        statistics.stop()
+        if isVerbose:
+            print(repr(statistics))
+        return statistics
+
+    def _dumpItems(self, chunkSize):
+        """ Yields (kind, address, size, info) of every region, chunk of data and hole, in the order of the dump """
         memMap = self.getMemoryMap()
         addresses = list(memMap.keys())
         addresses.sort()
@@ -47,46 +184,74 @@ class DumpBase( object ):
             regionName = regionInfo[0]
             regionSize = regionInfo[1]
             regionAttrib = regionInfo[2]
-            bytesLeft = regionSize
-            if self.DUMP_TYPE_NATIV_DEBUGGING == dumpType:
-                self._writeAtom(dumpFile, 'REGN', [
-                        pack('>Q', addr),
-                        pack('>Q', regionSize),
-                        pack('>L', regionAttrib),
-                        self._makeAtom('NAME', regionName) ] )
-                dumpFile.write('DATA' + pack('>Q',regionSize))
-            while 0 < bytesLeft:
-                if bytesLeft > PAGE_SIZE:
-                    currentReadSize = PAGE_SIZE
-                else:
-                    currentReadSize = bytesLeft
-                try:
-                    page = self.readMemory(addr, currentReadSize)
-                except ReadError:
-                    if isVerbose:
-                        print("Failed to read data from address %x to %x" % (addr, addr + currentReadSize))
-                    page = b'\x00' * currentReadSize
-                bytesLeft -= currentReadSize
-                addr += currentReadSize
-                dumpFile.write(page)
-        if None != comments and self.DUMP_TYPE_NATIV_DEBUGGING == dumpType:
-            self._writeAtom(dumpFile, b'CMNT', comments)
+            # Pages that were never touched are not read, they are zeros in the dump
+            holes = subtractRanges([(addr, regionSize)], self.getResidentRuns([(addr, regionSize)]))
+            yield (DUMP_ITEM_REGION, addr, regionSize, (regionName, regionAttrib, holes))
+            regionEnd = addr + regionSize
+            for holeAddress, holeSize in holes + [(regionEnd, 0)]:
+                while addr < holeAddress:
+                    currentReadSize = min(chunkSize, holeAddress - addr)
+                    yield (DUMP_ITEM_DATA, addr, currentReadSize, None)
+                    addr += currentReadSize
+                if 0 < holeSize:
+                    yield (DUMP_ITEM_HOLE, holeAddress, holeSize, None)
+                addr += holeSize
+
+    def _readDumpChunk(self, addr, size, isVerbose):
+        """ Reads a chunk, and when it fails, page by page with zeros for the pages that can not be read """
+        try:
+            return self.readMemory(addr, size)
+        except ReadError:
+            pass
+        pages = []
+        end = addr + size
+        while addr < end:
+            currentReadSize = min(DUMP_PAGE_SIZE, end - addr)
+            try:
+                page = self.readMemory(addr, currentReadSize)
+            except ReadError:
+                if isVerbose:
+                    print("Failed to read data from address %x to %x" % (addr, addr + currentReadSize))
+                page = b'\x00' * currentReadSize
+            pages.append(page)
+            addr += currentReadSize
+        return b''.join(pages)
+
+    def _writeRegionHoles(self, dumpFile, dumpType, holes):
+        if holes and self.DUMP_TYPE_NATIV_DEBUGGING == dumpType:
+            self._writeAtom(dumpFile, b'HOLS', [pack('>QQ', holeAddress, holeSize) for holeAddress, holeSize in holes])
+
+    def _writeHole(self, dumpFile, size):
+        """ Writes size bytes of zeros, by seeking over them when the file can, so it stays sparse """
+        if 0 >= size:
+            return
+        if hasattr(dumpFile, 'seekable') and dumpFile.seekable():
+            # Writing the last byte makes the file as long, even when the hole is at its end
+            dumpFile.seek(size - 1, 1)
+            dumpFile.write(b'\x00')
+            return
+        zeros = b'\x00' * min(size, 0x100000)
+        while 0 < size:
+            dumpFile.write(zeros[:size])
+            size -= len(zeros)
 
     def _writeDumpHeader(self, dumpFile):
         self._writeAtom(dumpFile, b'NDMD', b'')
         self._writeAtom(dumpFile, b'INFO', [
                 pack('>L', self.getPointerSize()),
                 pack('>L', self.getDefaultDataSize()),
-                self.getEndianity() ] )
+                _toBytes(self.getEndianity()) ] )
 
     def _writeAtom(self, dumpFile, name, data):
         if len(name) != 4:
             raise Exception("Invalid tag name %s" % name)
         totalLength = 0
         if isinstance(data, list):
+            data = [_toBytes(x) for x in data]
             for x in data:
                 totalLength += len(x)
         else:
+            data = _toBytes(data)
             totalLength = len(data)
         dumpFile.write(name)
         dumpFile.write(pack('>Q', totalLength))
@@ -99,12 +264,12 @@ class DumpBase( object ):
     def _makeAtom(self, name, data):
         if len(name) != 4:
             raise Exception("Invalid tag name %s" % name)
-        allData = ''
+        allData = b''
         if isinstance(data, list):
             for x in data:
-                allData += x
+                allData += _toBytes(x)
         else:
-            allData = data
+            allData = _toBytes(data)
         result = name + \
                 pack('>Q', len(allData)) + \
                 allData
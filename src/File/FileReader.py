@@ -21,26 +21,36 @@
 #
 
 from builtins import bytes
-from future.utils import bind_method
 import io
+import os
+import mmap
+import threading
 from ..Interfaces import MemReaderInterface, MemWriterInterface, ReadError
-from ..Utilities import integer_types
+from ..Utilities import integer_types, bind_method, optionalImport
 from ..MemReaderBase import *
 from ..GUIDisplayBase import *
 
-try:
-    import distorm3
-    IS_DISASSEMBLER_FOUND = True
-except ImportError as e:
-    IS_DISASSEMBLER_FOUND = False
 from struct import pack, unpack
 
-def loadFile(targetFileName, file_start_offset=0, loading_address=0, pointer_size=4, endianity='='):
-    return FileReader(targetFileName, file_start_offset, loading_address, pointer_size, endianity)
+# Chunk read at a time while looking for the end of a string
+STRING_CHUNK_SIZE = 0x100
+
+def loadFile(targetFileName, file_start_offset=0, loading_address=0, pointer_size=4, endianity='=', isMapped=True):
+    return FileReader(targetFileName, file_start_offset, loading_address, pointer_size, endianity, isMapped)
 
 class FileReader( MemReaderBase, MemWriterInterface, GUIDisplayBase ):
-    def __init__( self, targetFileName, file_start_offset=0, loading_address=0, pointer_size=4, endianity='='):
-        self._file = io.open(targetFileName, 'rb+')
+    """
+    Reads and writes a file as memory that is loaded at loading_address.
+    The file is mapped to memory when possible and read with os.pread otherwise, so a single
+    reader can be shared between threads. Files that can not be opened for writing are read only.
+    """
+    def __init__( self, targetFileName, file_start_offset=0, loading_address=0, pointer_size=4, endianity='=', isMapped=True):
+        try:
+            self._file = io.open(targetFileName, 'rb+')
+            self._isWritable = True
+        except (IOError, OSError):
+            self._file = io.open(targetFileName, 'rb')
+            self._isWritable = False
         MemReaderBase.__init__(self)
         self._POINTER_SIZE = pointer_size
         self._DEFAULT_DATA_SIZE = 4
@@ -48,69 +58,143 @@ class FileReader( MemReaderBase, MemWriterInterface, GUIDisplayBase ):
         self._START = file_start_offset
         self._LOADING_ADDR = loading_address
         self._ADDR_DELTA = file_start_offset - loading_address
+        self._fileName = targetFileName
         # Find end of file
         self._file.seek(0, 2)
         self._file_size = self._file.tell()
+        self._lock = threading.Lock()
+        self._map = None
+        if isMapped and 0 < self._file_size:
+            if self._isWritable:
+                access = mmap.ACCESS_WRITE
+            else:
+                access = mmap.ACCESS_READ
+            try:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=access)
+            except (mmap.error, OSError, ValueError):
+                self._map = None
+        if None == self._map:
+            self._data = None
+            if hasattr(os, 'pread'):
+                self._readAt = self._preadAt
+                self._writeAt = self._pwriteAt
+            else:
+                self._readAt = self._seekReadAt
+                self._writeAt = self._seekWriteAt
+        else:
+            self._data = self._map
+            self._readAt = self._mapReadAt
+            self._writeAt = self._mapWriteAt
 
         for readerName, (dataSize, packer) in MemReaderInterface.READER_DESC.items():
             def readerCreator(dataSize, packer):
                 def readerMethod(self, address):
-                    self._file.seek(address + self._ADDR_DELTA)
-                    return struct.unpack(self._ENDIANITY + packer, bytes(self._file.read(dataSize)))[0]
+                    offset = address + self._ADDR_DELTA
+                    if None != self._data and 0 <= offset and offset + dataSize <= self._file_size:
+                        return struct.unpack_from(self._ENDIANITY + packer, self._data, offset)[0]
+                    return struct.unpack(self._ENDIANITY + packer, self._readAt(offset, dataSize))[0]
                 return readerMethod
             def writerCreator(dataSize, packer):
                 def writerMethod(self, address, value):
-                    self._file.seek(address + self._ADDR_DELTA)
                     if isinstance(value, integer_types):
-                        data = pack(self._ENDIANITY + packer, value)
-                    self._file.write(value)
+                        value = pack(self._ENDIANITY + packer, value)
+                    self._writeAt(address + self._ADDR_DELTA, value)
                 return writerMethod
             bind_method(FileReader, 'read'  + readerName, readerCreator(dataSize, packer))
             bind_method(FileReader, 'write' + readerName, writerCreator(dataSize, packer))
 
     def __del__( self ):
-        self._file.close()
+        self.close()
+
+    def close( self ):
+        if None != getattr(self, '_map', None):
+            self._data = None
+            self._map.close()
+            self._map = None
+        if None != getattr(self, '_file', None) and not self._file.closed:
+            self._file.close()
+
+    def isMapped( self ):
+        return None != self._map
+
+    def _checkRange( self, offset, length ):
+        if offset < 0 or offset + length > self._file_size:
+            raise ReadError(offset - self._ADDR_DELTA)
+
+    def _mapReadAt( self, offset, length ):
+        self._checkRange(offset, length)
+        return self._map[offset:offset + length]
+
+    def _preadAt( self, offset, length ):
+        self._checkRange(offset, length)
+        return os.pread(self._file.fileno(), length, offset)
+
+    def _seekReadAt( self, offset, length ):
+        self._checkRange(offset, length)
+        with self._lock:
+            self._file.seek(offset)
+            return bytes(self._file.read(length))
+
+    def _checkWrite( self, offset, data ):
+        if not self._isWritable:
+            raise Exception("File %s is open for reading only" % self._fileName)
+        self._checkRange(offset, len(data))
+
+    def _mapWriteAt( self, offset, data ):
+        self._checkWrite(offset, data)
+        self._map[offset:offset + len(data)] = data
+
+    def _pwriteAt( self, offset, data ):
+        self._checkWrite(offset, data)
+        os.pwrite(self._file.fileno(), data, offset)
+
+    def _seekWriteAt( self, offset, data ):
+        self._checkWrite(offset, data)
+        with self._lock:
+            self._file.seek(offset)
+            self._file.write(data)
+            self._file.flush()
 
     def readAddr( self, addr ):
-        self._file.seek(addr + self._ADDR_DELTA)
         if 4 == self._POINTER_SIZE:
-            return unpack(self._ENDIANITY + 'L', bytes(self._file.read(4)))[0]
+            return self.readUInt32(addr)
         elif 8 == self._POINTER_SIZE:
-            return unpack(self._ENDIANITY + 'Q', bytes(self._file.read(8)))[0]
+            return self.readUInt64(addr)
         else:
             raise Exception("Unknown pointer size")
 
     def readMemory( self, addr, length ):
-        self._file.seek(addr + self._ADDR_DELTA)
-        return bytes(self._file.read(length))
+        return self._readAt(addr + self._ADDR_DELTA, length)
 
     def readString( self, addr, maxSize=None, isUnicode=False ):
         result = ''
+        offset = addr + self._ADDR_DELTA
+        if offset < 0:
+            raise ReadError(addr)
+        if isUnicode:
+            charSize = 2
+            charFormat = 'H'
+        else:
+            charSize = 1
+            charFormat = 'B'
         bytesCounter = 0
-        self._file.seek(addr + self._ADDR_DELTA)
-
         while True:
-            if False == isUnicode:
-                char = self._file.read(1)
-                if len(char) != 1:
-                    break
-                char = ord(char)
-                bytesCounter += 1
-            else:
-                char = self._file.read(2)
-                if len(char) != 2:
-                    break
-                char = unpack(self._ENDIANITY + 'H', char)
-                bytesCounter += 2
-            if 1 < char and char < 0x80:
-                result += chr(char)
-            else:
-                return result
-            if None != maxSize and bytesCounter > maxSize:
+            chunkSize = min(STRING_CHUNK_SIZE, self._file_size - offset)
+            chunkSize -= chunkSize % charSize
+            if 0 >= chunkSize:
                 return result
+            chunk = self._readAt(offset, chunkSize)
+            offset += chunkSize
+            for char in struct.unpack(self._ENDIANITY + '%d%s' % (chunkSize // charSize, charFormat), chunk):
+                bytesCounter += charSize
+                if 1 < char and char < 0x80:
+                    result += chr(char)
+                else:
+                    return result
+                if None != maxSize and bytesCounter > maxSize:
+                    return result
 
     def writeAddr( self, addr, data ):
-        self._file.seek(addr + self._ADDR_DELTA)
         if isinstance(data, integer_types):
             if 4 == self._POINTER_SIZE:
                 data = pack(self._ENDIANITY + 'L', data)
@@ -118,20 +202,23 @@ class FileReader( MemReaderBase, MemWriterInterface, GUIDisplayBase ):
                 data = pack(self._ENDIANITY + 'Q', data)
             else:
                 raise Exception("Unknown pointer size")
-        self._file.write(data)
+        self._writeAt(addr + self._ADDR_DELTA, data)
 
     def writeMemory( self, addr, data ):
-        self._file.self(addr + self._ADDR_DELTA)
-        self._file.write(data)
+        self._writeAt(addr + self._ADDR_DELTA, data)
 
     def isAddressValid( self, addr ):
         addr += self._ADDR_DELTA
-        if addr > 0 and addr < self._file_size:
+        if addr >= 0 and addr < self._file_size:
             return True
         return False
 
+    def getMemoryMap(self):
+        return {self._LOADING_ADDR: (self._fileName, self._file_size - self._START, 0x04)}
+
     def disasm(self, addr, length=0x100, decodeType=1):
-        if IS_DISASSEMBLER_FOUND:
+        distorm3 = optionalImport('distorm3')
+        if None != distorm3:
             for opcode in distorm3.Decode(
                     addr,
                     self.readMemory(addr, length),
@@ -0,0 +1,278 @@
+#
+#   ImageReader.py
+#
+#   ImageReader - Reads a PE or Mach-O file on disk as if it was loaded to memory,
+#   with every section mapped at its virtual address
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+# Usage:
+#   image = loadImage('C:\\Windows\\System32\\kernel32.dll')
+#   patFinder = CreatePatternsFinder(image)
+#   for result in patFinder.search(pattern, image.getImageBase()):
+#       ...
+
+import struct
+from bisect import bisect_right
+
+from ..Interfaces import ReadError
+from ..MemReaderBase import MemReaderBase, protectionToAttributes
+from .FileReader import FileReader
+
+IMAGE_FORMAT_PE     = 'PE'
+IMAGE_FORMAT_MACHO  = 'MachO'
+
+MACHO_MAGIC     = 0xfeedface
+MACHO_MAGIC64   = 0xfeedfacf
+FAT_MAGIC       = 0xcafebabe
+
+# Section characteristics of PE
+IMAGE_SCN_MEM_EXECUTE   = 0x20000000
+IMAGE_SCN_MEM_READ      = 0x40000000
+IMAGE_SCN_MEM_WRITE     = 0x80000000
+
+def loadImage(fileName, loadingAddress=None, isMapped=True):
+    return ImageReader(fileName, loadingAddress, isMapped)
+
+def _alignUp(value, alignment):
+    if 0 >= alignment:
+        return value
+    return (value + alignment - 1) & ~(alignment - 1)
+
+def _sectionName(name):
+    return name.split(b'\x00')[0].decode('ascii', 'replace')
+
+class ImageReader( MemReaderBase ):
+    """
+    Reads an executable file as if it was loaded, every PE section or Mach-O segment is
+    at its virtual address, and the part of it that is not in the file reads as zeros.
+    Data is read from the mapped file only when asked for. Relocations are not applied,
+    so when the image is loaded at another address, pointers in it still point to the
+    preferred image base.
+    """
+    def __init__(self, fileName, loadingAddress=None, isMapped=True):
+        """
+        fileName        - PE or Mach-O (not fat) file
+        loadingAddress  - Address to map the image at, default is its preferred image base
+        isMapped        - Map the file to memory, otherwise it is read with pread
+        """
+        MemReaderBase.__init__(self)
+        self._fileName = fileName
+        self._DEFAULT_DATA_SIZE = 4
+        self._ENDIANITY = '<'
+        self._file = FileReader(fileName, pointer_size=4, endianity='<', isMapped=isMapped)
+        self._fileSize = self._file._file_size
+        if 4 > self._fileSize:
+            raise Exception("File %s is too small to be an image" % fileName)
+        magicData = self._file.readMemory(0, 4)
+        magic = struct.unpack('<L', magicData)[0]
+        if b'MZ' == magicData[:2]:
+            self._loadPE()
+        elif magic in (MACHO_MAGIC, MACHO_MAGIC64):
+            self._loadMacho('<')
+        elif struct.unpack('>L', magicData)[0] in (MACHO_MAGIC, MACHO_MAGIC64):
+            self._loadMacho('>')
+        elif FAT_MAGIC == struct.unpack('>L', magicData)[0]:
+            raise Exception("File %s is a fat Mach-O, extract one architecture of it first" % fileName)
+        else:
+            raise Exception("File %s is not a PE or a Mach-O" % fileName)
+        self._preferredBase = self._imageBase
+        if None != loadingAddress and loadingAddress != self._imageBase:
+            delta = loadingAddress - self._imageBase
+            self._sections = [(address + delta, size, fileOffset, fileSize, name, attributes) \
+                    for address, size, fileOffset, fileSize, name, attributes in self._sections]
+            self._imageBase = loadingAddress
+        self._buildIndex()
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if None != getattr(self, '_file', None):
+            self._file.close()
+
+    def _loadPE(self):
+        from ..Patterns.Finder import CreatePatternsFinder
+        from ..Patterns.PE import ImageDosHeader, PE32P_MAGIC
+        header = next(CreatePatternsFinder(self._file).search(ImageDosHeader, 0), None)
+        if None == header:
+            raise Exception("File %s has an invalid PE header" % self._fileName)
+        self._header = header
+        self._format = IMAGE_FORMAT_PE
+        pe = header.PE
+        optionalHeader = pe.OptionalHeader
+        if PE32P_MAGIC == optionalHeader.Magic:
+            self._POINTER_SIZE = 8
+        else:
+            self._POINTER_SIZE = 4
+        self._imageBase = optionalHeader.BaseOfDataImageBase.ImageBase
+        sectionAlignment = optionalHeader.SectionAlignment
+        headersSize = min(optionalHeader.HeadersSize, self._fileSize)
+        self._sections = [(self._imageBase, _alignUp(headersSize, sectionAlignment), 0, headersSize, 'Headers', 0x02)]
+        for item in pe.Sections:
+            section = item.Item
+            virtualSize = section.VirtualSize
+            if 0 == virtualSize:
+                virtualSize = section.RawDataSize
+            fileOffset = section.PointerToRawData
+            fileSize = min(section.RawDataSize, virtualSize, max(self._fileSize - fileOffset, 0))
+            if 0 == fileOffset:
+                fileSize = 0
+            characteristics = section.Characteristics
+            attributes = protectionToAttributes(
+                    0 != (characteristics & IMAGE_SCN_MEM_READ),
+                    0 != (characteristics & IMAGE_SCN_MEM_WRITE),
+                    0 != (characteristics & IMAGE_SCN_MEM_EXECUTE))
+            self._sections.append((
+                    self._imageBase + section.VirtualAddress,
+                    _alignUp(virtualSize, sectionAlignment),
+                    fileOffset,
+                    fileSize,
+                    _sectionName(section.Name),
+                    attributes))
+
+    def _loadMacho(self, endianity):
+        from ..Patterns.Finder import CreatePatternsFinder
+        from ..Patterns.Macho import MACHO_HEADER_PATTERN, MACHO_COMMANDS_IDS, VM_PROT_READ, VM_PROT_WRITE, VM_PROT_EXECUTE
+        if '<' != endianity:
+            self._file.close()
+            self._file = FileReader(self._fileName, pointer_size=4, endianity=endianity, isMapped=self._file.isMapped())
+            self._ENDIANITY = endianity
+        header = next(CreatePatternsFinder(self._file).search(MACHO_HEADER_PATTERN, 0), None)
+        if None == header:
+            raise Exception("File %s has an invalid Mach-O header" % self._fileName)
+        self._header = header
+        self._format = IMAGE_FORMAT_MACHO
+        if MACHO_MAGIC64 == header.magic:
+            self._POINTER_SIZE = 8
+        else:
+            self._POINTER_SIZE = 4
+        segmentCommands = (MACHO_COMMANDS_IDS['LC_SEGMENT'], MACHO_COMMANDS_IDS['LC_SEGMENT_64'])
+        self._sections = []
+        self._imageBase = None
+        for item in header.cmds:
+            command = item.Item
+            if command.type not in segmentCommands:
+                continue
+            segment = command.cmd_data
+            if 0 == segment.initprot or 0 == segment.vmsize:
+                # Like __PAGEZERO, reserved but not accessible
+                continue
+            if 0 == segment.fileoff and 0 != segment.filesize:
+                # The segment that holds the Mach-O header
+                self._imageBase = segment.vmaddr
+            fileSize = min(segment.filesize, segment.vmsize, max(self._fileSize - segment.fileoff, 0))
+            self._sections.append((
+                    segment.vmaddr,
+                    segment.vmsize,
+                    segment.fileoff,
+                    fileSize,
+                    _sectionName(segment.segname),
+                    protectionToAttributes(
+                        0 != (segment.initprot & VM_PROT_READ),
+                        0 != (segment.initprot & VM_PROT_WRITE),
+                        0 != (segment.initprot & VM_PROT_EXECUTE))))
+        if not self._sections:
+            raise Exception("File %s has no segments to map" % self._fileName)
+        if None == self._imageBase:
+            self._imageBase = min([section[0] for section in self._sections])
+
+    def _buildIndex(self):
+        self._sections.sort()
+        sections = []
+        for section in self._sections:
+            if sections and section[0] < sections[-1][0] + sections[-1][1]:
+                raise Exception("Section %s of %s overlaps section %s" % (section[4], self._fileName, sections[-1][4]))
+            sections.append(section)
+        self._sections = sections
+        self._starts = [section[0] for section in sections]
+
+    def _findSection(self, address):
+        index = bisect_right(self._starts, address) - 1
+        if index < 0:
+            return None
+        section = self._sections[index]
+        if address >= section[0] + section[1]:
+            return None
+        return section
+
+    def readMemory(self, address, length):
+        result = []
+        while 0 < length:
+            section = self._findSection(address)
+            if None == section:
+                raise ReadError(address)
+            start, size, fileOffset, fileSize, name, attributes = section
+            offset = address - start
+            chunkSize = min(length, size - offset)
+            if offset < fileSize:
+                dataSize = min(chunkSize, fileSize - offset)
+                result.append(self._file.readMemory(fileOffset + offset, dataSize))
+                if dataSize < chunkSize:
+                    result.append(b'\x00' * (chunkSize - dataSize))
+            else:
+                result.append(b'\x00' * chunkSize)
+            address += chunkSize
+            length -= chunkSize
+        if 1 == len(result):
+            return result[0]
+        return b''.join(result)
+
+    def isAddressValid(self, address):
+        return self.getPageTable().isValid(address)
+
+    def isAddressValidBatch(self, addresses):
+        return self.getPageTable().isValidBatch(addresses)
+
+    def getMemoryMap(self):
+        return dict([(address, (name, size, attributes)) for address, size, fileOffset, fileSize, name, attributes in self._sections])
+
+    def getSections(self):
+        """ List of (address, size, fileOffset, fileSize, name, attributes) sorted by address """
+        return list(self._sections)
+
+    def getImageBase(self):
+        return self._imageBase
+
+    def getPreferredImageBase(self):
+        return self._preferredBase
+
+    def getFormat(self):
+        return self._format
+
+    def getHeader(self):
+        """ The search result of the image header, as parsed from the file """
+        return self._header
+
+    def getFileName(self):
+        return self._fileName
+
+    def rvaToAddress(self, rva):
+        return self._imageBase + rva
+
+    def addressToFileOffset(self, address):
+        """ Offset in the file of the data at address, None when it is not in the file """
+        section = self._findSection(address)
+        if None == section:
+            return None
+        offset = address - section[0]
+        if offset >= section[3]:
+            return None
+        return section[2] + offset
+
+__all__ = [
+        "ImageReader",
+        "loadImage" ]
@@ -1,10 +1,17 @@
 
 from .Interfaces import GUIDisplayInterface
-try:
-    from .QtWidgets import *
-    IS_QT_SUPPORTED = True
-except ImportError as e:
-    IS_QT_SUPPORTED = False
+
+_qtWidgets = []
+
+def loadQtWidgets():
+    """ The QtWidgets module, imported on the first display, or None if Qt is not installed """
+    if not _qtWidgets:
+        try:
+            from . import QtWidgets
+        except ImportError as e:
+            QtWidgets = None
+        _qtWidgets.append(QtWidgets)
+    return _qtWidgets[0]
 
 class GUIDisplayBase( GUIDisplayInterface ):
     """ A basic n' simple implementation of GUI display using QT """
@@ -12,9 +19,9 @@ class GUIDisplayBase( GUIDisplayInterface ):
     def _hexDisplay(self, address, length=0x1000, showOffsets=False, size=4):
         updateCallback = lambda :self.readMemory(address, length)
         if showOffsets:
-            newWindow = HexView(self.readMemory(address, length), start_address=0, item_size=size, updateCallback=updateCallback)
+            newWindow = loadQtWidgets().HexView(self.readMemory(address, length), start_address=0, item_size=size, updateCallback=updateCallback)
         else:
-            newWindow = HexView(self.readMemory(address, length), start_address=address, item_size=size, updateCallback=updateCallback)
+            newWindow = loadQtWidgets().HexView(self.readMemory(address, length), start_address=address, item_size=size, updateCallback=updateCallback)
         newWindow.show()
         return newWindow
 
@@ -30,7 +37,7 @@ class GUIDisplayBase( GUIDisplayInterface ):
             Use updateData to reread the memory.
         """
         updateCallback = lambda :self.readMemory(address, length)
-        newWindow = MemoryMap(self.readMemory(address, length), color_map=colorMap, updateCallback=updateCallback)
+        newWindow = loadQtWidgets().MemoryMap(self.readMemory(address, length), color_map=colorMap, updateCallback=updateCallback)
         newWindow.show()
         return newWindow
 
@@ -38,7 +45,7 @@ class GUIDisplayBase( GUIDisplayInterface ):
         raise NotImplementedError("Unsupported function")
 
     def hexDisplay(self, address, length=0x1000, showOffsets=False, size=4):
-        if IS_QT_SUPPORTED:
+        if None != loadQtWidgets():
             self.hexDisplay = self._hexDisplay
         else:
             self.hexDisplay = self._unsupported
@@ -55,7 +62,7 @@ class GUIDisplayBase( GUIDisplayInterface ):
             Use saveImage to save a bitmap image of the memory dump.
             Use updateData to reread the memory.
         """
-        if IS_QT_SUPPORTED:
+        if None != loadQtWidgets():
             self.mapDisplay = self._mapDisplay
         else:
             self.mapDisplay = self._unsupported
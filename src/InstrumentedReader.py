@@ -0,0 +1,321 @@
+#
+#   InstrumentedReader.py
+#
+#   InstrumentedReader - Transparent memory reader wrapper that collects
+#   calls, bytes, errors, latency and address locality statistics
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from __future__ import print_function
+import time
+from .Interfaces import MemReaderInterface
+
+if hasattr(time, 'perf_counter'):
+    _timer = time.perf_counter
+else:
+    _timer = time.time
+
+# Latency histogram bucket i holds calls that took [2**(i-1), 2**i) micro seconds,
+# bucket 0 holds everything under one micro second
+HISTOGRAM_BUCKETS = 32
+
+def _makeBytesCounters():
+    counters = {
+            'readMemory'        : (lambda self, args, result: args[1]),
+            'readAddr'          : (lambda self, args, result: self._POINTER_SIZE),
+            'readString'        : (lambda self, args, result: len(result)),
+            'isAddressValid'    : (lambda self, args, result: 0) }
+    def sizeCounterCreator(dataSize):
+        return lambda self, args, result: dataSize
+    for readerName, (dataSize, packer) in MemReaderInterface.READER_DESC.items():
+        counters['read' + readerName] = sizeCounterCreator(dataSize)
+    return counters
+
+def instrument(reader, isEnabled=True, logInterval=None, logFunction=None):
+    return InstrumentedReader(reader, isEnabled=isEnabled, logInterval=logInterval, logFunction=logFunction)
+
+class ReaderMethodStats( object ):
+    """ Counters of a single reader method """
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.bytes = 0
+        self.errors = 0
+        self.totalTime = 0.0
+        self.minTime = None
+        self.maxTime = 0.0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, elapsed, numBytes, isError):
+        self.calls += 1
+        self.bytes += numBytes
+        if isError:
+            self.errors += 1
+        self.totalTime += elapsed
+        if None == self.minTime or elapsed < self.minTime:
+            self.minTime = elapsed
+        if elapsed > self.maxTime:
+            self.maxTime = elapsed
+        bucket = int(elapsed * 1000000).bit_length()
+        if bucket >= HISTOGRAM_BUCKETS:
+            bucket = HISTOGRAM_BUCKETS - 1
+        self.histogram[bucket] += 1
+
+    def percentile(self, fraction):
+        """ Upper bound in seconds of the histogram bucket that holds the given fraction of calls """
+        if 0 == self.calls:
+            return 0.0
+        target = self.calls * fraction
+        total = 0
+        for bucket, count in enumerate(self.histogram):
+            total += count
+            if total >= target:
+                return (1 << bucket) / 1000000.0
+        return self.maxTime
+
+    def toDict(self):
+        if self.calls:
+            avgTime = self.totalTime / self.calls
+        else:
+            avgTime = 0.0
+        return {
+                'calls'     : self.calls,
+                'bytes'     : self.bytes,
+                'errors'    : self.errors,
+                'totalTime' : self.totalTime,
+                'avgTime'   : avgTime,
+                'minTime'   : self.minTime or 0.0,
+                'maxTime'   : self.maxTime,
+                'p50'       : self.percentile(0.5),
+                'p99'       : self.percentile(0.99),
+                'histogram' : list(self.histogram) }
+
+    def __repr__(self):
+        stats = self.toDict()
+        return '%-16s calls: %8d bytes: %10d errors: %6d avg: %8.2fus p50: <%dus p99: <%dus max: %8.2fus' % (
+                self.name,
+                stats['calls'],
+                stats['bytes'],
+                stats['errors'],
+                stats['avgTime'] * 1000000,
+                int(stats['p50'] * 1000000),
+                int(stats['p99'] * 1000000),
+                stats['maxTime'] * 1000000)
+
+class AddressLocality( object ):
+    """ Summary of how close every access is to the one before it """
+    NEAR_DISTANCE = 0x10000
+
+    def __init__(self, pageShift=12, maxTrackedPages=0x100000):
+        self.pageShift = pageShift
+        self.maxTrackedPages = maxTrackedPages
+        self.reset()
+
+    def reset(self):
+        self.sequential = 0
+        self.samePage = 0
+        self.near = 0
+        self.far = 0
+        self.minAddress = None
+        self.maxAddress = None
+        self.pages = set()
+        self.isPagesOverflow = False
+        self._lastEnd = None
+
+    def add(self, address, length):
+        lastEnd = self._lastEnd
+        if None != lastEnd:
+            if address == lastEnd:
+                self.sequential += 1
+            elif (address >> self.pageShift) == ((lastEnd - 1) >> self.pageShift):
+                self.samePage += 1
+            elif abs(address - lastEnd) < self.NEAR_DISTANCE:
+                self.near += 1
+            else:
+                self.far += 1
+        self._lastEnd = address + max(length, 1)
+        if None == self.minAddress or address < self.minAddress:
+            self.minAddress = address
+        if None == self.maxAddress or address > self.maxAddress:
+            self.maxAddress = address
+        if not self.isPagesOverflow:
+            self.pages.add(address >> self.pageShift)
+            if len(self.pages) > self.maxTrackedPages:
+                self.isPagesOverflow = True
+
+    def toDict(self):
+        return {
+                'sequential'    : self.sequential,
+                'samePage'      : self.samePage,
+                'near'          : self.near,
+                'far'           : self.far,
+                'minAddress'    : self.minAddress,
+                'maxAddress'    : self.maxAddress,
+                'distinctPages' : len(self.pages),
+                'isPagesOverflow' : self.isPagesOverflow }
+
+    def __repr__(self):
+        stats = self.toDict()
+        result = 'Locality: sequential %d same page %d near %d far %d distinct pages %d' % (
+                stats['sequential'],
+                stats['samePage'],
+                stats['near'],
+                stats['far'],
+                stats['distinctPages'])
+        if self.isPagesOverflow:
+            result += '+'
+        if None != stats['minAddress']:
+            result += ' range 0x%x-0x%x' % (stats['minAddress'], stats['maxAddress'])
+        return result
+
+class InstrumentedReader( MemReaderInterface ):
+    """
+    Wraps any memory reader and keeps statistics about the calls made through it.
+    When disabled, the wrapper methods are replaced with the bound methods of the wrapped
+    reader, so the only cost left is an instance attribute lookup.
+    Methods that are not instrumented are forwarded to the wrapped reader as is.
+    """
+    # Method name -> function that returns the number of bytes a call moved
+    INSTRUMENTED_METHODS = _makeBytesCounters()
+
+    # Interface methods that are forwarded without instrumentation
+    FORWARDED_METHODS = [
+            'resolveOffsetsList',
+            'getPointerSize',
+            'getDefaultDataSize',
+            'getEndianity' ]
+
+    def __init__(self, reader, isEnabled=True, logInterval=None, logFunction=None):
+        """
+        reader      - Any MemReaderInterface to wrap
+        isEnabled   - Start collecting statistics right away
+        logInterval - Print the statistics every that many seconds (None for never)
+        logFunction - Called with every log line, default is print
+        """
+        self._reader = reader
+        self._POINTER_SIZE = reader.getPointerSize()
+        self.logInterval = logInterval
+        if None == logFunction:
+            logFunction = print
+        self.logFunction = logFunction
+        self._stats = dict([(name, ReaderMethodStats(name)) for name in self.INSTRUMENTED_METHODS.keys()])
+        self.locality = AddressLocality()
+        self._startTime = _timer()
+        self._lastLogTime = self._startTime
+        for name in self.FORWARDED_METHODS:
+            if hasattr(reader, name):
+                setattr(self, name, getattr(reader, name))
+        self.isEnabled = False
+        if isEnabled:
+            self.enable()
+        else:
+            self.disable()
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the wrapper itself
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.__dict__['_reader'], name)
+
+    def getReader(self):
+        return self._reader
+
+    def enable(self):
+        for name, bytesCounter in self.INSTRUMENTED_METHODS.items():
+            if hasattr(self._reader, name):
+                setattr(self, name, self._instrument(name, getattr(self._reader, name), bytesCounter))
+        self.isEnabled = True
+
+    def disable(self):
+        for name in self.INSTRUMENTED_METHODS.keys():
+            if hasattr(self._reader, name):
+                setattr(self, name, getattr(self._reader, name))
+        self.isEnabled = False
+
+    def _instrument(self, name, method, bytesCounter):
+        stats = self._stats[name]
+        locality = self.locality
+        def instrumentedMethod(*args, **kw):
+            startTime = _timer()
+            try:
+                result = method(*args, **kw)
+            except Exception:
+                endTime = _timer()
+                stats.add(endTime - startTime, 0, True)
+                self._afterCall(endTime)
+                raise
+            endTime = _timer()
+            try:
+                numBytes = bytesCounter(self, args, result)
+            except (TypeError, IndexError):
+                numBytes = 0
+            stats.add(endTime - startTime, numBytes, False)
+            if args:
+                locality.add(args[0], numBytes)
+            self._afterCall(endTime)
+            return result
+        instrumentedMethod.__name__ = name
+        return instrumentedMethod
+
+    def _afterCall(self, now):
+        if None != self.logInterval and (now - self._lastLogTime) >= self.logInterval:
+            self._lastLogTime = now
+            self.logStats()
+
+    def resetStats(self):
+        for stats in self._stats.values():
+            stats.reset()
+        self.locality.reset()
+        self._startTime = _timer()
+        self._lastLogTime = self._startTime
+
+    def getStats(self):
+        """ Returns all the collected statistics as a dict """
+        methods = {}
+        for name, stats in self._stats.items():
+            if stats.calls:
+                methods[name] = stats.toDict()
+        return {
+                'elapsed'   : _timer() - self._startTime,
+                'isEnabled' : self.isEnabled,
+                'methods'   : methods,
+                'locality'  : self.locality.toDict() }
+
+    def formatStats(self):
+        """ Returns the statistics as a list of printable lines """
+        names = [name for name, stats in self._stats.items() if stats.calls]
+        names.sort()
+        lines = ['Reader stats after %.2f seconds' % (_timer() - self._startTime)]
+        for name in names:
+            lines.append(repr(self._stats[name]))
+        lines.append(repr(self.locality))
+        return lines
+
+    def logStats(self):
+        for line in self.formatStats():
+            self.logFunction(line)
+
+    def printStats(self):
+        print('\n'.join(self.formatStats()))
+
+__all__ = [
+        "InstrumentedReader",
+        "ReaderMethodStats",
+        "AddressLocality",
+        "instrument" ]
@@ -0,0 +1,245 @@
+#
+#   PageMap.py
+#
+#   PageMap - Reads the flags of the pages of a process from /proc/<pid>/pagemap,
+#   to tell which pages are resident, and uses the soft-dirty bits to find the pages
+#   a process wrote to
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+# Usage:
+#   pageMap = PageMap(pid)
+#   for address, size in pageMap.getResidentRuns(region.start, region.size):
+#       data = reader.readMemory(address, size)
+#   tracker = SoftDirtyTracker(pid)
+#   tracker.reset()
+#   ...
+#   for address, size in tracker.getDirtyRanges(reader.getMemoryRuns()):
+#       print('0x%x 0x%x' % (address, size))
+
+import os
+import mmap
+import struct
+
+from ..Utilities import optionalImport
+
+PAGEMAP_ENTRY_SIZE      = 8
+PAGEMAP_PRESENT         = 1 << 63
+PAGEMAP_SWAPPED         = 1 << 62
+PAGEMAP_FILE_SHARED     = 1 << 61
+PAGEMAP_EXCLUSIVE       = 1 << 56
+PAGEMAP_SOFT_DIRTY      = 1 << 55
+
+# States of a page, as returned by getPagesStates
+PAGE_NOT_PRESENT        = 0
+PAGE_PRESENT            = 1
+PAGE_SWAPPED            = 2
+
+# Writing this to clear_refs clears the soft-dirty bits of all the pages of the process
+CLEAR_REFS_SOFT_DIRTY   = b'4'
+
+PAGE_SIZE               = mmap.PAGESIZE
+# Number of entries read from the pagemap file at once
+PAGEMAP_CHUNK_ENTRIES   = 0x10000
+
+def _pread(fd, size, offset):
+    if hasattr(os, 'pread'):
+        return os.pread(fd, size, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, size)
+
+def clearSoftDirty(pid):
+    """ Clears the soft-dirty bits of the process, the pages it writes to from now on are marked again """
+    with open('/proc/%d/clear_refs' % pid, 'wb') as clearRefsFile:
+        clearRefsFile.write(CLEAR_REFS_SOFT_DIRTY)
+
+class PageMap( object ):
+    """ The pagemap file of a process, every page has a 64 bit entry of flags and its frame number """
+    def __init__(self, pid, pageSize=PAGE_SIZE):
+        self.pid = pid
+        self._pageSize = pageSize
+        self._fileName = '/proc/%d/pagemap' % pid
+        self._fd = None
+
+    def _getFd(self):
+        if None == self._fd:
+            try:
+                self._fd = os.open(self._fileName, os.O_RDONLY)
+            except OSError:
+                raise Exception('could not open the pagemap of process %d' % self.pid)
+        return self._fd
+
+    def close(self):
+        if None != self._fd:
+            os.close(self._fd)
+            self._fd = None
+
+    def __del__(self):
+        self.close()
+
+    def getPageSize(self):
+        return self._pageSize
+
+    def readEntriesData(self, address, size):
+        """ Raw entries of the pages from address to address + size, as bytes """
+        firstPage = address // self._pageSize
+        endPage = (address + size + self._pageSize - 1) // self._pageSize
+        data = _pread(self._getFd(), (endPage - firstPage) * PAGEMAP_ENTRY_SIZE, firstPage * PAGEMAP_ENTRY_SIZE)
+        if len(data) != (endPage - firstPage) * PAGEMAP_ENTRY_SIZE:
+            raise Exception('could not read the pagemap of process %d at 0x%x' % (self.pid, address))
+        return data
+
+    def readEntries(self, address, size):
+        """ List of the entries of the pages from address to address + size """
+        data = self.readEntriesData(address, size)
+        return list(struct.unpack('=%dQ' % (len(data) // PAGEMAP_ENTRY_SIZE), data))
+
+    def getPagesStates(self, address, size):
+        """ bytearray with the PAGE_PRESENT, PAGE_SWAPPED or PAGE_NOT_PRESENT of every page of the range """
+        data = self.readEntriesData(address, size)
+        numpy = optionalImport('numpy')
+        if None != numpy:
+            entries = numpy.frombuffer(data, dtype=numpy.uint64)
+            states = numpy.where(0 != (entries & numpy.uint64(PAGEMAP_PRESENT)), PAGE_PRESENT,
+                        numpy.where(0 != (entries & numpy.uint64(PAGEMAP_SWAPPED)), PAGE_SWAPPED, PAGE_NOT_PRESENT))
+            return bytearray(states.astype(numpy.uint8).tobytes())
+        states = bytearray(len(data) // PAGEMAP_ENTRY_SIZE)
+        for index, entry in enumerate(struct.unpack('=%dQ' % len(states), data)):
+            if 0 != (entry & PAGEMAP_PRESENT):
+                states[index] = PAGE_PRESENT
+            elif 0 != (entry & PAGEMAP_SWAPPED):
+                states[index] = PAGE_SWAPPED
+        return states
+
+    def getResidentRuns(self, address, size):
+        """
+        List of (address, size) of the pages of the range that are in memory or swapped out.
+        A page that is neither was never touched, or was dropped from the page cache, so it
+        reads as zeros only in anonymous private mappings.
+        """
+        return self.findPagesRuns(address, size, PAGEMAP_PRESENT | PAGEMAP_SWAPPED)
+
+    def findPagesRuns(self, address, size, flagsMask):
+        """
+        List of (address, size) of the runs of pages that have any of the flags in flagsMask,
+        in the range from address to address + size, and clipped to it
+        """
+        runs = []
+        end = address + size
+        pageSize = self._pageSize
+        chunkSize = PAGEMAP_CHUNK_ENTRIES * pageSize
+        chunkStart = address - (address % pageSize)
+        numpy = optionalImport('numpy')
+        while chunkStart < end:
+            chunkEnd = min(chunkStart + chunkSize, end)
+            data = self.readEntriesData(chunkStart, chunkEnd - chunkStart)
+            if None != numpy:
+                pages = numpy.flatnonzero(numpy.frombuffer(data, dtype=numpy.uint64) & numpy.uint64(flagsMask)).tolist()
+            else:
+                entries = struct.unpack('=%dQ' % (len(data) // PAGEMAP_ENTRY_SIZE), data)
+                pages = [index for index, entry in enumerate(entries) if 0 != (entry & flagsMask)]
+            for page in pages:
+                pageStart = chunkStart + page * pageSize
+                if runs and runs[-1][1] == pageStart:
+                    runs[-1][1] = pageStart + pageSize
+                else:
+                    runs.append([pageStart, pageStart + pageSize])
+            chunkStart = chunkEnd
+        return [(max(runStart, address), min(runEnd, end) - max(runStart, address)) for runStart, runEnd in runs]
+
+_softDirtySupport = []
+
+def _probeSoftDirty():
+    """ Writes to a page of this process after clearing the soft-dirty bits, and checks the page is marked """
+    import ctypes
+    pid = os.getpid()
+    pageMap = PageMap(pid)
+    page = mmap.mmap(-1, PAGE_SIZE)
+    pageBuffer = ctypes.c_char.from_buffer(page)
+    try:
+        address = ctypes.addressof(pageBuffer)
+        page[0:1] = b'\x01'
+        clearSoftDirty(pid)
+        if 0 != (pageMap.readEntries(address, 1)[0] & PAGEMAP_SOFT_DIRTY):
+            return False
+        page[0:1] = b'\x02'
+        return 0 != (pageMap.readEntries(address, 1)[0] & PAGEMAP_SOFT_DIRTY)
+    finally:
+        del pageBuffer
+        page.close()
+        pageMap.close()
+
+def isSoftDirtySupported(pid=None):
+    """
+    True when the kernel keeps soft-dirty bits, and when pid is given, that its bits can be
+    cleared and read. Kernels built without CONFIG_MEM_SOFT_DIRTY accept the clear_refs
+    write but never mark a page, so the support is checked on a page of this process.
+    """
+    if not _softDirtySupport:
+        try:
+            _softDirtySupport.append(_probeSoftDirty())
+        except Exception:
+            _softDirtySupport.append(False)
+    if not _softDirtySupport[0]:
+        return False
+    if None == pid:
+        return True
+    return os.access('/proc/%d/clear_refs' % pid, os.W_OK) and os.access('/proc/%d/pagemap' % pid, os.R_OK)
+
+class SoftDirtyTracker( object ):
+    """
+    Finds the pages a process wrote to since the last reset from their soft-dirty bits,
+    without reading the memory of the process. A new mapping is reported as dirty as a whole.
+    The bits are of the whole process, so only one tracker should reset them at a time.
+    The result is exact only while the process is stopped, as it is when attached with ptrace,
+    otherwise a page written between getDirtyRanges and reset is missed.
+    """
+    IS_KERNEL_TRACKED = True
+
+    def __init__(self, pid, pageSize=PAGE_SIZE):
+        self.pid = pid
+        self._pageMap = PageMap(pid, pageSize)
+
+    def getPageSize(self):
+        return self._pageMap.getPageSize()
+
+    def reset(self, ranges=None):
+        """ Starts tracking from now, ranges is ignored as the kernel tracks all the memory """
+        clearSoftDirty(self.pid)
+
+    def getDirtyRanges(self, ranges):
+        """ List of (address, size) of the dirty pages in the (address, size) ranges, clipped to them """
+        dirty = []
+        for address, size in ranges:
+            dirty.extend(self._pageMap.findPagesRuns(address, size, PAGEMAP_SOFT_DIRTY))
+        return dirty
+
+    def close(self):
+        self._pageMap.close()
+
+__all__ = [
+        "PageMap",
+        "SoftDirtyTracker",
+        "clearSoftDirty",
+        "isSoftDirtySupported",
+        "PAGE_NOT_PRESENT",
+        "PAGE_PRESENT",
+        "PAGE_SWAPPED",
+        "PAGEMAP_PRESENT",
+        "PAGEMAP_SWAPPED",
+        "PAGEMAP_FILE_SHARED",
+        "PAGEMAP_EXCLUSIVE",
+        "PAGEMAP_SOFT_DIRTY" ]
@@ -0,0 +1,222 @@
+#
+#   ProcMaps.py
+#
+#   ProcMaps - Parses /proc/<pid>/maps, and follows the changes of the memory map
+#   of a process between reads of it
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+# Usage:
+#   tracker = MapsTracker(pid)
+#   tracker.subscribe(lambda event: print(event))
+#   tracker.refresh()
+#   ...
+#   for event in tracker.refresh():
+#       cache.invalidateRange(event.start, event.end)
+
+from ..MemReaderBase import protectionToAttributes
+
+MAP_EVENT_MAPPED                = 'mapped'
+MAP_EVENT_UNMAPPED              = 'unmapped'
+MAP_EVENT_PERMISSIONS_CHANGED   = 'permissionsChanged'
+
+class MemInfo(object):
+    def __init__(self, start, end, permissions, offset, dev, inode, pathName):
+        '''
+        contains all the attributes according to /proc/$pid/maps
+        '''
+        self.start = start
+        self.end = end
+
+        self.size = self.end - self.start
+
+        self.permissions = permissions
+
+        self.read    = permissions[0] == 'r'
+        self.write   = permissions[1] == 'w'
+        self.execute = permissions[2] == 'x'
+        self.private = permissions[3] == 'p'
+
+        self.offset = offset
+        self.dev = dev
+        self.inode = inode
+        self.pathName = pathName.strip()
+
+    def isRead(self):
+        return self.read
+    def isWrite(self):
+        return self.write
+    def isExecute(self):
+        return self.execute
+    def isPrivate(self):
+        return self.private
+
+    def isAnonymous(self):
+        ''' Private memory that is not backed by a file, so its pages that were never touched read as zeros '''
+        if not self.private or '0' != self.inode:
+            return False
+        return '' == self.pathName or self.pathName in ('[heap]', '[stack]') or \
+                self.pathName.startswith('[anon:') or self.pathName.startswith('[stack:')
+
+    def getAttributes(self):
+        ''' The permissions as Win32 page protection, like the attributes of getMemoryMap '''
+        return protectionToAttributes(self.read, self.write, self.execute)
+
+    def __repr__(self):
+
+        return "MemInfo:0x%x-0x%x(size=0x%x) (0x%x)(%s) (%s)" % (self.start,self.end,self.size,self.offset,self.permissions,self.pathName)
+
+def parseMapsLine(line):
+    """ MemInfo of a single line of a maps file, as bytes """
+    # start-end permissions offset dev inode [pathName], the path may have spaces in it
+    parts = line.split(None, 5)
+    if 5 > len(parts):
+        raise Exception('could not parse line : %r' % line)
+    start, end = parts[0].split(b'-')
+    if 6 == len(parts):
+        pathName = parts[5].decode('utf-8', 'replace')
+    else:
+        pathName = ''
+    return MemInfo(
+            int(start, 16),
+            int(end, 16),
+            parts[1].decode('ascii'),
+            int(parts[2], 16),
+            parts[3].decode('ascii'),
+            parts[4].decode('ascii'),
+            pathName)
+
+def parseMaps(data):
+    """ List of MemInfo of the content of a maps file """
+    return [parseMapsLine(line) for line in data.splitlines() if line]
+
+def readMapsData(pid):
+    """ Content of /proc/<pid>/maps, read at once so it is as consistent as the kernel makes it """
+    fileName = '/proc/%d/maps' % pid
+    try:
+        with open(fileName, 'rb') as mapsFile:
+            return mapsFile.read()
+    except (IOError, OSError):
+        raise Exception('could not find process %d map file' % pid)
+
+class MapEvent( object ):
+    """
+    A change of the memory map, region is the MemInfo after the change, and oldRegion
+    is the one before it (None for a new mapping). For an unmapped region, region is
+    the region that was removed.
+    """
+    __slots__ = ('kind', 'region', 'oldRegion')
+    def __init__(self, kind, region, oldRegion=None):
+        self.kind = kind
+        self.region = region
+        self.oldRegion = oldRegion
+
+    @property
+    def start(self):
+        return self.region.start
+
+    @property
+    def end(self):
+        return self.region.end
+
+    def __repr__(self):
+        return "MapEvent(%s 0x%x-0x%x %s)" % (self.kind, self.region.start, self.region.end, self.region.pathName)
+
+class MapsTracker( object ):
+    """
+    Keeps the memory map of a process and updates it incrementally.
+    Every line of the maps file is kept with its parsed MemInfo, so on a refresh only the
+    lines that changed are parsed. The lines that were added and removed are turned to
+    mapped, unmapped and permissions changed events, that are returned and passed to
+    the subscribers.
+    A range whose permissions changed keeps its place in the map only when mprotect was
+    called on all of it, otherwise the kernel splits it, and the split shows as the old
+    range unmapped and the new pieces mapped.
+    """
+    def __init__(self, pid):
+        self.pid = pid
+        self.regions = []
+        self._lines = {}
+        self._data = None
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """ callback(event) is called with every MapEvent found by refresh """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def refresh(self, data=None):
+        """
+        Rereads the maps file, or uses data as its content, and returns the list of MapEvent
+        sorted by address. The first refresh reports all the regions as mapped.
+        """
+        if None == data:
+            data = readMapsData(self.pid)
+        if data == self._data:
+            return []
+        lines = self._lines
+        newLines = {}
+        regions = []
+        added = []
+        for line in data.splitlines():
+            if not line:
+                continue
+            region = lines.get(line)
+            if None == region:
+                region = parseMapsLine(line)
+                added.append(region)
+            newLines[line] = region
+            regions.append(region)
+        removed = {}
+        for line, region in lines.items():
+            if line not in newLines:
+                removed[(region.start, region.end)] = region
+        events = []
+        for region in added:
+            oldRegion = removed.pop((region.start, region.end), None)
+            if None == oldRegion:
+                events.append(MapEvent(MAP_EVENT_MAPPED, region))
+            elif oldRegion.permissions != region.permissions and \
+                    oldRegion.pathName == region.pathName and \
+                    oldRegion.offset == region.offset:
+                events.append(MapEvent(MAP_EVENT_PERMISSIONS_CHANGED, region, oldRegion))
+            else:
+                # Something else was mapped over the same range
+                events.append(MapEvent(MAP_EVENT_UNMAPPED, oldRegion))
+                events.append(MapEvent(MAP_EVENT_MAPPED, region))
+        for oldRegion in removed.values():
+            events.append(MapEvent(MAP_EVENT_UNMAPPED, oldRegion))
+        events.sort(key=lambda event: event.start)
+        self.regions = regions
+        self._lines = newLines
+        self._data = data
+        for event in events:
+            for callback in self._subscribers:
+                callback(event)
+        return events
+
+__all__ = [
+        "MemInfo",
+        "MapEvent",
+        "MapsTracker",
+        "parseMaps",
+        "parseMapsLine",
+        "readMapsData",
+        "MAP_EVENT_MAPPED",
+        "MAP_EVENT_UNMAPPED",
+        "MAP_EVENT_PERMISSIONS_CHANGED" ]
@@ -18,50 +18,17 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
+from __future__ import print_function
 import os
 from struct import pack
-from ctypes import c_char,c_long, c_void_p, c_int8, c_int16, c_int32, c_int64, c_uint8, c_uint16, c_uint32, c_uint64, cdll, sizeof,c_ulong
+from bisect import bisect_right
+from ctypes import c_char,c_long, c_void_p, c_int8, c_int16, c_int32, c_int64, c_uint8, c_uint16, c_uint32, c_uint64, cdll, sizeof,c_ulong, CDLL, get_errno, set_errno
 import re
 
 from ..Interfaces import ReadError
 from ..MemReaderBase import *
 from ..Utilities import *
-
-
-class MemInfo(object):
-    def __init__(self, start, end, permissions, offset, dev, inode, pathName):
-        '''
-        contains all the attributes according to /proc/$pid/maps
-        '''
-        self.start = start
-        self.end = end
-
-        self.size = self.end - self.start
-
-        self.permissions = permissions
-
-        self.read    = permissions[0] == 'r'
-        self.write   = permissions[1] == 'w'
-        self.execute = permissions[2] == 'x'
-        self.private = permissions[3] == 'p'
-
-        self.offset = offset
-        self.dev = dev
-        self.inode = inode
-        self.pathName = pathName.strip()
-
-    def isRead(self):
-        return self.read
-    def isWrite(self):
-        return self.write
-    def isExecute(self):
-        return self.execute
-    def isPrivate(self):
-        return self.private
-
-    def __repr__(self):
-
-        return "MemInfo:0x%x-0x%x(size=0x%x) (0x%x)(%s) (%s)" % (self.start,self.end,self.size,self.offset,self.permissions,self.pathName)
+from .ProcMaps import *
 
 def attach(pid):
     # memInfo: (memId, baseAddress, size)
@@ -83,7 +50,8 @@ class PtraceMemReader( MemReaderBase ):
         # Show me one *nix machine with Python ctypes that is not little-endian.
         self._ENDIANITY = '<'
 
-        libc = cdll.LoadLibrary("libc.so.6")
+        # errno tells a failed PEEKTEXT from a word that is all ones
+        libc = CDLL("libc.so.6", use_errno=True)
 
         # long ptrace(enum __ptrace_request request, pid_t pid,void*addr, void *data);
         # pid_t = 4
@@ -109,16 +77,20 @@ class PtraceMemReader( MemReaderBase ):
         self.PTRACE_DETACH = 0x11
 
         self.memMap = []
+        self._regionsStarts = []
+        self.mapsTracker = MapsTracker(pid)
+        self._changeTracker = None
+        self._pageMap = None
 
         # attach to process
         ret = self.ptrace(self.PTRACE_ATTACH, self.pid, 0, 0)
         if 0 != ret:
-            print 'ret = %d (0x%x)' % (ret,ret)
+            print('ret = %d (0x%x)' % (ret,ret))
             raise Exception('error - could not ptrace attach to pid : %d' % self.pid)
 
         self.isAttached = True
 
-        print 'reading memory regions...'
+        print('reading memory regions...')
         self.readMemoryRegions()
 
 
@@ -134,53 +106,101 @@ class PtraceMemReader( MemReaderBase ):
                 found.append(reg)
 
                 if verbose:
-                    print '\n%s' % str(reg)
+                    print('\n%s' % str(reg))
 
         if verbose:
-            print 'found %d matches for pathStr = %s' % (len(found),pathStr)
+            print('found %d matches for pathStr = %s' % (len(found),pathStr))
 
         return found
 
 
-    def readMemoryRegions(self):
-        # read all the process memory regions
-
-        self.memMap = []
-
-        if False == os.path.exists('/proc/%d/maps' % self.pid):
-            raise Exception('PtraceMemReader - could not find process %d map file' % self.pid)
-
-
-        processRegions = open('/proc/%d/maps' % self.pid,'r').readlines()
-
-        for line in processRegions:
-                # start, end, permissions, offset, dev, inode, pathName
-                m = re.match('^(\w+)\-(\w+) ([\w-]+) (\w+) ([\w\:]+) (\w+)\s*(.*)',line)
-
-                # start,end,permissions,offsets,dev,inode,pathName = 7 parts
-
-                if None == m or 7 != len(m.groups()):
+    def readMemoryRegions(self, isVerbose=True):
+        '''
+        Rereads the memory regions of the process, only the lines of the maps file
+        that changed since the last read are parsed.
+        Returns the list of MapEvent of the changes.
+        '''
+        events = self.mapsTracker.refresh()
+        if events:
+            self.memMap = self.mapsTracker.regions
+            self._regionsStarts = [region.start for region in self.memMap]
+            self._pageTable = None
+        if isVerbose:
+            print('\t read %d regions for pid %d' % (len(self.memMap),self.pid))
+        return events
+
+    def subscribeMapEvents(self, callback):
+        '''
+        callback(event) is called with the MapEvent of every region that was mapped,
+        unmapped or had its permissions changed, when the regions are read again
+        '''
+        self.mapsTracker.subscribe(callback)
 
-                    raise Exception('could not parse line : %s' % line)
+    def unsubscribeMapEvents(self, callback):
+        self.mapsTracker.unsubscribe(callback)
 
-                parts = m.groups()
+    def getPageMap(self):
+        if None == self._pageMap:
+            from .PageMap import PageMap
+            self._pageMap = PageMap(self.pid)
+        return self._pageMap
 
-                start = long(parts[0],16)
-                end = long(parts[1],16)
-                permissions = parts[2]
-                offset = long(parts[3],16)
-                dev = parts[4]
-                inode = parts[5]
-                pathName = parts[6]
+    def getResidentRuns(self, ranges):
+        '''
+        The parts of the ranges without the pages of anonymous regions that were never touched,
+        as the pagemap of the process tells. The pages of files and of shared memory that are
+        not mapped may still have data, so they are always kept.
+        '''
+        pageMap = self.getPageMap()
+        runs = []
+        for address, size in ranges:
+            end = address + size
+            index = max(0, bisect_right(self._regionsStarts, address) - 1)
+            while address < end:
+                if index >= len(self.memMap) or end <= self.memMap[index].start:
+                    runs.append((address, end - address))
+                    break
+                region = self.memMap[index]
+                index += 1
+                if region.end <= address:
+                    continue
+                if region.start > address:
+                    runs.append((address, region.start - address))
+                    address = region.start
+                pieceEnd = min(end, region.end)
+                if region.isAnonymous():
+                    runs.extend(pageMap.getResidentRuns(address, pieceEnd - address))
+                else:
+                    runs.append((address, pieceEnd - address))
+                address = pieceEnd
+        return runs
+
+    def isThreadSafe(self):
+        ''' ptrace requests are only served to the thread that attached to the process '''
+        return False
 
-                self.memMap.append(MemInfo(start, end, permissions, offset, dev, inode, pathName))
+    def isLive(self):
+        return True
 
-        print '\t read %d regions for pid %d' % (len(self.memMap),self.pid)
+    def getChangeTracker(self):
+        '''
+        Tracker of the pages the process writes to, with reset() and getDirtyRanges(ranges).
+        It uses the soft-dirty bits of the kernel when it has them, so the memory is not read
+        to find the changes, and falls back to hashing the pages otherwise.
+        '''
+        if None == self._changeTracker:
+            from .PageMap import SoftDirtyTracker, isSoftDirtySupported
+            if isSoftDirtySupported(self.pid):
+                self._changeTracker = SoftDirtyTracker(self.pid)
+            else:
+                from ..ChangeTracker import HashChangeTracker
+                self._changeTracker = HashChangeTracker(self)
+        return self._changeTracker
 
     def getMemoryMap(self):
         memMap = {}
         for mem in self.memMap:
-            memMap[mem.start] = ('%d' % mem.pathName, mem.size, 0xffffffff)
+            memMap[mem.start] = (mem.pathName, mem.size, mem.getAttributes())
         return memMap
 
     def __del__(self):
@@ -209,33 +229,25 @@ class PtraceMemReader( MemReaderBase ):
             return self._ENDIANITY
 
     def readLong(self,address):
+        set_errno(0)
         ret_long = self.ptrace(self.PTRACE_PEEKTEXT, self.pid, address, 0)
+        if 0 != get_errno():
+            raise ReadError(address)
 
         return ret_long
 
     def readMemory(self, startAddress, length):
-        result = ''
-        if 8 == self._LONG_SIZE:
-            leftOvers = length % 8
-            endAddress = startAddress + length - leftOvers
-            for address in range(startAddress, endAddress, 8):
-                result += struct.pack('Q', self.readLong(address))
-            length = leftOvers
-            startAddress = endAddress
-        if 4 < length:
-            leftOvers = length % 4
-            endAddress = startAddress + length - leftOvers
-            for address in range(startAddress, endAddress, 4):
-                result += struct.pack('L', self.readUInt32(addresss))
-            length = leftOvers
-            startAddress = endAddress
-        if 2 <= length:
-            result += strcut.pack('H', self.readUInt16(startAddress))
-            startAddress += 2
-            length -= 2
-        if 1 == length:
-            result += chr(self.readUInt8(startAddress))
-        return result
+        '''
+        Reads the aligned words that cover the range, an aligned word never crosses a page,
+        so the end of a region is read without touching the page after it
+        '''
+        longSize = self._LONG_SIZE
+        packer = '=Q' if 8 == longSize else '=L'
+        firstAddress = startAddress - (startAddress % longSize)
+        readLong = self.readLong
+        result = b''.join([pack(packer, readLong(address)) for address in range(firstAddress, startAddress + length, longSize)])
+        offset = startAddress - firstAddress
+        return result[offset:offset + length]
 
     def readUInt64(self, address):
         if 8 == self._LONG_SIZE:
@@ -287,16 +299,13 @@ class PtraceMemReader( MemReaderBase ):
         '''
         returns the memory regions for a given address
         '''
-        for region in self.memMap:
-            if addr >= region.start and addr < region.end:
-                return region
+        index = bisect_right(self._regionsStarts, addr) - 1
+        if 0 <= index and addr < self.memMap[index].end:
+            return self.memMap[index]
         # Region not found
         return None
 
     def isAddressValid(self, address, isLocalAddress=False):
         # TODO : check alignment
-        for memInfo in self.memMap:
-            if memInfo.isRead() and address >= memInfo.start and address <= memInfo.end:
-                return True
-        return False
+        return self.getPageTable().isReadable(address)
 
@@ -21,20 +21,15 @@
 
 import sys
 import struct
+import ctypes
+from bisect import bisect_right
 from ctypes import c_char, c_void_p, c_int8, c_int16, c_int32, c_int64, c_uint8, c_uint16, c_uint32, c_uint64, cdll, sizeof
-import subprocess
-from subprocess import Popen
 
 from ..Interfaces import MemReaderInterface, ReadError
 from ..MemReaderBase import *
 from ..GUIDisplayBase import *
 from ..Utilities import *
-try:
-    from ..QtWidgets import *
-    IS_GUI_FOUND = True
-except ImportError as e:
-    #print("No GUI support")
-    IS_GUI_FOUND = False
+from .ShmDiscovery import getShmSegments, getProcessShmMappings
 
 class SharedMemInfo(object):
     def __init__(self, id, localAddress, base, size):
@@ -45,6 +40,8 @@ class SharedMemInfo(object):
         self.size = size
         self.base = base
         self.delta = self.localAddress - base
+        # The attached memory with no copy, it must not be used after the segment is detached
+        self.view = memoryview((c_char * size).from_address(localAddress)).cast('B')
     def __repr__(self):
         return "MemInfo:Id0x%x:Base0x%x:End0x%x:LocalAddress0x%x" % (self.id, self.base, self.end, self.localAddress)
 
@@ -52,6 +49,24 @@ def attach(memInfo):
     # memInfo: (memId, baseAddress, size)
     return SharedMemReader(memInfo)
 
+def attachProcessSegments(pid):
+    """ Attaches all the System V segments the process has, at the addresses it has them at """
+    memInfos = getProcessShmMappings(pid)
+    if not memInfos:
+        raise Exception("Process %d has no shared memory attached" % pid)
+    return SharedMemReader(memInfos)
+
+def attachSegments(ownerFilter=None, keyFilter=None):
+    """
+    Attaches every segment that matches the filters (see getShmSegments) in a single reader.
+    Every segment is at the address it is attached at in this process, as a segment
+    can be at different addresses in every process that attaches it.
+    """
+    segments = getShmSegments(ownerFilter, keyFilter, isCollectingPids=False)
+    if not segments:
+        raise Exception("No shared memory segment matches the filters")
+    return SharedMemReader([(segment.shmid, None, segment.size) for segment in segments])
+
 class SharedMemReader( MemReaderBase, GUIDisplayBase ):
     def __init__(self, memInfos):
         MemReaderBase.__init__(self)
@@ -74,36 +89,59 @@ class SharedMemReader( MemReaderBase, GUIDisplayBase ):
             memInfos = [memInfos]
         for memInfo in memInfos:
             if 3 != len(memInfo) or tuple != type(memInfo):
-                raise Exception("Meminfo of type (shared mem id, base address, size in bytes) expected")
+                raise Exception("Meminfo of type (shared mem id, base address or None, size in bytes) expected")
         self.memMap = []
         for memInfo in memInfos:
             mem = self.shmat(memInfo[0], 0, 0o10000) # 010000 == SHM_RDONLY
             if c_void_p(-1).value == mem or None == mem:
-                raise Exception("Attach to shared memory failed")
-            self.memMap.append(SharedMemInfo(memInfo[0], mem, memInfo[1], memInfo[2]))
-
+                self.__detach()
+                raise Exception("Attach to shared memory %d failed" % memInfo[0])
+            base = memInfo[1]
+            if None == base:
+                base = mem
+            self.memMap.append(SharedMemInfo(memInfo[0], mem, base, memInfo[2]))
+        self.memMap.sort(key=lambda mem: mem.base)
+        self._bases = [mem.base for mem in self.memMap]
 
         for name, (dataSize, packer) in MemReaderInterface.READER_DESC.items():
-            def readerCreator(dataSize, name):
+            def readerCreator(dataSize, name, packer):
                 ctype_container = getattr(ctypes, 'c_' + name.lower())
-                def readerMethod(self, address):
-                    address = self.remoteAddressToLocalAddress(address)
-                    return int(ctype_container.from_address(address).value)
+                # The memory is of this machine, so it is in native byte order
+                if name.startswith('Int'):
+                    unpacker = struct.Struct('=' + packer.lower()).unpack_from
+                else:
+                    unpacker = struct.Struct('=' + packer).unpack_from
+                def readerMethod(self, address, isLocalAddress=False):
+                    if isLocalAddress:
+                        return int(ctype_container.from_address(address).value)
+                    mem = self._findSegment(address)
+                    offset = address - mem.base
+                    if offset + dataSize > mem.size:
+                        raise ReadError(mem.end)
+                    return unpacker(mem.view, offset)[0]
                 return readerMethod
-            def localRederCreator(dataSize, name):
+            def localReaderCreator(dataSize, name):
                 ctype_container = getattr(ctypes, 'c_' + name.lower())
                 def readerMethod(self, address):
                     return int(ctype_container.from_address(address).value)
                 return readerMethod
-            setattr(SharedMemReader, 'read' + name, readerCreator(dataSize, name))
+            setattr(SharedMemReader, 'read' + name, readerCreator(dataSize, name, packer))
             setattr(SharedMemReader, 'readLocal' + name, localReaderCreator(dataSize, name))
 
-    def remoteAddressToLocalAddress(self, address):
-        for mem in self.memMap:
-            if address >= mem.base and address < mem.end:
-                return address + mem.delta
+    def _findSegment(self, address):
+        index = bisect_right(self._bases, address) - 1
+        if 0 <= index:
+            mem = self.memMap[index]
+            if address < mem.end:
+                return mem
         raise ReadError(address)
 
+    def remoteAddressToLocalAddress(self, address):
+        return address + self._findSegment(address).delta
+
+    def isLive(self):
+        return True
+
     def __del__(self):
         self.__detach()
 
@@ -113,8 +151,10 @@ class SharedMemReader( MemReaderBase, GUIDisplayBase ):
 
     def __detach(self):
         for mem in self.memMap:
+            mem.view = None
             self.shmdt(mem.localAddress)
         self.memMap = []
+        self._bases = []
 
     def getMemoryMap(self):
         memMap = {}
@@ -123,24 +163,44 @@ class SharedMemReader( MemReaderBase, GUIDisplayBase ):
         return memMap
 
     def readMemory(self, address, length, isLocalAddress=False):
-        if not isLocalAddress:
-            address = self.remoteAddressToLocalAddress(address)
-        val = (c_char * length).from_address(address)
-        return val.raw
+        if isLocalAddress:
+            return (c_char * length).from_address(address).raw
+        return self.readMemoryView(address, length).tobytes()
+
+    def readMemoryView(self, address, length):
+        """
+        memoryview of the memory at address with no copy, it is only valid while the
+        reader is attached
+        """
+        mem = self._findSegment(address)
+        offset = address - mem.base
+        if offset + length > mem.size:
+            raise ReadError(mem.end)
+        return mem.view[offset:offset + length]
+
+    def readArray(self, address, count, itemType='Q'):
+        """
+        count items of itemType (struct format letter in native size) at address with no copy,
+        as a numpy array when numpy is installed, and as a memoryview cast to the type otherwise.
+        Like readMemoryView it is only valid while the reader is attached.
+        """
+        itemSize = struct.calcsize(itemType)
+        view = self.readMemoryView(address, count * itemSize)
+        numpy = optionalImport('numpy')
+        if None != numpy:
+            return numpy.frombuffer(view, dtype=numpy.dtype(itemType), count=count)
+        return view.cast(itemType)
 
     def readAddr(self, address, isLocalAddress=False):
-        if not isLocalAddress:
-            address = self.remoteAddressToLocalAddress(address)
         if 4 == self._POINTER_SIZE:
-            return c_uint32.from_address(address).value
+            return self.readUInt32(address, isLocalAddress=isLocalAddress)
         else:
-            return c_uint64.from_address(address).value
+            return self.readUInt64(address, isLocalAddress=isLocalAddress)
 
     def isAddressValid(self, address, isLocalAddress=False):
         if not isLocalAddress:
-            for mem in self.memMap:
-                if address >= mem.base and address < mem.end:
-                    return True
+            index = bisect_right(self._bases, address) - 1
+            return 0 <= index and address < self.memMap[index].end
         else:
             for mem in self.memMap:
                 if address >= mem.localAddress and address < mem.localAddressEnd:
@@ -0,0 +1,196 @@
+#
+#   ShmDiscovery.py
+#
+#   ShmDiscovery - Finds the System V shared memory segments of the machine, and the
+#   processes that attach them, by reading /proc instead of running ipcs and pmap
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+# Usage:
+#   for segment in getShmSegments(ownerFilter='postgres'):
+#       print(segment)
+#   reader = SharedMemReader.attachProcessSegments(pid)
+
+import os
+
+from ..Utilities import integer_types
+from .ProcMaps import readMapsData, parseMaps
+
+SYSVIPC_SHM_FILE    = '/proc/sysvipc/shm'
+# Path name of System V shared memory in the maps file, followed by the key in hex
+SYSV_PATH_PREFIX    = b'/SYSV'
+
+_usersNames = {}
+
+def uidToOwner(uid):
+    """ User name of the uid, like ipcs shows it, or the uid as text when it has no name """
+    if uid not in _usersNames:
+        try:
+            import pwd
+            _usersNames[uid] = pwd.getpwuid(uid).pw_name
+        except (ImportError, KeyError):
+            _usersNames[uid] = '%d' % uid
+    return _usersNames[uid]
+
+class ShmSegment( object ):
+    def __init__(self, key, shmid, size, uid, permissions, creatorPid, lastPid, attachCount):
+        self.key = key
+        self.shmid = shmid
+        self.size = size
+        self.uid = uid
+        self.permissions = permissions
+        self.creatorPid = creatorPid
+        self.lastPid = lastPid
+        self.attachCount = attachCount
+        # Filled by getShmSegments when it is asked to collect them
+        self.attachingPids = None
+
+    @property
+    def owner(self):
+        return uidToOwner(self.uid)
+
+    def __repr__(self):
+        return "ShmSegment(key=0x%08x shmid=%d size=0x%x owner=%s nattch=%d pids=%r)" % (
+                self.key, self.shmid, self.size, self.owner, self.attachCount, self.attachingPids)
+
+def isSysVShmSupported():
+    return os.path.exists(SYSVIPC_SHM_FILE)
+
+def readSysVShm(fileName=SYSVIPC_SHM_FILE):
+    """ List of ShmSegment of all the segments in /proc/sysvipc/shm """
+    with open(fileName, 'rb') as shmFile:
+        lines = shmFile.read().splitlines()
+    if not lines:
+        return []
+    # The columns differ between kernel versions, so they are found by their names
+    columns = dict([(name, index) for index, name in enumerate(lines[0].split())])
+    keyIndex    = columns[b'key']
+    shmidIndex  = columns[b'shmid']
+    permsIndex  = columns[b'perms']
+    sizeIndex   = columns[b'size']
+    cpidIndex   = columns[b'cpid']
+    lpidIndex   = columns[b'lpid']
+    nattchIndex = columns[b'nattch']
+    uidIndex    = columns[b'uid']
+    segments = []
+    for line in lines[1:]:
+        values = line.split()
+        if len(values) < len(columns):
+            continue
+        segments.append(ShmSegment(
+                # Keys are printed as signed integers
+                int(values[keyIndex]) & 0xffffffff,
+                int(values[shmidIndex]),
+                int(values[sizeIndex]),
+                int(values[uidIndex]),
+                int(values[permsIndex], 8),
+                int(values[cpidIndex]),
+                int(values[lpidIndex]),
+                int(values[nattchIndex])))
+    return segments
+
+def getProcessShmMappings(pid, data=None):
+    """
+    List of (shmid, address, size) of every System V segment mapped in the process,
+    a segment that is attached more than once is listed at every address.
+    In the maps file the inode of a segment is its shmid.
+    """
+    if None == data:
+        data = readMapsData(pid)
+    mappings = []
+    start = data.find(SYSV_PATH_PREFIX)
+    while -1 != start:
+        lineStart = data.rfind(b'\n', 0, start) + 1
+        lineEnd = data.find(b'\n', start)
+        if -1 == lineEnd:
+            lineEnd = len(data)
+        parts = data[lineStart:lineEnd].split(None, 5)
+        if 6 == len(parts) and parts[5].startswith(SYSV_PATH_PREFIX):
+            rangeStart, rangeEnd = parts[0].split(b'-')
+            rangeStart = int(rangeStart, 16)
+            mappings.append((int(parts[4]), rangeStart, int(rangeEnd, 16) - rangeStart))
+        start = data.find(SYSV_PATH_PREFIX, lineEnd)
+    return mappings
+
+def getAllProcessesIds():
+    return [int(name) for name in os.listdir('/proc') if name.isdigit()]
+
+def findAttachingPids(shmids=None):
+    """
+    Dictionary of shmid to the list of pids that have it mapped, by going over the maps
+    of every process. Processes that exit or can not be read while scanning are skipped.
+    """
+    result = {}
+    if None != shmids:
+        shmids = set(shmids)
+        if not shmids:
+            return result
+    for pid in getAllProcessesIds():
+        try:
+            data = readMapsData(pid)
+        except Exception:
+            continue
+        if SYSV_PATH_PREFIX not in data:
+            continue
+        for shmid, address, size in getProcessShmMappings(pid, data):
+            if None != shmids and shmid not in shmids:
+                continue
+            pids = result.setdefault(shmid, [])
+            if pid not in pids:
+                pids.append(pid)
+    return result
+
+def getShmSegments(ownerFilter=None, keyFilter=None, isCollectingPids=True):
+    """
+    List of ShmSegment of the machine.
+    ownerFilter         - Only segments of this user name or uid
+    keyFilter           - Only segments with this key, or keys the function returns True for
+    isCollectingPids    - Find the pids that attach every segment, it reads the maps of all
+                          the processes, so it is only done for segments that are attached
+    """
+    segments = readSysVShm()
+    if None != ownerFilter:
+        if isinstance(ownerFilter, integer_types):
+            segments = [segment for segment in segments if ownerFilter == segment.uid]
+        else:
+            segments = [segment for segment in segments if ownerFilter == segment.owner]
+    if None != keyFilter:
+        if not hasattr(keyFilter, '__call__'):
+            keyFilter = (lambda key, value=keyFilter: value == key)
+        segments = [segment for segment in segments if keyFilter(segment.key)]
+    if isCollectingPids:
+        attachingPids = findAttachingPids([segment.shmid for segment in segments if 0 < segment.attachCount])
+        for segment in segments:
+            segment.attachingPids = attachingPids.get(segment.shmid, [])
+    return segments
+
+def getMemoryMapFromProc(pid):
+    """
+    List of (path, address, size, attributes) of the regions of /proc/<pid>/maps. The attributes
+    are Win32 page protection flags as the readers use, and anonymous regions have an empty path.
+    Utilities.getMemMapFromPMaap keeps the names and flags pmap gives.
+    """
+    return [(region.pathName, region.start, region.size, region.getAttributes()) for region in parseMaps(readMapsData(pid))]
+
+__all__ = [
+        "ShmSegment",
+        "isSysVShmSupported",
+        "readSysVShm",
+        "getShmSegments",
+        "getProcessShmMappings",
+        "findAttachingPids",
+        "getMemoryMapFromProc",
+        "uidToOwner" ]
@@ -1,3 +1,6 @@
 __all__ = [
         "SharedMemReader",
+        "ProcMaps",
+        "ShmDiscovery",
+        "PageMap",
         "PtraceMemReader" ]
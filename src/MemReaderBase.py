@@ -18,7 +18,6 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>
 
-from future.utils import bind_method
 from .Utilities import *
 from .RecursiveFind import *
 from .DumpBase import *
@@ -27,8 +26,39 @@ if 'WindowsError' not in globals():
     class WindowsError(Exception):
         pass
 
+# Default size of the chunks memory is scanned in
+SCAN_CHUNK_SIZE = 0x100000
+# Unreadable parts of a chunk are skipped at this granularity
+SCAN_PAGE_SIZE  = 0x1000
+
+def protectionToAttributes(isRead, isWrite, isExecute):
+    """ Win32 page protection of the access rights, as the attributes of memory regions are """
+    if isExecute:
+        if isWrite:
+            return 0x40 # PAGE_EXECUTE_READWRITE
+        if isRead:
+            return 0x20 # PAGE_EXECUTE_READ
+        return 0x10 # PAGE_EXECUTE
+    if isWrite:
+        return 0x04 # PAGE_READWRITE
+    if isRead:
+        return 0x02 # PAGE_READONLY
+    return 0x01 # PAGE_NOACCESS
+
+class OffsetsTrieNode( object ):
+    """ Node in the trie of offsets lists, address is the pointer read for it """
+    __slots__ = ('children', 'address')
+    def __init__(self):
+        self.children = {}
+        self.address = None
+
 class MemReaderBase( RecursiveFind, DumpBase ):
     """ Few basic functions for memory reader, still abstract """
+    # Attributes of memory regions use the Win32 page protection flags
+    READ_ATTRIBUTES_MASK    = 0xee # [0x20, 0x40, 0x80, 0x02, 0x04, 0x08]
+    WRITE_ATTRIBUTES_MASK   = 0xcc # [0x40, 0x80, 0x04, 0x08]
+    EXECUTE_ATTRIBUTES_MASK = 0xf0 # [0x10, 0x20, 0x40, 0x80]
+    ALL_ATTRIBUTES_MASK     = 0xff
     def __init__(self):
         for readerName, (dataSize, packer) in MemReaderInterface.READER_DESC.items():
             def readerCreator(dataSize, packer):
@@ -81,6 +111,71 @@ class MemReaderBase( RecursiveFind, DumpBase ):
             print("Offsets path contains a cycle")
         return result
 
+    def resolveOffsetsLists( self, start, offsetsLists ):
+        """
+        Resolves many offsets lists from the same start, like resolveOffsetsList does for one.
+        The lists are put in a trie so every shared prefix is read once, and all the pointers
+        of the same depth are read with one readAddrBatch.
+        Returns (results, failures), results has a list of pointers for every offsets list that
+        ends with -1 where it could not be resolved, failures maps the index of every list that
+        failed to the address that could not be read.
+        """
+        root = OffsetsTrieNode()
+        root.address = start
+        paths = []
+        for offsets in offsetsLists:
+            node = root
+            path = []
+            for offset in offsets:
+                child = node.children.get(offset)
+                if None == child:
+                    child = OffsetsTrieNode()
+                    node.children[offset] = child
+                node = child
+                path.append(node)
+            paths.append(path)
+        level = [root]
+        while level:
+            edges = []
+            for node in level:
+                for offset, child in node.children.items():
+                    edges.append((node.address + offset, child))
+            addresses = list(set([address for address, child in edges]))
+            values = dict(zip(addresses, self.readAddrBatch(addresses)))
+            level = []
+            for address, child in edges:
+                value = values[address]
+                if None == value:
+                    # Read failed, remember where
+                    child.address = ~address
+                else:
+                    child.address = value
+                    level.append(child)
+        results = []
+        failures = {}
+        for index, path in enumerate(paths):
+            result = [start]
+            for node in path:
+                if node.address < 0:
+                    failures[index] = ~node.address
+                    result.append(-1)
+                    break
+                result.append(node.address)
+            results.append(result)
+        return results, failures
+
+    def readAddrBatch(self, addresses):
+        """ Reads a pointer from every address, None where the read failed """
+        result = []
+        for address in addresses:
+            try:
+                result.append(self.readAddr(address))
+            except ReadError:
+                result.append(None)
+            except WindowsError:
+                result.append(None)
+        return result
+
     def readAddr(self, address):
         if 4 == self._POINTER_SIZE:
             return self.readUInt32(address)
@@ -105,6 +200,210 @@ class MemReaderBase( RecursiveFind, DumpBase ):
             if None != maxSize and bytesCounter > maxSize:
                 return result
 
+    def getMemoryRegions(self, attributesMask=None):
+        """
+        Returns the memory map as a list of (address, size, name, attributes) sorted by address.
+        attributesMask - When set, only regions that have any of these attributes are returned
+        """
+        memMap = self.getMemoryMap()
+        if isinstance(memMap, dict):
+            regions = [(address, info[1], info[0], info[2]) for address, info in memMap.items()]
+        else:
+            # Readers that only know the (name, start, end) of every region
+            regions = [(start, end - start, name, self.ALL_ATTRIBUTES_MASK) for name, start, end in memMap]
+        if None != attributesMask:
+            regions = [region for region in regions if 0 != (region[3] & attributesMask)]
+        regions.sort()
+        return regions
+
+    def getPageTable(self, isRefresh=False):
+        """
+        PageTable of the memory map, built on the first call and kept.
+        Readers of live memory should refresh it when their memory map changes.
+        """
+        pageTable = getattr(self, '_pageTable', None)
+        if isRefresh or None == pageTable:
+            from .PageTable import PageTable
+            pageTable = PageTable(self.getMemoryRegions())
+            self._pageTable = pageTable
+        return pageTable
+
+    def isAddressValidBatch(self, addresses):
+        """ isAddressValid of every address """
+        return [self.isAddressValid(address) for address in addresses]
+
+    def getMemoryRuns(self, attributesMask=None, nameFilter=None, regions=None):
+        """
+        Returns the (address, size) of every run of adjacent regions, sorted by address.
+        attributesMask  - Only regions that have any of these attributes
+        nameFilter      - Only regions with this string in their name, or a function of the name
+        regions         - List of (address, size) to use instead of the memory map
+        """
+        if None == regions:
+            regions = self.getMemoryRegions(attributesMask)
+            if None != nameFilter:
+                if not hasattr(nameFilter, '__call__'):
+                    nameFilter = (lambda name, text=nameFilter: text in (name or ''))
+                regions = [region for region in regions if nameFilter(region[2])]
+        runs = []
+        for region in sorted(regions):
+            address, size = region[0], region[1]
+            if 0 >= size:
+                continue
+            if runs and runs[-1][0] + runs[-1][1] >= address:
+                runStart, runSize = runs[-1]
+                runs[-1] = (runStart, max(runSize, address + size - runStart))
+            else:
+                runs.append((address, size))
+        return runs
+
+    def getResidentRuns(self, ranges):
+        """
+        The parts of the (address, size) ranges that may have data, without the pages that
+        were never touched and read as zeros. Readers that do not know which pages were
+        touched return the ranges as they are.
+        """
+        return list(ranges)
+
+    def isThreadSafe(self):
+        """
+        True when the reader can be read from threads other than the one that created it.
+        Readers that only work from one thread, like a ptrace tracer, return False.
+        """
+        return True
+
+    def isLive(self):
+        """
+        True when the memory may change while it is read, like the memory of a running process.
+        Whatever keeps data of a live reader must be refreshed, readers of dumps and files return False.
+        """
+        return False
+
+    def _getScanRuns(self, attributesMask, nameFilter, regions, overlap, isSkippingUntouched):
+        runs = self.getMemoryRuns(attributesMask, nameFilter, regions)
+        if not isSkippingUntouched:
+            return runs
+        # Every resident piece is read with overlap bytes of the untouched pages around it,
+        # so only what is all in zeros is not found
+        pieces = []
+        for runAddress, runSize in runs:
+            runEnd = runAddress + runSize
+            for address, size in self.getResidentRuns([(runAddress, runSize)]):
+                start = max(runAddress, address - overlap)
+                end = min(runEnd, address + size + overlap)
+                if pieces and pieces[-1][0] + pieces[-1][1] >= start:
+                    pieces[-1] = (pieces[-1][0], end - pieces[-1][0])
+                else:
+                    pieces.append((start, end - start))
+        return pieces
+
+    def _readChunkPieces(self, address, length, ownedSize):
+        """
+        Reads a chunk, and when part of it is not readable, the readable parts of it page by page.
+        Returns a list of (address, data, ownedSize)
+        """
+        try:
+            return [(address, self.readMemory(address, length), ownedSize)]
+        except (ReadError, WindowsError):
+            pass
+        pieces = []
+        ownedEnd = address + ownedSize
+        end = address + length
+        pieceStart = None
+        pieceData = []
+        pageStart = address
+        while pageStart < end:
+            pageEnd = min((pageStart - (pageStart % SCAN_PAGE_SIZE)) + SCAN_PAGE_SIZE, end)
+            try:
+                data = self.readMemory(pageStart, pageEnd - pageStart)
+            except (ReadError, WindowsError):
+                data = None
+            if None != data:
+                if None == pieceStart:
+                    pieceStart = pageStart
+                pieceData.append(data)
+            elif None != pieceStart:
+                pieces.append((pieceStart, b''.join(pieceData)))
+                pieceStart = None
+                pieceData = []
+            pageStart = pageEnd
+        if None != pieceStart:
+            pieces.append((pieceStart, b''.join(pieceData)))
+        return [(pieceStart, data, min(len(data), ownedEnd - pieceStart)) \
+                for pieceStart, data in pieces if pieceStart < ownedEnd]
+
+    def mapMemoryChunks(self, chunkFunction, chunkSize=SCAN_CHUNK_SIZE, overlap=0, attributesMask=None, nameFilter=None, regions=None, workers=None, isSkippingUntouched=False):
+        """
+        Yields chunkFunction(address, data, ownedSize) over the memory, chunk after chunk in address order.
+        Adjacent regions are read as one, and every chunk goes overlap bytes into the next one,
+        so anything up to overlap + 1 bytes long that starts in the first ownedSize bytes of
+        the data is found exactly once, even when it crosses a chunk or a region boundary.
+        Parts of a chunk that can not be read are skipped.
+        workers             - Number of threads that read and process chunks at the same time, ignored
+                              for readers that are not thread safe
+        isSkippingUntouched - Do not read the pages getResidentRuns leaves out, for scans that can
+                              not find anything in memory that is all zeros
+        """
+        def chunkRanges():
+            for runAddress, runSize in self._getScanRuns(attributesMask, nameFilter, regions, overlap, isSkippingUntouched):
+                runEnd = runAddress + runSize
+                address = runAddress
+                while address < runEnd:
+                    ownedSize = min(chunkSize, runEnd - address)
+                    yield (address, min(ownedSize + overlap, runEnd - address), ownedSize)
+                    address += ownedSize
+        def processChunk(chunkRange):
+            return [chunkFunction(*piece) for piece in self._readChunkPieces(*chunkRange)]
+        if None == workers or 1 >= workers or not self.isThreadSafe():
+            for chunkRange in chunkRanges():
+                for result in processChunk(chunkRange):
+                    yield result
+            return
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(workers)
+        try:
+            for results in pool.imap(processChunk, chunkRanges()):
+                for result in results:
+                    yield result
+        finally:
+            pool.terminate()
+
+    def iterMemoryChunks(self, chunkSize=SCAN_CHUNK_SIZE, overlap=0, attributesMask=None, nameFilter=None, regions=None):
+        """ Yields the (address, data, ownedSize) of every chunk, see mapMemoryChunks """
+        return self.mapMemoryChunks(lambda *piece: piece, chunkSize, overlap, attributesMask, nameFilter, regions)
+
+    def searchBytes(self, needles, alignment=1, attributesMask=None, nameFilter=None, chunkSize=SCAN_CHUNK_SIZE, regions=None, workers=None):
+        """
+        Yields (address, needle) of every place any of the needles is found, in address order.
+        Finds the matches that cross the boundary between adjacent regions.
+        needles         - Bytes or a list of bytes to look for
+        alignment       - Only matches at addresses that divide by it
+        attributesMask  - Only search regions with any of these attributes, like READ_ATTRIBUTES_MASK
+        nameFilter      - Only search regions with this string in their name, or a function of the name
+        workers         - Number of threads to search with, see mapMemoryChunks
+        """
+        if not isinstance(needles, (list, tuple)):
+            needles = [needles]
+        needles = list(needles)
+        if not needles or 0 in [len(needle) for needle in needles]:
+            raise Exception("Nothing to search for")
+        overlap = max([len(needle) for needle in needles]) - 1
+        # Untouched pages are all zeros, so they only have to be read to find zeros
+        isSkippingUntouched = 0 == len([needle for needle in needles if not needle.strip(b'\x00')])
+        def searchChunk(address, data, ownedSize):
+            hits = []
+            for index, needle in enumerate(needles):
+                pos = data.find(needle, 0, ownedSize + len(needle) - 1)
+                while -1 != pos:
+                    if 0 == (address + pos) % alignment:
+                        hits.append((address + pos, index))
+                    pos = data.find(needle, pos + 1, ownedSize + len(needle) - 1)
+            hits.sort()
+            return [(hitAddress, needles[index]) for hitAddress, index in hits]
+        for hits in self.mapMemoryChunks(searchChunk, chunkSize, overlap, attributesMask, nameFilter, regions, workers, isSkippingUntouched):
+            for hit in hits:
+                yield hit
+
     def getPointerSize(self):
         return self._POINTER_SIZE
 
@@ -8,18 +8,14 @@ from collections import namedtuple
 from ..ObjectWithStream import ObjectWithStream
 from bisect import bisect_left
 
-try:
-    import distorm3
-    IS_DISASSEMBLER_FOUND = True
-except ImportError as e:
-    IS_DISASSEMBLER_FOUND = False
-
 class MiniDump( MemReaderBase, GUIDisplayBase ):
     def __init__(self, dumpFile, isVerbose=False):
         if isVerbose:
             print("Loading mini dump")
         MemReaderBase.__init__(self)
         self._ENDIANITY = '<'
+        if not hasattr(dumpFile, 'read'):
+            dumpFile = open(dumpFile, 'rb')
         self.stream = ObjectWithStream(dumpFile)
         magic = self.stream.read(4)
         if b'MDMP' != magic:
@@ -600,15 +596,17 @@ class MiniDump( MemReaderBase, GUIDisplayBase ):
         return self._DATA[region[0]][offset:offset+length]
 
     def isAddressValid(self, addr):
-        if self.getRegionStartEnd(addr):
-            return True
-        return False
+        return self.getPageTable().isValid(addr)
+
+    def isAddressValidBatch(self, addresses):
+        return self.getPageTable().isValidBatch(addresses)
 
     def getEndianity(self):
         return self._ENDIANITY
 
     def disasm(self, addr, length=0x100, decodeType=1):
-        if IS_DISASSEMBLER_FOUND:
+        distorm3 = optionalImport('distorm3')
+        if None != distorm3:
             for opcode in distorm3.Decode(
                     addr,
                     self.readMemory(addr, length),
@@ -1,7 +1,8 @@
 
 from __future__ import print_function
-from builtins import bytes, bytearray, file
+from builtins import bytes, bytearray
 import io
+import zlib
 from ..Interfaces import ReadError
 from ..MemReaderBase import *
 from ..GUIDisplayBase import *
@@ -9,21 +10,17 @@ from ..Utilities import *
 from struct import unpack
 from .MiniDump import *
 
-try:
-    import distorm3
-    IS_DISASSEMBLER_FOUND = True
-except ImportError as e:
-    IS_DISASSEMBLER_FOUND = False
-
 def loadDump(dumpFile):
     if len(dumpFile) > 200:
+        # The data of the dump itself rather than a file name
         magic = dumpFile[:4]
+        dumpFile = io.BytesIO(dumpFile)
     else:
         with open(dumpFile, 'rb') as dump:
             magic = dump.read(4)
-    if 'NDMD' == magic:
+    if b'NDMD' == magic:
         return DumpReader(dumpFile)
-    elif 'MDMP' == magic:
+    elif b'MDMP' == magic:
         return MiniDump(dumpFile)
     else:
         raise Exception("Unknown magic {%r}", magic)
@@ -31,54 +28,77 @@ def loadDump(dumpFile):
 class DumpReader( MemReaderBase, GUIDisplayBase ):
     def __init__(self, dumpFile, isVerbose=False):
         MemReaderBase.__init__(self)
-        if isinstance(dumpFile, file):
+        if hasattr(dumpFile, 'read'):
             self.dumpFile = dumpFile
         else:
             self.dumpFile = io.open(dumpFile, 'rb')
         self._MEM_MAP = {}
         self._REGIONS = []
         self._DATA = {}
+        self._HOLES = []
         self._COMMENTS = ""
-        if 'NDMD' != self.dumpFile.read(4):
+        if b'NDMD' != self.dumpFile.read(4):
             raise Exception("This is not a NativDebugging dump file. Use FileReader to work with a raw dump")
         # Skip the size
         zero = self._dumpReadQword()
         if 0 != zero:
             raise Exception("Header parsing error")
         tag = self.dumpFile.read(4)
-        while '' != tag:
+        while 4 == len(tag):
             atomSize = self._dumpReadQword()
             if isVerbose:
                 print("New ATOM %s of size 0x%x at %d" % (tag, atomSize, self.dumpFile.tell()))
-            if 'INFO' == tag:
+            if b'INFO' == tag:
                 if atomSize != 9:
                     raise Exception("Parse error at %d" % self.dumpFile.tell())
                 self._POINTER_SIZE = self._dumpReadDword()
                 self._DEFAULT_DATA_SIZE = self._dumpReadDword()
-                self._ENDIANITY = self.dumpFile.read(1)
-            elif 'REGN' == tag:
+                self._ENDIANITY = self.dumpFile.read(1).decode('ascii')
+            elif b'REGN' == tag:
                 addr = self._dumpReadQword()
                 regionSize = self._dumpReadQword()
                 regionAttributes = self._dumpReadDword()
-                if 'NAME' != self.dumpFile.read(4):
+                if b'NAME' != self.dumpFile.read(4):
                     raise Exception("Parse error at %d" % self.dumpFile.tell())
                 nameLength = self._dumpReadQword()
                 if 0 == nameLength:
                     regionName = ''
                 else:
-                    regionName = self.dumpFile.read(nameLength)
+                    regionName = self.dumpFile.read(nameLength).decode('utf8', 'replace')
                 self._MEM_MAP[addr] = (regionName, regionSize, regionAttributes)
-            elif 'DATA' == tag:
+            elif b'DATA' == tag:
                 self._DATA[addr] = self.dumpFile.read(atomSize)
                 self._REGIONS.append((addr, addr + atomSize))
                 addr = None
                 regionSize = None
                 regionAttributes = None
-            elif 'CMNT' == tag:
+            elif b'ZDAT' == tag:
+                # A compressed chunk of the region, the parts of a region with no chunk are zeros
+                chunkAddress, chunkSize = unpack('>QQ', self.dumpFile.read(0x10))
+                if addr not in self._DATA:
+                    self._DATA[addr] = bytearray(regionSize)
+                    self._REGIONS.append((addr, addr + regionSize))
+                offset = chunkAddress - addr
+                self._DATA[addr][offset:offset + chunkSize] = zlib.decompress(self.dumpFile.read(atomSize - 0x10))
+            elif b'HOLS' == tag:
+                # (address, size) of the pages that were not touched when the dump was made
+                holes = self.dumpFile.read(atomSize)
+                for offset in range(0, len(holes), 0x10):
+                    self._HOLES.append(unpack('>QQ', holes[offset:offset + 0x10]))
+            elif b'CMNT' == tag:
                 self._COMMENTS = self.dumpFile.read(atomSize)
+            else:
+                self.dumpFile.seek(atomSize, 1)
 
             tag = self.dumpFile.read(4)
         self.dumpFile.close()
+        for addr, (regionName, regionSize, regionAttributes) in self._MEM_MAP.items():
+            if addr not in self._DATA:
+                # Compressed region that was all holes
+                self._DATA[addr] = bytearray(regionSize)
+                self._REGIONS.append((addr, addr + regionSize))
+            if isinstance(self._DATA[addr], bytearray):
+                self._DATA[addr] = bytes(self._DATA[addr])
 
     def _dumpReadDword(self):
         return unpack('>L', self.dumpFile.read(4))[0]
@@ -104,7 +124,8 @@ class DumpReader( MemReaderBase, GUIDisplayBase ):
                     break
 
     def disasm(self, addr, length=0x100, decodeType=1):
-        if IS_DISASSEMBLER_FOUND:
+        distorm3 = optionalImport('distorm3')
+        if None != distorm3:
             for opcode in distorm3.Decode(
                     addr,
                     self.readMemory(addr, length),
@@ -113,11 +134,14 @@ class DumpReader( MemReaderBase, GUIDisplayBase ):
         else:
             raise Exception("No disassembler module")
 
+    def getResidentRuns(self, ranges):
+        return subtractRanges(ranges, self._HOLES)
+
     def isAddressValid(self, addr):
-        for start, end in self._REGIONS:
-            if start <= addr and addr > end:
-                return True
-        return False
+        return self.getPageTable().isValid(addr)
+
+    def isAddressValidBatch(self, addresses):
+        return self.getPageTable().isValidBatch(addresses)
 
     def getRegionStartEnd(self, addr):
         for r in self._REGIONS:
@@ -0,0 +1,683 @@
+#
+#   MemoryServer.py
+#
+#   MemoryServer - Serves any memory reader over a Unix or TCP socket using a compact
+#   binary protocol, and the MemoryClient reader that talks to it
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+# Protocol:
+#   Every message is a MESSAGE_HEADER (opcode or status, payload length) followed by the payload.
+#   The client sends one request and reads one response, the server answers requests
+#   of every connection in order. All integers are little endian.
+#       HELLO           -> pointer size, default data size, endianity
+#       READ_BATCH      count, (address, length) * count -> (isOk, length, data) * count
+#       IS_VALID_BATCH  count, address * count -> one byte per address
+#       MEMORY_MAP      -> count, (address, size, attributes, name length, name) * count
+#       FIND_BYTES      start, length, max results, alignment, needle -> count, address * count
+#       INVALIDATE      -> Drops the server side page cache
+#       CLOSE           -> Ends the connection
+
+from __future__ import print_function
+from builtins import range
+import os
+import sys
+import socket
+import struct
+import threading
+from collections import OrderedDict
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .Interfaces import ReadError, MemReaderInterface
+from .MemReaderBase import MemReaderBase
+
+PROTOCOL_VERSION = 1
+
+OPCODE_HELLO            = 1
+OPCODE_READ_BATCH       = 2
+OPCODE_IS_VALID_BATCH   = 3
+OPCODE_MEMORY_MAP       = 4
+OPCODE_FIND_BYTES       = 5
+OPCODE_INVALIDATE       = 6
+OPCODE_CLOSE            = 7
+
+STATUS_OK           = 0
+STATUS_READ_ERROR   = 1
+STATUS_ERROR        = 2
+
+MESSAGE_HEADER  = struct.Struct('<BI')
+HELLO_RESPONSE  = struct.Struct('<BBBc')
+COUNT           = struct.Struct('<I')
+ADDRESS         = struct.Struct('<Q')
+READ_REQUEST    = struct.Struct('<QI')
+READ_RESPONSE   = struct.Struct('<BI')
+REGION          = struct.Struct('<QQIH')
+FIND_REQUEST    = struct.Struct('<QQII')
+
+# Largest single read the server does while searching
+SEARCH_CHUNK_SIZE = 0x100000
+# Largest read of one request of a READ_BATCH, and of all the requests of a batch together,
+# the client splits larger reads
+MAX_READ_LENGTH     = 0x1000000
+MAX_BATCH_LENGTH    = 0x4000000
+# Largest request the server accepts, a connection that sends a larger one is closed
+MAX_PAYLOAD_LENGTH  = 0x1000000
+# Pages the server caches for readers of memory that does not change
+DEFAULT_CACHED_PAGES = 0x400
+
+def _isUnixAddress(address):
+    return isinstance(address, str)
+
+def serve(reader, address, **kw):
+    """
+    Serves the reader until interrupted.
+    There is no authentication, anyone who can connect can read the memory, so serve on a Unix
+    socket or bind to localhost only, like ('127.0.0.1', port).
+    """
+    server = MemoryServer(reader, address, **kw)
+    try:
+        server.serveForever()
+    finally:
+        server.close()
+
+def connect(address, timeout=None, **kw):
+    return MemoryClient(address, timeout=timeout, **kw)
+
+class _TCPServer( socketserver.ThreadingTCPServer ):
+    allow_reuse_address = True
+    daemon_threads = True
+
+class _OwnerThreadCalls( object ):
+    """
+    Runs functions on the thread that created it. Other threads queue their calls and wait,
+    and the owner thread runs them with runPending.
+    """
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self._queue = queue.Queue()
+        self._isClosed = False
+
+    def isOwnerThread(self):
+        return threading.current_thread() is self.thread
+
+    def call(self, function, *args):
+        if self.isOwnerThread():
+            return function(*args)
+        if self._isClosed:
+            raise Exception("Memory server is not serving")
+        done = threading.Event()
+        result = []
+        self._queue.put((function, args, done, result))
+        done.wait()
+        isOk, value = result[0]
+        if not isOk:
+            raise value
+        return value
+
+    def _run(self, item):
+        function, args, done, result = item
+        try:
+            result.append((True, function(*args)))
+        except Exception as e:
+            result.append((False, e))
+        done.set()
+
+    def runPending(self, timeout):
+        """ Runs the queued calls, waits up to timeout for the first one """
+        try:
+            item = self._queue.get(True, timeout)
+        except queue.Empty:
+            return
+        while True:
+            self._run(item)
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def close(self):
+        """ Fails the calls that are still queued, and the calls to come """
+        self._isClosed = True
+        while True:
+            try:
+                function, args, done, result = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            result.append((False, Exception("Memory server is not serving")))
+            done.set()
+
+class _OwnerThreadReader( object ):
+    """ Reader whose methods run on the thread of an _OwnerThreadCalls """
+    def __init__(self, reader, calls):
+        self._reader = reader
+        self._calls = calls
+
+    def __getattr__(self, name):
+        method = getattr(self.__dict__['_reader'], name)
+        calls = self.__dict__['_calls']
+        def ownerThreadMethod(*args):
+            return calls.call(method, *args)
+        return ownerThreadMethod
+
+class PageCache( object ):
+    """
+    Keeps the last read pages of a reader, reads are done in whole pages.
+    Access to the reader is serialized, as readers are not expected to be read by many threads
+    at once. That does not make it safe for readers that only work from one thread, the
+    MemoryServer runs all the calls to those readers on the thread that created it.
+    """
+    def __init__(self, reader, pageSize=0x1000, maxPages=0x400):
+        self.reader = reader
+        self.pageSize = pageSize
+        self.maxPages = maxPages
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self._pages = OrderedDict()
+
+    def clear(self):
+        with self.lock:
+            self._pages.clear()
+
+    def _readPage(self, pageAddress):
+        page = self._pages.get(pageAddress)
+        if None != page:
+            self.hits += 1
+            return page
+        self.misses += 1
+        page = self.reader.readMemory(pageAddress, self.pageSize)
+        self._pages[pageAddress] = page
+        if len(self._pages) > self.maxPages:
+            self._pages.popitem(last=False)
+        return page
+
+    def readMemory(self, address, length):
+        with self.lock:
+            if 0 == self.maxPages:
+                return self.reader.readMemory(address, length)
+            pageSize = self.pageSize
+            pageAddress = address - (address % pageSize)
+            end = address + length
+            try:
+                data = []
+                while pageAddress < end:
+                    data.append(self._readPage(pageAddress))
+                    pageAddress += pageSize
+            except ReadError:
+                # Regions that do not cover whole pages are read as requested
+                return self.reader.readMemory(address, length)
+            offset = address % pageSize
+            return b''.join(data)[offset:offset + length]
+
+    def isAddressValid(self, address):
+        with self.lock:
+            return self.reader.isAddressValid(address)
+
+    def isAddressValidBatch(self, addresses):
+        with self.lock:
+            return self.reader.isAddressValidBatch(addresses)
+
+    def getMemoryMap(self):
+        with self.lock:
+            return self.reader.getMemoryRegions()
+
+class MemoryRequestHandler( socketserver.BaseRequestHandler ):
+    def setup(self):
+        self.cache = self.server.cache
+        self.handlers = {
+                OPCODE_HELLO            : self._hello,
+                OPCODE_READ_BATCH       : self._readBatch,
+                OPCODE_IS_VALID_BATCH   : self._isValidBatch,
+                OPCODE_MEMORY_MAP       : self._memoryMap,
+                OPCODE_FIND_BYTES       : self._findBytes,
+                OPCODE_INVALIDATE       : self._invalidate }
+        if socket.AF_INET == self.request.family:
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        stream = self.request.makefile('rb')
+        sock = self.request
+        try:
+            while True:
+                header = stream.read(MESSAGE_HEADER.size)
+                if len(header) < MESSAGE_HEADER.size:
+                    return
+                opcode, payloadLength = MESSAGE_HEADER.unpack(header)
+                if payloadLength > self.server.maxPayloadLength:
+                    response = ("Request of 0x%x bytes is too large" % payloadLength).encode('utf8')
+                    sock.sendall(MESSAGE_HEADER.pack(STATUS_ERROR, len(response)) + response)
+                    return
+                payload = stream.read(payloadLength)
+                if OPCODE_CLOSE == opcode:
+                    sock.sendall(MESSAGE_HEADER.pack(STATUS_OK, 0))
+                    return
+                handler = self.handlers.get(opcode)
+                try:
+                    if None == handler:
+                        raise Exception("Unknown opcode %d" % opcode)
+                    status, response = STATUS_OK, handler(payload)
+                except ReadError as e:
+                    status, response = STATUS_READ_ERROR, ADDRESS.pack(e.address or 0)
+                except Exception as e:
+                    status, response = STATUS_ERROR, str(e).encode('utf8')
+                sock.sendall(MESSAGE_HEADER.pack(status, len(response)) + response)
+        finally:
+            stream.close()
+
+    def _hello(self, payload):
+        reader = self.cache.reader
+        return HELLO_RESPONSE.pack(
+                PROTOCOL_VERSION,
+                reader.getPointerSize(),
+                reader.getDefaultDataSize(),
+                reader.getEndianity().encode('ascii'))
+
+    def _readBatch(self, payload):
+        count = COUNT.unpack_from(payload)[0]
+        requests = [READ_REQUEST.unpack_from(payload, COUNT.size + i * READ_REQUEST.size) for i in range(count)]
+        maxReadLength = self.server.maxReadLength
+        totalLength = 0
+        for address, length in requests:
+            if length > maxReadLength:
+                raise Exception("Read of 0x%x bytes at 0x%x is larger than 0x%x" % (length, address, maxReadLength))
+            totalLength += length
+        if totalLength > self.server.maxBatchLength:
+            raise Exception("Batch of 0x%x bytes is larger than 0x%x" % (totalLength, self.server.maxBatchLength))
+        result = []
+        for address, length in requests:
+            try:
+                data = self.cache.readMemory(address, length)
+            except ReadError:
+                result.append(READ_RESPONSE.pack(0, 0))
+                continue
+            result.append(READ_RESPONSE.pack(1, len(data)))
+            result.append(data)
+        return b''.join(result)
+
+    def _isValidBatch(self, payload):
+        count = COUNT.unpack_from(payload)[0]
+        addresses = struct.unpack_from('<%dQ' % count, payload, COUNT.size)
+        return bytes(bytearray([1 if isValid else 0 for isValid in self.cache.isAddressValidBatch(addresses)]))
+
+    def _memoryMap(self, payload):
+        regions = self.cache.getMemoryMap()
+        result = [COUNT.pack(len(regions))]
+        for address, size, name, attributes in regions:
+            name = str(name).encode('utf8')
+            result.append(REGION.pack(address, size, attributes & 0xffffffff, len(name)))
+            result.append(name)
+        return b''.join(result)
+
+    def _findBytes(self, payload):
+        start, length, maxResults, alignment = FIND_REQUEST.unpack_from(payload)
+        needle = payload[FIND_REQUEST.size:]
+        results = self.server.findBytes(needle, start, length, alignment, maxResults)
+        return COUNT.pack(len(results)) + b''.join([ADDRESS.pack(x) for x in results])
+
+    def _invalidate(self, payload):
+        self.cache.clear()
+        return b''
+
+class MemoryServer( object ):
+    """
+    Serves a memory reader to MemoryClient readers.
+    address is a path for a Unix socket, or a (host, port) tuple for TCP.
+    There is no authentication, anyone who can connect can read the memory, so use a Unix
+    socket or bind to localhost only, like ('127.0.0.1', port).
+    Reads go through a page cache of maxCachedPages pages. By default there is no cache for
+    live readers, like PtraceMemReader and SharedMemReader, as it would serve memory that
+    changed since it was cached. With a cache on a live reader, clients must call invalidate
+    whenever the target memory may have changed.
+    A single read is limited to maxReadLength bytes, all the reads of a batch to maxBatchLength,
+    and a request to maxPayloadLength bytes. Clients must be created with the same limits.
+    Every connection is handled on a thread of its own. When the reader is not thread safe, like
+    PtraceMemReader, the connections queue their reads, and serveForever runs them on the thread
+    that created the server. Such a reader can not be served with serveInThread.
+    """
+    def __init__(self, reader, address, pageSize=0x1000, maxCachedPages=None, maxReadLength=MAX_READ_LENGTH, maxBatchLength=MAX_BATCH_LENGTH, maxPayloadLength=MAX_PAYLOAD_LENGTH):
+        self.reader = reader
+        self.address = address
+        self._ownerCalls = None
+        isThreadSafe = getattr(reader, 'isThreadSafe', None)
+        if None != isThreadSafe and not isThreadSafe():
+            self._ownerCalls = _OwnerThreadCalls()
+            reader = _OwnerThreadReader(reader, self._ownerCalls)
+        if None == maxCachedPages:
+            isLive = getattr(reader, 'isLive', None)
+            if None != isLive and isLive():
+                maxCachedPages = 0
+            else:
+                maxCachedPages = DEFAULT_CACHED_PAGES
+        self.cache = PageCache(reader, pageSize, maxCachedPages)
+        if _isUnixAddress(address):
+            if not hasattr(socketserver, 'ThreadingUnixStreamServer'):
+                raise Exception("Unix sockets are not supported on this platform")
+            if os.path.exists(address):
+                os.remove(address)
+            self._server = socketserver.ThreadingUnixStreamServer(address, MemoryRequestHandler)
+            self._server.daemon_threads = True
+        else:
+            self._server = _TCPServer(address, MemoryRequestHandler)
+        self._server.cache = self.cache
+        self._server.findBytes = self.findBytes
+        self._server.maxReadLength = maxReadLength
+        self._server.maxBatchLength = maxBatchLength
+        self._server.maxPayloadLength = maxPayloadLength
+        self._thread = None
+        self._isServing = False
+        self._serveDone = None
+
+    def getAddress(self):
+        """ The bound address, useful when serving on TCP port 0 """
+        return self._server.server_address
+
+    def findBytes(self, needle, start, length, alignment=1, maxResults=0):
+        """ Addresses in [start, start + length) that hold needle, memory out of the regions is skipped """
+        results = []
+        end = start + length
+        if 0 == len(needle):
+            return results
+        for regionAddress, regionSize, name, attributes in self.cache.getMemoryMap():
+            regionStart = max(start, regionAddress)
+            regionEnd = min(end, regionAddress + regionSize)
+            if regionStart < regionEnd:
+                self._findInRange(needle, regionStart, regionEnd, alignment, maxResults, results)
+                if maxResults and len(results) >= maxResults:
+                    break
+        return results
+
+    def _findInRange(self, needle, address, end, alignment, maxResults, results):
+        needleLength = len(needle)
+        readSize = max(SEARCH_CHUNK_SIZE, needleLength * 2)
+        pageSize = self.cache.pageSize
+        while address < end:
+            chunkLength = min(readSize, end - address)
+            try:
+                with self.cache.lock:
+                    data = self.cache.reader.readMemory(address, chunkLength)
+            except ReadError:
+                # Skip to the next page
+                address += pageSize - (address % pageSize)
+                continue
+            offset = data.find(needle)
+            while -1 != offset:
+                if 0 == ((address + offset) % alignment):
+                    results.append(address + offset)
+                    if maxResults and len(results) >= maxResults:
+                        return
+                offset = data.find(needle, offset + 1)
+            if address + chunkLength >= end:
+                return
+            # Overlap the chunks so a needle on the edge is found
+            address += max(chunkLength - needleLength + 1, 1)
+
+    def invalidate(self):
+        self.cache.clear()
+
+    def serveForever(self, pollInterval=0.5):
+        """
+        Serves until close is called from another thread, or until interrupted.
+        A reader that is not thread safe must be served from the thread that created the server.
+        """
+        if None == self._ownerCalls:
+            self._server.serve_forever(pollInterval)
+            return
+        if not self._ownerCalls.isOwnerThread():
+            raise Exception("A reader that is not thread safe must be served from the thread that created the server")
+        self._isServing = True
+        self._serveDone = threading.Event()
+        self._startThread(pollInterval)
+        try:
+            while self._isServing:
+                self._ownerCalls.runPending(pollInterval)
+        finally:
+            self._stopThread()
+            self._ownerCalls.close()
+            self._serveDone.set()
+
+    def _startThread(self, pollInterval):
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(pollInterval,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _stopThread(self):
+        if None != self._thread:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+
+    def serveInThread(self, pollInterval=0.5):
+        """ pollInterval is also the longest close waits for the server thread """
+        if None != self._ownerCalls:
+            raise Exception("A reader that is not thread safe must be served with serveForever from the thread that created the server")
+        self._startThread(pollInterval)
+        return self._thread
+
+    def close(self):
+        if None != self._serveDone and not self._ownerCalls.isOwnerThread():
+            # Let serveForever end on the owner thread
+            self._isServing = False
+            self._serveDone.wait()
+        self._isServing = False
+        self._stopThread()
+        self._server.server_close()
+        if _isUnixAddress(self.address) and os.path.exists(self.address):
+            os.remove(self.address)
+
+class MemoryClient( MemReaderBase ):
+    """
+    Memory reader over a MemoryServer connection.
+    readMemoryBatch, readAddrBatch and isAddressValidBatch do many operations in a single round trip,
+    findBytes and scanValues run on the server.
+    maxReadLength, maxBatchLength and maxPayloadLength are the limits of the server, requests
+    are split to keep every round trip in them.
+    """
+    def __init__(self, address, timeout=None, maxReadLength=MAX_READ_LENGTH, maxBatchLength=MAX_BATCH_LENGTH, maxPayloadLength=MAX_PAYLOAD_LENGTH):
+        MemReaderBase.__init__(self)
+        self.maxReadLength = maxReadLength
+        self.maxBatchLength = maxBatchLength
+        # Most reads and addresses a single request can have without going over maxPayloadLength
+        self.maxBatchReads = (maxPayloadLength - COUNT.size) // READ_REQUEST.size
+        self.maxBatchAddresses = (maxPayloadLength - COUNT.size) // ADDRESS.size
+        if _isUnixAddress(address):
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket.settimeout(timeout)
+        self._socket.connect(address)
+        self._stream = self._socket.makefile('rb')
+        self._lock = threading.Lock()
+        self.address = address
+        version, pointerSize, defaultDataSize, endianity = HELLO_RESPONSE.unpack(self._request(OPCODE_HELLO))
+        if PROTOCOL_VERSION != version:
+            raise Exception("Unsupported memory server protocol version %d" % version)
+        self._POINTER_SIZE = pointerSize
+        self._DEFAULT_DATA_SIZE = defaultDataSize
+        self._ENDIANITY = endianity.decode('ascii')
+
+    def __del__(self):
+        # The server might be gone already, so do not wait for it
+        self._disconnect()
+
+    def _disconnect(self):
+        if None == getattr(self, '_socket', None):
+            return
+        self._stream.close()
+        self._socket.close()
+        self._socket = None
+
+    def close(self):
+        if None == self._socket:
+            return
+        try:
+            self._request(OPCODE_CLOSE)
+        finally:
+            self._disconnect()
+
+    def detach(self):
+        self.close()
+
+    def _request(self, opcode, payload=b''):
+        with self._lock:
+            self._socket.sendall(MESSAGE_HEADER.pack(opcode, len(payload)) + payload)
+            header = self._stream.read(MESSAGE_HEADER.size)
+            if len(header) < MESSAGE_HEADER.size:
+                raise Exception("Memory server closed the connection")
+            status, responseLength = MESSAGE_HEADER.unpack(header)
+            response = self._stream.read(responseLength)
+        if STATUS_READ_ERROR == status:
+            raise ReadError(ADDRESS.unpack(response)[0])
+        if STATUS_OK != status:
+            raise Exception("Memory server error: %s" % response.decode('utf8', 'replace'))
+        return response
+
+    def _readBatch(self, requests):
+        """ One READ_BATCH round trip, the requests must fit in the limits of the server """
+        payload = [COUNT.pack(len(requests))]
+        for address, length in requests:
+            payload.append(READ_REQUEST.pack(address, length))
+        response = self._request(OPCODE_READ_BATCH, b''.join(payload))
+        result = []
+        offset = 0
+        for i in range(len(requests)):
+            isOk, length = READ_RESPONSE.unpack_from(response, offset)
+            offset += READ_RESPONSE.size
+            if isOk:
+                result.append(response[offset:offset + length])
+                offset += length
+            else:
+                result.append(None)
+        return result
+
+    def readMemoryBatch(self, requests):
+        """
+        requests - List of (address, length)
+        Returns a list with the data of every request, or None where the read failed.
+        Reads larger than maxReadLength are split, and the requests are sent in as many
+        round trips as needed to keep every batch under maxBatchLength and maxBatchReads.
+        """
+        maxReadLength = self.maxReadLength
+        # (index of the request, address, length) of every piece
+        pieces = []
+        for index, (address, length) in enumerate(requests):
+            pieces.append((index, address, min(length, maxReadLength)))
+            for offset in range(maxReadLength, length, maxReadLength):
+                pieces.append((index, address + offset, min(length - offset, maxReadLength)))
+        datas = [[] for request in requests]
+        batch = []
+        batchLength = 0
+        for piece in pieces + [None]:
+            if batch and (None == piece or batchLength + piece[2] > self.maxBatchLength or len(batch) >= self.maxBatchReads):
+                for (index, address, length), data in zip(batch, self._readBatch([item[1:] for item in batch])):
+                    datas[index].append(data)
+                batch = []
+                batchLength = 0
+            if None != piece:
+                batch.append(piece)
+                batchLength += piece[2]
+        result = []
+        for data in datas:
+            if None in data:
+                result.append(None)
+            elif 1 == len(data):
+                result.append(data[0])
+            else:
+                result.append(b''.join(data))
+        return result
+
+    def readMemory(self, address, length):
+        data = self.readMemoryBatch([(address, length)])[0]
+        if None == data:
+            raise ReadError(address)
+        return data
+
+    def readAddrBatch(self, addresses):
+        pointerSize = self._POINTER_SIZE
+        packer = self._ENDIANITY + ('L' if 4 == pointerSize else 'Q')
+        result = []
+        for data in self.readMemoryBatch([(address, pointerSize) for address in addresses]):
+            if None == data:
+                result.append(None)
+            else:
+                result.append(struct.unpack(packer, data)[0])
+        return result
+
+    def isAddressValidBatch(self, addresses):
+        """ isAddressValid of every address, in round trips of up to maxBatchAddresses addresses """
+        addresses = list(addresses)
+        result = []
+        for start in range(0, len(addresses), self.maxBatchAddresses):
+            batch = addresses[start:start + self.maxBatchAddresses]
+            payload = COUNT.pack(len(batch)) + struct.pack('<%dQ' % len(batch), *batch)
+            response = bytearray(self._request(OPCODE_IS_VALID_BATCH, payload))
+            result.extend([0 != x for x in response])
+        return result
+
+    def isAddressValid(self, address):
+        return self.isAddressValidBatch([address])[0]
+
+    def getMemoryMap(self):
+        response = self._request(OPCODE_MEMORY_MAP)
+        count = COUNT.unpack_from(response)[0]
+        offset = COUNT.size
+        memMap = {}
+        for i in range(count):
+            address, size, attributes, nameLength = REGION.unpack_from(response, offset)
+            offset += REGION.size
+            name = response[offset:offset + nameLength].decode('utf8')
+            offset += nameLength
+            memMap[address] = (name, size, attributes)
+        return memMap
+
+    def findBytes(self, needle, start, length, alignment=1, maxResults=0):
+        """ Returns the addresses in [start, start + length) that hold needle, searched on the server """
+        if not isinstance(needle, bytes):
+            needle = bytes(needle)
+        payload = FIND_REQUEST.pack(start, length, maxResults, alignment) + needle
+        response = self._request(OPCODE_FIND_BYTES, payload)
+        count = COUNT.unpack_from(response)[0]
+        return list(struct.unpack_from('<%dQ' % count, response, COUNT.size))
+
+    def scanValues(self, value, start, length, dataType='UInt32', alignment=None, maxResults=0):
+        """ Returns the aligned addresses that hold value as dataType, searched on the server """
+        dataSize, packer = MemReaderInterface.READER_DESC[dataType]
+        if None == alignment:
+            alignment = dataSize
+        needle = struct.pack(self._ENDIANITY + packer, value)
+        return self.findBytes(needle, start, length, alignment, maxResults)
+
+    def invalidate(self):
+        """ Drops the server side page cache, needed when the target memory changed """
+        self._request(OPCODE_INVALIDATE)
+
+__all__ = [
+        "MAX_READ_LENGTH",
+        "MAX_BATCH_LENGTH",
+        "MAX_PAYLOAD_LENGTH",
+        "MemoryServer",
+        "MemoryClient",
+        "PageCache",
+        "serve",
+        "connect" ]
@@ -0,0 +1,216 @@
+#
+#   PageTable.py
+#
+#   PageTable - Page granular map of the valid and accessible memory of a reader,
+#   that answers validity and permission queries with a couple of lookups
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+# Usage:
+#   pageTable = reader.getPageTable()
+#   if pageTable.isWritable(address):
+#       ...
+#   isValid = pageTable.isValidArray(numpy.array(pointers, dtype=numpy.uint64))
+
+from bisect import bisect_right
+
+from .MemReaderBase import MemReaderBase
+from .Utilities import optionalImport
+
+PAGE_VALID      = 0x01
+PAGE_READ       = 0x02
+PAGE_WRITE      = 0x04
+PAGE_EXECUTE    = 0x08
+# The page is not covered by a single region, and is looked up in the regions list
+PAGE_PARTIAL    = 0x10
+
+DEFAULT_PAGE_SIZE   = 0x1000
+# Every leaf of the table has the flags of 2**16 pages, that is 256MB of 4K pages
+DEFAULT_LEAF_BITS   = 16
+
+def attributesToFlags(attributes):
+    """ Page flags of the Win32 page protection attributes of a region """
+    flags = PAGE_VALID
+    if 0 != (attributes & MemReaderBase.READ_ATTRIBUTES_MASK):
+        flags |= PAGE_READ
+    if 0 != (attributes & MemReaderBase.WRITE_ATTRIBUTES_MASK):
+        flags |= PAGE_WRITE
+    if 0 != (attributes & MemReaderBase.EXECUTE_ATTRIBUTES_MASK):
+        flags |= PAGE_EXECUTE
+    return flags
+
+class PageTable( object ):
+    """
+    Two level table of page flags, the directory maps the high bits of the page number
+    to a leaf bytearray of flags, so only the parts of a sparse 64 bit address space
+    that have memory take space.
+    Pages that are only partly covered by a region, like the edges of regions that are
+    not page aligned, are marked as partial and are looked up in the sorted regions.
+    """
+    def __init__(self, regions, pageSize=DEFAULT_PAGE_SIZE, leafBits=DEFAULT_LEAF_BITS):
+        """
+        regions     - List of (address, size, name, attributes) as returned by getMemoryRegions
+        pageSize    - Granularity of the table, must be a power of 2
+        leafBits    - log2 of the number of pages in every leaf of the table
+        """
+        if 0 >= pageSize or 0 != (pageSize & (pageSize - 1)):
+            raise Exception("Page size must be a power of 2")
+        self._pageSize = pageSize
+        self._pageShift = pageSize.bit_length() - 1
+        self._leafBits = leafBits
+        self._leafSize = 1 << leafBits
+        self._leafMask = self._leafSize - 1
+        self._leafShift = self._pageShift + leafBits
+        self._directory = {}
+        self._regions = []
+        self._starts = []
+        self._arrays = None
+        for region in sorted(regions):
+            if 0 < region[1]:
+                self._addRegion(region[0], region[1], attributesToFlags(region[3]))
+
+    def _leaf(self, leafIndex):
+        leaf = self._directory.get(leafIndex)
+        if None == leaf:
+            leaf = bytearray(self._leafSize)
+            self._directory[leafIndex] = leaf
+        return leaf
+
+    def _setPages(self, firstPage, endPage, flags):
+        """ Sets the flags of the pages from firstPage up to endPage """
+        page = firstPage
+        while page < endPage:
+            leafIndex = page >> self._leafBits
+            leafEnd = min(endPage, (leafIndex + 1) << self._leafBits)
+            start = page & self._leafMask
+            self._leaf(leafIndex)[start:start + (leafEnd - page)] = bytearray([flags]) * (leafEnd - page)
+            page = leafEnd
+
+    def _markPartial(self, page):
+        leaf = self._leaf(page >> self._leafBits)
+        leaf[page & self._leafMask] = PAGE_PARTIAL
+
+    def _addRegion(self, address, size, flags):
+        self._regions.append((address, address + size, flags))
+        self._starts.append(address)
+        end = address + size
+        firstPage = address >> self._pageShift
+        lastPage = (end - 1) >> self._pageShift
+        # Pages fully covered by the region
+        fullStart = (address + self._pageSize - 1) >> self._pageShift
+        fullEnd = end >> self._pageShift
+        if fullStart < fullEnd:
+            self._setPages(fullStart, fullEnd, flags)
+        if firstPage < fullStart or fullStart >= fullEnd:
+            self._markPartial(firstPage)
+        if lastPage >= fullEnd:
+            self._markPartial(lastPage)
+
+    def _regionFlags(self, address):
+        index = bisect_right(self._starts, address) - 1
+        if 0 <= index and address < self._regions[index][1]:
+            return self._regions[index][2]
+        return 0
+
+    def getPageSize(self):
+        return self._pageSize
+
+    def getFlags(self, address):
+        """ PAGE_VALID, PAGE_READ, PAGE_WRITE and PAGE_EXECUTE flags of the address, 0 when not mapped """
+        leaf = self._directory.get(address >> self._leafShift)
+        if None == leaf:
+            return 0
+        flags = leaf[(address >> self._pageShift) & self._leafMask]
+        if PAGE_PARTIAL == flags:
+            return self._regionFlags(address)
+        return flags
+
+    def isValid(self, address):
+        leaf = self._directory.get(address >> self._leafShift)
+        if None == leaf:
+            return False
+        flags = leaf[(address >> self._pageShift) & self._leafMask]
+        if PAGE_PARTIAL == flags:
+            return 0 != self._regionFlags(address)
+        return 0 != flags
+
+    def isReadable(self, address):
+        return 0 != (self.getFlags(address) & PAGE_READ)
+
+    def isWritable(self, address):
+        return 0 != (self.getFlags(address) & PAGE_WRITE)
+
+    def isExecutable(self, address):
+        return 0 != (self.getFlags(address) & PAGE_EXECUTE)
+
+    def isValidBatch(self, addresses):
+        """ List of isValid of every address, vectorized when numpy is installed """
+        if 0x40 <= len(addresses) and None != optionalImport('numpy'):
+            return self.isValidArray(addresses).tolist()
+        isValid = self.isValid
+        return [isValid(address) for address in addresses]
+
+    def _getArrays(self):
+        """ The leaves stacked to a single array, row 0 is all zeros for pages with no leaf """
+        if None == self._arrays:
+            numpy = optionalImport('numpy')
+            leavesKeys = sorted(self._directory.keys())
+            table = numpy.zeros((len(leavesKeys) + 1, self._leafSize), dtype=numpy.uint8)
+            for row, key in enumerate(leavesKeys):
+                table[row + 1] = numpy.frombuffer(bytes(self._directory[key]), dtype=numpy.uint8)
+            self._arrays = (numpy.array(leavesKeys, dtype=numpy.uint64), table)
+        return self._arrays
+
+    def classify(self, addresses):
+        """
+        Flags of every address of an array as a numpy uint8 array.
+        The flags of all the addresses are taken from the table at once, only addresses
+        in partial pages are looked up one by one.
+        """
+        numpy = optionalImport('numpy')
+        if None == numpy:
+            raise Exception("Classifying an array of addresses needs numpy")
+        addresses = numpy.asarray(addresses, dtype=numpy.uint64)
+        leavesKeys, table = self._getArrays()
+        pages = addresses >> numpy.uint64(self._pageShift)
+        keys = pages >> numpy.uint64(self._leafBits)
+        rows = numpy.searchsorted(leavesKeys, keys)
+        if len(leavesKeys):
+            isFound = leavesKeys[numpy.minimum(rows, len(leavesKeys) - 1)] == keys
+        else:
+            isFound = numpy.zeros(len(keys), dtype=bool)
+        rows = numpy.where(isFound, rows + 1, 0)
+        flags = table[rows, (pages & numpy.uint64(self._leafMask)).astype(numpy.intp)]
+        partial = numpy.flatnonzero(PAGE_PARTIAL == flags)
+        if len(partial):
+            flags[partial] = [self._regionFlags(address) for address in addresses[partial].tolist()]
+        return flags
+
+    def isValidArray(self, addresses):
+        """ numpy bool array of isValid of every address """
+        return 0 != self.classify(addresses)
+
+    def hasFlagsArray(self, addresses, flags):
+        """ numpy bool array, True where the address has all the flags """
+        return flags == (self.classify(addresses) & flags)
+
+__all__ = [
+        "PageTable",
+        "attributesToFlags",
+        "PAGE_VALID",
+        "PAGE_READ",
+        "PAGE_WRITE",
+        "PAGE_EXECUTE" ]
@@ -24,8 +24,13 @@ from ..Utilities import integer_types
 
 import sys
 from os import linesep
+from copy import copy
+from collections import OrderedDict, deque
 import struct
 
+def _functionOf(method):
+    return getattr(method, '__func__', method)
+
 def printPattern(pattern, depth=0):
     space = '  ' * depth
     for i, shape in enumerate(pattern):
@@ -81,7 +86,7 @@ class SearchContext( object ):
     def _memorySizeFootprint(self):
         itemNames = self._getItemNames()
         footprints = {}
-        items = [(getattr(self, 'OffsetOf' + name), getattr(self, 'FootprintOf' + name)) for name in itemNames]
+        items = [(getattr(self, 'OffsetOf' + name), getattr(self, 'FootprintOf' + name)) for name in itemNames if hasattr(self, 'FootprintOf' + name)]
         for offset, footprint in items:
             maxFootprint = max(footprints.get(offset, 0), footprint)
             footprints[offset] = maxFootprint
@@ -149,13 +154,130 @@ class SearchContext( object ):
 
         return result
 
-def CreatePatternsFinder( memReader, isSafeSearch=False, raiseOnNotFound=False ):
+def _snapshotContext(context, copies=None):
+    """
+    Copy of a context and of the contexts of its sub searches, as every read of a data type
+    fills the same context object, that the next read of it overwrites.
+    Contexts that are already snapshots are shared and not copied again.
+    """
+    if getattr(context, '_isSnapshot', False):
+        return context
+    if None == copies:
+        copies = {}
+    if id(context) in copies:
+        return copies[id(context)]
+    result = copy(context)
+    result._isSnapshot = True
+    copies[id(context)] = result
+    for name, item in list(context.__dict__.items()):
+        if name.startswith('_'):
+            continue
+        if isinstance(item, SearchContext):
+            setattr(result, name, _snapshotContext(item, copies))
+        elif isinstance(item, list) and [x for x in item if isinstance(x, SearchContext)]:
+            setattr(result, name, [_snapshotContext(x, copies) if isinstance(x, SearchContext) else x for x in item])
+    return result
+
+class SearchMemoEntry( object ):
+    IN_PROGRESS = 0
+    VALID       = 1
+    INVALID     = 2
+    def __init__(self, context, content):
+        self.state = self.IN_PROGRESS
+        self.context = context
+        # Keeps the sub pattern alive, so its id can not be reused while it is in the memo
+        self.content = content
+
+class SearchMemo( object ):
+    """
+    Results of sub searches done during a single search, keyed by (id of sub pattern, address).
+    Only the first match of every sub search is kept, as a snapshot of its context, and a sub
+    search that is reached again while it is still in progress (a cycle) is considered valid.
+    Sub searches in progress are never evicted, only maxSize finished ones are kept.
+    The key does not have the context the sub search is reached from, so a memo must not be
+    used with sub patterns that a function makes differently depending on the context, or
+    whose extra checks look at the _parent of the context.
+    """
+    def __init__(self, maxSize=0x10000):
+        self.maxSize = maxSize
+        self._entries = OrderedDict()
+        self._inProgress = {}
+        self.resetStats()
+
+    def resetStats(self):
+        self.hits = 0
+        self.misses = 0
+        self.cycles = 0
+        self.invalidHits = 0
+        self.evictions = 0
+
+    def clear(self):
+        self._entries.clear()
+        self._inProgress.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._inProgress.get(key, None)
+        if None == entry:
+            entry = self._entries.get(key, None)
+        if None == entry:
+            self.misses += 1
+        elif SearchMemoEntry.VALID == entry.state:
+            self.hits += 1
+        elif SearchMemoEntry.IN_PROGRESS == entry.state:
+            self.cycles += 1
+        else:
+            self.invalidHits += 1
+        return entry
+
+    def start(self, key, context, content):
+        entry = SearchMemoEntry(context, content)
+        self._inProgress[key] = entry
+        return entry
+
+    def finish(self, key, entry, state):
+        entry.state = state
+        if self._inProgress.get(key, None) is entry:
+            del self._inProgress[key]
+        if len(self._entries) >= self.maxSize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self._entries[key] = entry
+
+    def getStats(self):
+        return {
+                'size'          : len(self._entries),
+                'maxSize'       : self.maxSize,
+                'hits'          : self.hits,
+                'misses'        : self.misses,
+                'cycles'        : self.cycles,
+                'invalidHits'   : self.invalidHits,
+                'evictions'     : self.evictions }
+
+    def __repr__(self):
+        return 'SearchMemo size: %(size)d/%(maxSize)d hits: %(hits)d misses: %(misses)d cycles: %(cycles)d invalid hits: %(invalidHits)d evictions: %(evictions)d' % self.getStats()
+
+def CreatePatternsFinder( memReader, isSafeSearch=False, raiseOnNotFound=False, memoSize=None ):
     if not isinstance(memReader, MemReaderInterface):
         raise Exception("Mem Reader must be of MemReaderInterface type")
-    return PatternFinder(memReader, isSafeSearch=isSafeSearch, raiseOnNotFound=raiseOnNotFound)
+    return PatternFinder(memReader, isSafeSearch=isSafeSearch, raiseOnNotFound=raiseOnNotFound, memoSize=memoSize)
+
+# Markers the search engine handles itself, used to drop the alternatives of a sub search
+_SEARCH_CUT_MARK = object()
+_SEARCH_CUT      = object()
 
 class PatternFinder( object ):
-    def __init__(self, memReader, isSafeSearch=False, raiseOnNotFound=False):
+    def __init__(self, memReader, isSafeSearch=False, raiseOnNotFound=False, memoSize=None):
+        """
+        memReader       - Memory reader to search in
+        isSafeSearch    - Treat read errors as not found instead of raising them
+        raiseOnNotFound - Raise an exception when a shape is not found
+        memoSize        - When set, every search keeps up to that many results of n_struct_ptr
+                          sub searches, so objects that are pointed more than once are only
+                          validated once. Only the first match of a sub search is used then.
+        """
         self.memReader          = memReader
         self.isAddressValid     = memReader.isAddressValid
         self.readMemory         = memReader.readMemory
@@ -185,6 +307,8 @@ class PatternFinder( object ):
         else:
             self._search = self._unSafeSearch
         self.raiseOnNotFound = raiseOnNotFound
+        self.memoSize = memoSize
+        self.memo = None
 
     def getPointerSize(self):
         return self._POINTER_SIZE
@@ -200,11 +324,20 @@ class PatternFinder( object ):
         if None == context:
             context = SearchContext()
             context._root = context
+            if None != self.memoSize:
+                context._memo = SearchMemo(self.memoSize)
+                self.memo = context._memo
         self.debugContext = context
         if not pattern:
             yield context
             return
-        self.setPatternForSearch(pattern, context)
+        if hasattr(pattern, '__call__'):
+            pattern = self.evalPattern(pattern, startAddress, context)
+            if not pattern:
+                yield context
+                return
+        else:
+            self.setPatternForSearch(pattern, context)
         for result in self._search(pattern, startAddress, lastAddress, context):
             yield result
 
@@ -222,26 +355,204 @@ class PatternFinder( object ):
         return pattern
 
     def _safeSearch(self, pattern, startAddress, lastAddress=0, context=None):
-        try:
-            for result in self._unSafeSearch(pattern, startAddress, lastAddress, context):
-                yield result
-        except ReadError:
-            return
+        return self._backtrackSearch(pattern, startAddress, lastAddress, context, True)
 
     def _unSafeSearch(self, pattern, startAddress, lastAddress=0, context=None):
-        shape = pattern[0]
-        shape_search_range = shape.getValidRange(startAddress, lastAddress, context)
-        for shape_address, shape_offset in shape_search_range:
-            # Is this the shape we are looking for
-            for _ in shape.isValid(self, shape_address, shape_offset, context):
-                # Search the next shape if needed
-                if len(pattern) > 1:
-                    for result in self._search(pattern[1:], startAddress, shape_address + len(shape.data), context):
-                        yield result
+        return self._backtrackSearch(pattern, startAddress, lastAddress, context, False)
+
+    def _backtrackSearch(self, pattern, startAddress, lastAddress, context, isSafe):
+        """
+        Backtracking matcher that keeps its state on an explicit stack instead of nesting a
+        generator per shape, so patterns and pointer chains can be as deep as needed.
+        Every item on the stack is a generator of continuations and the ReadError scope it
+        runs in. A continuation is a linked list of ((task, args, scope), rest), where a None
+        scope means the task starts a new pattern suffix, and a None continuation means the
+        whole pattern matched.
+        On safe search, a ReadError drops the pattern suffix it happened in and everything
+        that was started from it, and the search goes on with the previous shape.
+        """
+        lastScope = 1
+        stack = [(self._shapeTask(None, lastScope, pattern, 0, startAddress, lastAddress, context), lastScope)]
+        while stack:
+            generator, scope = stack[-1]
+            try:
+                continuation = next(generator)
+            except StopIteration:
+                stack.pop()
+                continue
+            except ReadError:
+                if not isSafe:
+                    raise
+                while stack and stack[-1][1] >= scope:
+                    stack.pop()
+                continue
+            while None != continuation:
+                (task, args, taskScope), continuation = continuation
+                if _SEARCH_CUT_MARK is task:
+                    args[:] = [len(stack)]
+                elif _SEARCH_CUT is task:
+                    del stack[args[0]:]
                 else:
-                    # No more shapes in pattern
-                    yield context
-        # Shape not found
+                    if None == taskScope:
+                        lastScope += 1
+                        taskScope = lastScope
+                    stack.append((task(continuation, taskScope, *args), taskScope))
+                    break
+            else:
+                yield context
+
+    def _nextShapeContinuation(self, pattern, index, startAddress, lastAddress, context, continuation):
+        index += 1
+        if index < len(pattern):
+            return ((self._shapeTask, (pattern, index, startAddress, lastAddress, context), None), continuation)
+        return continuation
+
+    def _subSearchContinuation(self, subSearch, continuation):
+        pattern, address, context = subSearch
+        self.debugContext = context
+        if not pattern:
+            return continuation
+        self.setPatternForSearch(pattern, context)
+        return ((self._shapeTask, (pattern, 0, address, 0, context), None), continuation)
+
+    def _isShapeAccepted(self, shape, context):
+        value = getattr(context, shape.name)
+        setattr(context, shape.sizeOfName, len(shape.data))
+        if (not shape.extraCheck) or (True == shape.extraCheck(context, value)):
+            setattr(context, shape.footprintOfName, shape.data.memoryFootprint(self, value))
+            return True
+        return False
+
+    def _shapeTask(self, continuation, scope, pattern, index, startAddress, lastAddress, context):
+        """ Yields a continuation for every way pattern[index] can be matched """
+        shape = pattern[index]
+        shapeRange = shape.getValidRange(startAddress, lastAddress, context)
+        if _functionOf(type(shape).isValid) is not _functionOf(SHAPE.isValid):
+            for shapeAddress, shapeOffset in shapeRange:
+                for _ in shape.isValid(self, shapeAddress, shapeOffset, context):
+                    data = getattr(shape, 'data', None)
+                    shapeEnd = shapeAddress
+                    if None != data:
+                        shapeEnd += len(data)
+                    yield self._nextShapeContinuation(pattern, index, startAddress, shapeEnd, context, continuation)
+            return
+        name = shape.name
+        data = shape.data
+        kind = getDataTypeKind(data)
+        for shapeAddress, shapeOffset in shapeRange:
+            value = data.readValue(self, shapeAddress)
+            setattr(context, name, value)
+            setattr(context, shape.addressOfName, shapeAddress)
+            setattr(context, shape.offsetOfName, shapeOffset)
+            if DATA_KIND_VALUE == kind:
+                isFound = data.isValidValue(self, shapeAddress, value) and self._isShapeAccepted(shape, context)
+                if isFound:
+                    yield self._nextShapeContinuation(pattern, index, startAddress, shapeAddress + len(data), context, continuation)
+            elif DATA_KIND_GENERIC == kind:
+                isFound = False
+                for _ in data.isValid(self, shapeAddress, value):
+                    if self._isShapeAccepted(shape, context):
+                        isFound = True
+                        yield self._nextShapeContinuation(pattern, index, startAddress, shapeAddress + len(data), context, continuation)
+            else:
+                found = [False]
+                postArgs = (shape, shapeAddress, pattern, index, startAddress, context, found)
+                if DATA_KIND_SUB_SEARCH == kind:
+                    for subContinuation in self._subSearchContinuations(data, shapeAddress, value, context._root, scope, self._shapePostTask, postArgs, continuation):
+                        yield subContinuation
+                elif value or data.isZeroSizeValid:
+                    yield ((self._arrayItemTask, (data.array, shapeAddress, value, 0), scope), ((self._shapePostTask, postArgs + (value,), scope), continuation))
+                isFound = found[0]
+            if (not isFound) and self.raiseOnNotFound:
+                raise Exception("Shape not found: %r with data type: %r" % (name, data))
+
+    def _subSearchContinuations(self, data, address, value, root, scope, postTask, postArgs, continuation):
+        """
+        Yields the continuation that matches a sub search data type and then runs postTask
+        with postArgs and the matched value. Goes through the memo of the search, if there is one.
+        """
+        memo = getattr(root, '_memo', None)
+        key = None
+        if None != memo and hasattr(data, 'getMemoKey'):
+            key = data.getMemoKey(self, value)
+        if None == key:
+            subSearch = data.getSubSearch(self, address, value)
+            if None != subSearch:
+                yield self._subSearchContinuation(subSearch, ((postTask, postArgs + (value,), scope), continuation))
+            return
+        entry = memo.get(key)
+        if None != entry:
+            if SearchMemoEntry.VALID == entry.state:
+                cachedValue = copy(entry.context)
+                cachedValue._parent = value._parent
+                yield ((postTask, postArgs + (cachedValue,), scope), continuation)
+            elif SearchMemoEntry.IN_PROGRESS == entry.state:
+                yield ((postTask, postArgs + (entry.context,), scope), continuation)
+            return
+        entry = memo.start(key, value, data.content)
+        subSearch = data.getSubSearch(self, address, value)
+        if None != subSearch:
+            cutPoint = []
+            yield ((_SEARCH_CUT_MARK, cutPoint, None),
+                    self._subSearchContinuation(subSearch,
+                        ((self._memoStoreTask, (memo, key, entry, cutPoint, value, postTask, postArgs), scope), continuation)))
+        if SearchMemoEntry.IN_PROGRESS == entry.state:
+            memo.finish(key, entry, SearchMemoEntry.INVALID)
+
+    def _memoStoreTask(self, continuation, scope, memo, key, entry, cutPoint, value, postTask, postArgs):
+        """
+        Keeps a snapshot of the first match of a sub search and drops the rest of its alternatives.
+        The snapshot is the value the search goes on with, so the contexts that hold it do not
+        change when the data type is read again.
+        """
+        snapshot = _snapshotContext(value)
+        entry.context = snapshot
+        memo.finish(key, entry, SearchMemoEntry.VALID)
+        yield ((_SEARCH_CUT, cutPoint, None), ((postTask, postArgs + (snapshot,), scope), continuation))
+
+    def _shapePostTask(self, continuation, scope, shape, shapeAddress, pattern, index, startAddress, context, found, value):
+        """ Runs once the sub search of a composite data type matched """
+        setattr(context, shape.name, value)
+        if self._isShapeAccepted(shape, context):
+            found[0] = True
+            yield self._nextShapeContinuation(pattern, index, startAddress, shapeAddress + len(shape.data), context, continuation)
+
+    def _setArrayItem(self, context, item, address, value):
+        context.Item = value
+        context.AddressOfItem = address
+        context.OffsetOfItem = 0
+        context.SizeOfItem = len(item)
+        context.FootprintOfItem = item.memoryFootprint(self, value)
+
+    def _arrayItemTask(self, continuation, scope, items, address, contexts, itemIndex):
+        """ Yields a continuation for every way the items of an array from itemIndex on can be matched """
+        if len(contexts) == itemIndex:
+            yield continuation
+            return
+        item = items[itemIndex]
+        itemContext = contexts[itemIndex]
+        item.setForSearch(self, itemContext)
+        value = item.readValue(self, address)
+        kind = getDataTypeKind(item)
+        if DATA_KIND_VALUE == kind:
+            if item.isValidValue(self, address, value):
+                self._setArrayItem(itemContext, item, address, value)
+                yield ((self._arrayItemTask, (items, address + len(item), contexts, itemIndex + 1), scope), continuation)
+        elif DATA_KIND_GENERIC == kind:
+            for _ in item.isValid(self, address, value):
+                self._setArrayItem(itemContext, item, address, value)
+                yield ((self._arrayItemTask, (items, address + len(item), contexts, itemIndex + 1), scope), continuation)
+        elif DATA_KIND_SUB_SEARCH == kind:
+            postArgs = (items, address, contexts, itemIndex)
+            for subContinuation in self._subSearchContinuations(item, address, value, itemContext._root, scope, self._arrayItemPostTask, postArgs, continuation):
+                yield subContinuation
+        elif value or item.isZeroSizeValid:
+            yield ((self._arrayItemTask, (item.array, address, value, 0), scope), ((self._arrayItemPostTask, (items, address, contexts, itemIndex, value), scope), continuation))
+
+    def _arrayItemPostTask(self, continuation, scope, items, address, contexts, itemIndex, value):
+        item = items[itemIndex]
+        self._setArrayItem(contexts[itemIndex], item, address, value)
+        yield ((self._arrayItemTask, (items, address + len(item), contexts, itemIndex + 1), scope), continuation)
 
     def _genSetColor(self, displayContext, name, size, color, extraCheck=None):
         def tmpSetColor(context, value):
@@ -368,8 +679,9 @@ class SHAPE_INTERFACE(object):
         return 0
     def getName(self):
         return self.__class__.__name__
-    def GetValidRange(self, start, lastAddress=0, context=None):
+    def getValidRange(self, start, lastAddress=0, context=None):
         return [(lastAddress,0)]
+    GetValidRange = getValidRange
     def isValid(self, patFinder, address, offset, context):
         """ Pure virtual """
         raise NotImplementedError("Pure function call")
@@ -387,6 +699,10 @@ class SHAPE_WITH_NAME(SHAPE_INTERFACE):
 class SHAPE( SHAPE_WITH_NAME ):
     def __init__(self, name, place, data, extraCheckFunction=None, fromStart=False):
         super(SHAPE, self).__init__(name)
+        self.addressOfName   = 'AddressOf'   + name
+        self.offsetOfName    = 'OffsetOf'    + name
+        self.sizeOfName      = 'SizeOf'      + name
+        self.footprintOfName = 'FootprintOf' + name
         self.place      = place
         self.iterator   = xrangeWithOffset
         self.procIterator = xrangeFromContext
@@ -487,6 +803,45 @@ def _genGetValProc(name):
         return 'default'
     return _getValProc
 
+# How the search engine matches a data type
+DATA_KIND_GENERIC       = 0 # Anything that implements the isValid generator
+DATA_KIND_VALUE         = 1 # Valid at most once, decided by isValidValue
+DATA_KIND_SUB_SEARCH    = 2 # Valid when the pattern returned by getSubSearch is found
+DATA_KIND_ARRAY         = 3 # n_array, every item is matched in order
+_DATA_TYPES_KINDS = {}
+
+def _isValidByValue(self, patFinder, address, value):
+    if self.isValidValue(patFinder, address, value):
+        yield True
+
+def _isValidBySubSearch(self, patFinder, address, value):
+    subSearch = self.getSubSearch(patFinder, address, value)
+    if None == subSearch:
+        return
+    pattern, address, context = subSearch
+    for _ in patFinder.search(pattern, address, lastAddress=0, context=context):
+        yield True
+
+def getDataTypeKind(data):
+    """
+    Data types that keep the isValid of their base class can be matched by the search
+    engine directly, any data type that overrides isValid is matched using it.
+    """
+    dataType = type(data)
+    kind = _DATA_TYPES_KINDS.get(dataType, None)
+    if None == kind:
+        isValid = _functionOf(dataType.isValid)
+        if isValid is _isValidByValue:
+            kind = DATA_KIND_VALUE
+        elif isValid is _isValidBySubSearch:
+            kind = DATA_KIND_SUB_SEARCH
+        elif isValid is _functionOf(n_array.isValid):
+            kind = DATA_KIND_ARRAY
+        else:
+            kind = DATA_KIND_GENERIC
+        _DATA_TYPES_KINDS[dataType] = kind
+    return kind
+
 class DATA_TYPE( object ):
     def __init__(self, desc = ""):
         self.desc = desc
@@ -529,8 +884,9 @@ class n_anything( DATA_TYPE ):
         return self.datasize
     def readValue(self, *arg, **kw):
         return None
-    def isValid(self, patFinder, address, value):
-        yield True
+    def isValidValue(self, patFinder, address, value):
+        return True
+    isValid = _isValidByValue
 
 class n_pointer( DATA_TYPE ):
     def __init__(self, isNullValid=False, valueRange=None, **kw):
@@ -545,16 +901,15 @@ class n_pointer( DATA_TYPE ):
         return self.pointerSize
     def readValue(self, patFinder, address):
         return patFinder.readAddr(address)
-    def isValid(self, patFinder, address, value):
+    def isValidValue(self, patFinder, address, value):
         if self.isNullValid and 0 == value:
-            yield True
+            return True
         elif self.valueRange != None:
-            if  (value >= self.valueRange[0]) and \
+            return (value >= self.valueRange[0]) and \
                 (value < self.valueRange[1]) and \
-                (patFinder.isAddressValid(value)):
-                    yield True
-        elif patFinder.isAddressValid(value):
-            yield True
+                (patFinder.isAddressValid(value))
+        return patFinder.isAddressValid(value)
+    isValid = _isValidByValue
 
 class n_struct( DATA_TYPE ):
     def __init__(self, content, **kw):
@@ -576,10 +931,11 @@ class n_struct( DATA_TYPE ):
     def readValue(self, patFinder, address):
         self.context._val = address
         return self.context
-    def isValid(self, patFinder, address, value):
+    def getSubSearch(self, patFinder, address, value):
+        """ Returns the pattern, address and context the struct is made of """
         content = patFinder.evalPattern(self.content, address, value)
-        for _ in patFinder.search(content, address, lastAddress=0, context=value):
-            yield True
+        return (content, address, value)
+    isValid = _isValidBySubSearch
 
 class n_struct_ptr( n_pointer ):
     def __init__(self, content, **kw):
@@ -595,7 +951,7 @@ class n_struct_ptr( n_pointer ):
         total = super(n_pointer, self).memoryFootprint(patFinder, value)
         if not value._val:
             return total
-        total += ~self.context
+        total += ~value
         return total
     def __repr__(self):
         if self.context:
@@ -605,36 +961,47 @@ class n_struct_ptr( n_pointer ):
         ptr = patFinder.readAddr(address)
         self.context._val = ptr
         return self.context
-    def isValid(self, patFinder, address, value):
+    def getSubSearch(self, patFinder, address, value):
+        """ Returns the pattern, address and context pointed by, or None when the pointer is not valid """
         ptr = value._val
         if self.isNullValid and 0 == ptr:
-            yield True
-            return
+            return ([], ptr, self.context)
 
         if not patFinder.isAddressValid(ptr):
-            return
+            return None
 
         # To prevent reads from invalid memory during pattern search
         try:
             patFinder.readUInt8(ptr)
         except ReadError:
-            return
+            return None
 
         if self.valueRange != None:
             if  (ptr < self.valueRange[0]) or \
                 (ptr >= self.valueRange[1]):
-                    return
+                    return None
         content = patFinder.evalPattern(self.content, ptr, value)
-        for x in patFinder.search(content, ptr, lastAddress=0, context=self.context):
-            yield True
+        return (content, ptr, self.context)
+    def getMemoKey(self, patFinder, value):
+        """ Sub searches of the same content at the same address give the same result """
+        ptr = value._val
+        if 0 == ptr:
+            return None
+        if self.valueRange != None:
+            if  (ptr < self.valueRange[0]) or \
+                (ptr >= self.valueRange[1]):
+                    return None
+        return (id(self.content), ptr)
+    isValid = _isValidBySubSearch
 
 class DATA_TYPE_FAIL( DATA_TYPE ):
     def __len__(self):
         return 0
     def readValue(self, patFinder, address):
         return None
-    def isValid(self, patFinder, address, value):
-        return
+    def isValidValue(self, patFinder, address, value):
+        return False
+    isValid = _isValidByValue
 
 # At the time of the call to the switch the context must contain all the information needed to decide
 class n_switch( DATA_TYPE ):
@@ -671,12 +1038,9 @@ class n_switch( DATA_TYPE ):
         for shape in self.currentPattern:
             shape.setForSearch(patFinder, self.context)
         return self.context
-    def isValid(self, patFinder, address, value):
-        if [] == self.currentPattern:
-            yield True
-        else:
-            for x in patFinder.search(self.currentPattern, address, lastAddress=0, context=self.context):
-                yield True
+    def getSubSearch(self, patFinder, address, value):
+        return (self.currentPattern, address, self.context)
+    isValid = _isValidBySubSearch
 
 class n_number( DATA_TYPE ):
     def __init__(self, value=None, size=None, alignment=None, isSigned=False, endianity='=', **kw):
@@ -742,22 +1106,18 @@ class n_number( DATA_TYPE ):
                 result -= (maxPositive << 1)
         return result
 
-    def isValid(self, patFinder, address, value):
+    def isValidValue(self, patFinder, address, value):
         validValue = self.value
         if isinstance(validValue, tuple):
-            if value < self.value[1] and value >= self.value[0]:
-                yield True
+            return value < validValue[1] and value >= validValue[0]
         elif isinstance(validValue, integer_types):
-            if value == self.value:
-                yield True
-        elif isinstance(validValue, (list, set)):
-            if value in self.value:
-                yield True
-        elif isinstance(validValue, dict):
-            if value in self.value:
-                yield True
+            return value == validValue
+        elif isinstance(validValue, (list, set, dict)):
+            return value in validValue
         elif None == validValue:
-            yield True
+            return True
+        return False
+    isValid = _isValidByValue
 
     def __len__(self):
         return self.sizeOfData
@@ -842,13 +1202,13 @@ class n_flags( n_number ):
         n_number.__init__(self, **kw)
     def __repr__(self):
         return "Flags"
-    def isValid(self, patFinder, address, value):
+    def isValidValue(self, patFinder, address, value):
         if self.checkInvalidFlags:
             for bitIndex in range(self.sizeOfData * 8):
                 mask = 1 << bitIndex
                 if (0 != (value & mask)) and mask not in self.flagsDesc:
-                    return
-        yield True
+                    return False
+        return True
 
 class n_uint8( n_number ):
     def readValue(self, patFinder, address):
@@ -930,8 +1290,9 @@ class n_buffer( DATA_TYPE ):
         if hasattr(length, '__call__'):
             length = length(self.searchContext)
         return patFinder.readMemory(address, length)
-    def isValid(self, *arg, **kw):
-        yield True
+    def isValidValue(self, patFinder, address, value):
+        return True
+    isValid = _isValidByValue
 
 class n_string( DATA_TYPE ):
     NULL_TERM = None
@@ -990,31 +1351,32 @@ class n_string( DATA_TYPE ):
             return ''
         return result
 
-    def isValid(self, patFinder, address, value):
+    def isValidValue(self, patFinder, address, value):
         if self.isPrintable:
             if False == IsPrintable( value, isUnicode=self.isUnicode ):
-                return
+                return False
         if None != self.fixedValue:
             if self.isUnicode:
                 if (self.length * 2) > len(value):
-                    return
+                    return False
                 for i in range(self.length):
                     if self.isCaseSensitive:
                         if value[i*2] != self.fixedValue[i]:
-                            return
+                            return False
                         if value[i*2 + 1] != b'\x00':
-                            return
+                            return False
                     else:
                         if value[i*2].lower() != self.fixedValue[i].lower():
-                            return
+                            return False
                         if value[i*2 + 1] != b'\x00':
-                            return
+                            return False
             else:
                 if self.isCaseSensitive and value != self.fixedValue:
-                    return
+                    return False
                 elif (not self.isCaseSensitive) and value.lower() != self.fixedValue.lower():
-                    return
-        yield True
+                    return False
+        return True
+    isValid = _isValidByValue
 
 class n_array( DATA_TYPE ):
     def __init__(self, count, varType, varArgs=None, varKw=None, isZeroSizeValid=True, minimalArrays=True, **kw):
@@ -1096,8 +1458,257 @@ class n_array( DATA_TYPE ):
                 yield True
 
     def isValid(self, patFinder, address, values):
+        if 0 == len(values):
+            if self.isZeroSizeValid:
+                yield True
+            return
         for _ in self.recursiveIsValid(patFinder, address, values):
             yield True
-        if 0 == len(values) and self.isZeroSizeValid:
-            yield True
+
+class NodeRecord( object ):
+    """ A node of a list or a tree, read from memory in one piece """
+    __slots__ = ('address', 'index', 'depth', 'parent', 'data', '_endianity', '_pointerFormat')
+    def __init__(self, address, index, depth, parent, data, endianity, pointerFormat):
+        self.address    = address
+        self.index      = index
+        self.depth      = depth
+        self.parent     = parent
+        self.data       = data
+        self._endianity = endianity
+        self._pointerFormat = pointerFormat
+    def __repr__(self):
+        return 'Node %d @%08x depth %d' % (self.index, self.address, self.depth)
+    def __len__(self):
+        return len(self.data)
+    def unpack(self, fmt, offset=0):
+        return struct.unpack_from(self._endianity + fmt, self.data, offset)
+    def readAddr(self, offset):
+        return struct.unpack_from(self._pointerFormat, self.data, offset)[0]
+    def readUInt8(self, offset):
+        return struct.unpack_from(self._endianity + 'B', self.data, offset)[0]
+    def readUInt16(self, offset):
+        return struct.unpack_from(self._endianity + 'H', self.data, offset)[0]
+    def readUInt32(self, offset):
+        return struct.unpack_from(self._endianity + 'L', self.data, offset)[0]
+    def readUInt64(self, offset):
+        return struct.unpack_from(self._endianity + 'Q', self.data, offset)[0]
+
+class NodesWalker( object ):
+    """
+    Base of the lazy lists and trees walkers.
+    Nodes are followed without recursion, every node is read with a single readMemory,
+    and every node is visited at most once, so cycles end the walk.
+    After a walk:
+        count       - Number of nodes yielded
+        revisits    - Number of pointers to nodes that were already visited
+        error       - Address of a node that could not be read, or None
+    """
+    def __init__(self, reader, start, nodeSize, linkOffset=0, maxCount=None, endValues=(0,), raiseOnError=False):
+        """
+        reader      - Memory reader, or PatternFinder
+        start       - Pointer to the first node
+        nodeSize    - Number of bytes to read for every node
+        linkOffset  - Offset inside the node the pointers point to (for intrusive links)
+        maxCount    - Stop after that many nodes
+        endValues   - Pointer values that mean no node
+        raiseOnError - Raise a ReadError when a node can not be read, instead of ending the walk
+        """
+        self._reader = reader
+        self.start = start
+        self.nodeSize = nodeSize
+        self.linkOffset = linkOffset
+        self.maxCount = maxCount
+        self.endValues = frozenset(endValues)
+        self.raiseOnError = raiseOnError
+        endianity = reader.getEndianity()
+        self._endianity = endianity
+        if 4 == reader.getPointerSize():
+            self._pointerFormat = endianity + 'L'
+        else:
+            self._pointerFormat = endianity + 'Q'
+        self.count = 0
+        self.revisits = 0
+        self.error = None
+
+    def __repr__(self):
+        return '%s(0x%x)' % (self.__class__.__name__, self.start)
+
+    def _readNode(self, node):
+        address = node - self.linkOffset
+        try:
+            return address, self._reader.readMemory(address, self.nodeSize)
+        except ReadError:
+            self.error = address
+            if self.raiseOnError:
+                raise
+            return address, None
+
+    def addresses(self):
+        for node in self:
+            yield node.address
+
+class ListWalker( NodesWalker ):
+    def __init__(self, reader, start, nextOffset, nodeSize, **kw):
+        """ nextOffset - Offset of the next pointer inside the node """
+        NodesWalker.__init__(self, reader, start, nodeSize, **kw)
+        self.nextOffset = nextOffset
+
+    def __iter__(self):
+        unpackFrom = struct.unpack_from
+        pointerFormat = self._pointerFormat
+        nextOffset = self.nextOffset
+        endValues = self.endValues
+        maxCount = self.maxCount
+        visited = set()
+        self.count = 0
+        self.revisits = 0
+        self.error = None
+        node = self.start
+        parent = None
+        while node not in endValues:
+            if None != maxCount and self.count >= maxCount:
+                return
+            if node in visited:
+                self.revisits += 1
+                return
+            visited.add(node)
+            address, data = self._readNode(node)
+            if None == data:
+                return
+            yield NodeRecord(address, self.count, self.count, parent, data, self._endianity, pointerFormat)
+            self.count += 1
+            parent = address
+            node = unpackFrom(pointerFormat, data, nextOffset)[0]
+
+class TreeWalker( NodesWalker ):
+    def __init__(self, reader, start, childrenOffsets, nodeSize, maxDepth=None, isBreadthFirst=False, **kw):
+        """
+        childrenOffsets - Offsets of the children pointers inside the node
+        maxDepth        - Do not go deeper than that, the root is at depth 0
+        isBreadthFirst  - Walk level by level instead of depth first
+        """
+        NodesWalker.__init__(self, reader, start, nodeSize, **kw)
+        self.childrenOffsets = list(childrenOffsets)
+        self.maxDepth = maxDepth
+        self.isBreadthFirst = isBreadthFirst
+
+    def __iter__(self):
+        unpackFrom = struct.unpack_from
+        pointerFormat = self._pointerFormat
+        endValues = self.endValues
+        maxCount = self.maxCount
+        maxDepth = self.maxDepth
+        # Pushed reversed, so depth first pops the children in order
+        childrenOffsets = self.childrenOffsets[::-1]
+        if self.isBreadthFirst:
+            childrenOffsets = self.childrenOffsets
+        visited = set()
+        self.count = 0
+        self.revisits = 0
+        self.error = None
+        pending = deque()
+        if self.isBreadthFirst:
+            popNext = pending.popleft
+        else:
+            popNext = pending.pop
+        if self.start not in endValues:
+            pending.append((self.start, 0, None))
+        while pending:
+            if None != maxCount and self.count >= maxCount:
+                return
+            node, depth, parent = popNext()
+            if node in visited:
+                self.revisits += 1
+                continue
+            visited.add(node)
+            address, data = self._readNode(node)
+            if None == data:
+                return
+            yield NodeRecord(address, self.count, depth, parent, data, self._endianity, pointerFormat)
+            self.count += 1
+            if None != maxDepth and depth >= maxDepth:
+                continue
+            for offset in childrenOffsets:
+                child = unpackFrom(pointerFormat, data, offset)[0]
+                if child not in endValues:
+                    pending.append((child, depth + 1, address))
+
+def walkList(reader, start, nextOffset, nodeSize, **kw):
+    """ Lazily yields a NodeRecord for every node of the list, see NodesWalker for the options """
+    return ListWalker(reader, start, nextOffset, nodeSize, **kw)
+
+def walkTree(reader, start, childrenOffsets, nodeSize, **kw):
+    """ Lazily yields a NodeRecord for every node of the tree, see NodesWalker for the options """
+    return TreeWalker(reader, start, childrenOffsets, nodeSize, **kw)
+
+class n_list( n_pointer ):
+    """
+    Pointer to the head of a linked list. The value is a ListWalker that reads the nodes
+    only when it is iterated, so lists of any length cost nothing to match.
+    minCount nodes must be readable for the list to be valid.
+    """
+    def __init__(self, nextOffset, nodeSize, linkOffset=0, minCount=0, maxCount=None, endValues=(0,), **kw):
+        self.nextOffset = nextOffset
+        self.nodeSize   = nodeSize
+        self.linkOffset = linkOffset
+        self.minCount   = minCount
+        self.maxCount   = maxCount
+        self.endValues  = endValues
+        n_pointer.__init__(self, **kw)
+    def __repr__(self):
+        return 'LIST(next=+0x%x, size=0x%x)' % (self.nextOffset, self.nodeSize)
+    def readValue(self, patFinder, address):
+        return ListWalker(
+                patFinder,
+                patFinder.readAddr(address),
+                self.nextOffset,
+                self.nodeSize,
+                linkOffset=self.linkOffset,
+                maxCount=self.maxCount,
+                endValues=self.endValues)
+    def isValidValue(self, patFinder, address, value):
+        head = value.start
+        if head in value.endValues:
+            return self.isNullValid and 0 == self.minCount
+        if not n_pointer.isValidValue(self, patFinder, address, head - self.linkOffset):
+            return False
+        if 0 < self.minCount:
+            count = 0
+            for node in walkList(patFinder, head, self.nextOffset, self.nodeSize, linkOffset=self.linkOffset, maxCount=self.minCount, endValues=self.endValues):
+                count += 1
+            return count >= self.minCount
+        return True
+
+class n_tree( n_pointer ):
+    """
+    Pointer to the root of a tree. The value is a TreeWalker that reads the nodes only
+    when it is iterated.
+    """
+    def __init__(self, childrenOffsets, nodeSize, linkOffset=0, maxCount=None, maxDepth=None, isBreadthFirst=False, endValues=(0,), **kw):
+        self.childrenOffsets = childrenOffsets
+        self.nodeSize       = nodeSize
+        self.linkOffset     = linkOffset
+        self.maxCount       = maxCount
+        self.maxDepth       = maxDepth
+        self.isBreadthFirst = isBreadthFirst
+        self.endValues      = endValues
+        n_pointer.__init__(self, **kw)
+    def __repr__(self):
+        return 'TREE(children=%s, size=0x%x)' % (', '.join(['+0x%x' % x for x in self.childrenOffsets]), self.nodeSize)
+    def readValue(self, patFinder, address):
+        return TreeWalker(
+                patFinder,
+                patFinder.readAddr(address),
+                self.childrenOffsets,
+                self.nodeSize,
+                linkOffset=self.linkOffset,
+                maxCount=self.maxCount,
+                maxDepth=self.maxDepth,
+                isBreadthFirst=self.isBreadthFirst,
+                endValues=self.endValues)
+    def isValidValue(self, patFinder, address, value):
+        root = value.start
+        if root in value.endValues:
+            return self.isNullValid
+        return n_pointer.isValidValue(self, patFinder, address, root - self.linkOffset)
 
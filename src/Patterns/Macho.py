@@ -123,7 +123,7 @@ def GET_CMD_SIZE(context):
     return context._parent.size - context._parent.OffsetOfcmd_data
 
 MACHO_COMMAND_DEFAULT_PATTERN = [
-        SHAPE("data",   0,  BUFFER(size=GET_CMD_SIZE))
+        SHAPE("data",   0,  n_buffer(size=GET_CMD_SIZE))
         ]
 
 def IS_EXTENDED_NAME(context):
@@ -149,6 +149,33 @@ MACHO_ENCRYPTION_INFO_COMMAND_PATTERN = [
 MACHO_SOURCE_VERSION_COMMAND_PATTERN = [
         SHAPE("version",    0,  n_uint64()) ]
 
+# Protection bits of segments
+VM_PROT_READ    = 0x1
+VM_PROT_WRITE   = 0x2
+VM_PROT_EXECUTE = 0x4
+
+MACHO_SEGMENT_COMMAND_PATTERN = [
+        SHAPE("segname",    0,  n_buffer(size=16)),
+        SHAPE("vmaddr",     0,  n_uint32()),
+        SHAPE("vmsize",     0,  n_uint32()),
+        SHAPE("fileoff",    0,  n_uint32()),
+        SHAPE("filesize",   0,  n_uint32()),
+        SHAPE("maxprot",    0,  n_uint32()),
+        SHAPE("initprot",   0,  n_uint32()),
+        SHAPE("nsects",     0,  n_uint32()),
+        SHAPE("flags",      0,  n_uint32()) ]
+
+MACHO_SEGMENT_64_COMMAND_PATTERN = [
+        SHAPE("segname",    0,  n_buffer(size=16)),
+        SHAPE("vmaddr",     0,  n_uint64()),
+        SHAPE("vmsize",     0,  n_uint64()),
+        SHAPE("fileoff",    0,  n_uint64()),
+        SHAPE("filesize",   0,  n_uint64()),
+        SHAPE("maxprot",    0,  n_uint32()),
+        SHAPE("initprot",   0,  n_uint32()),
+        SHAPE("nsects",     0,  n_uint32()),
+        SHAPE("flags",      0,  n_uint32()) ]
+
 MACHO_DATA_COMMAND_PATTERN = [
         SHAPE("dataoff",    0,  n_uint32()),
         SHAPE("datasize",   0,  n_uint32()) ]
@@ -166,6 +193,8 @@ MACHO_CMD_PATTERN = [
             MACHO_COMMANDS_IDS["LC_DATA_IN_CODE"]           : MACHO_DATA_COMMAND_PATTERN,
             MACHO_COMMANDS_IDS["LC_DYLIB_CODE_SIGN_DRS"]    : MACHO_DATA_COMMAND_PATTERN,
             MACHO_COMMANDS_IDS["LC_ENCRYPTION_INFO"] : MACHO_ENCRYPTION_INFO_COMMAND_PATTERN,
+            MACHO_COMMANDS_IDS["LC_SEGMENT"]        : MACHO_SEGMENT_COMMAND_PATTERN,
+            MACHO_COMMANDS_IDS["LC_SEGMENT_64"]     : MACHO_SEGMENT_64_COMMAND_PATTERN,
             "default"   : MACHO_COMMAND_DEFAULT_PATTERN
             })),
         SHAPE("extra_data", 0,  n_buffer(size=lambda context:context.size - 8 - context.SizeOfcmd_data))
@@ -179,5 +208,8 @@ MACHO_HEADER_PATTERN = [
         SHAPE("ncmds",      0,  n_uint32()),
         SHAPE("sizeofcmds", 0,  n_uint32()),
         SHAPE("flags",      0,  n_flags(FLAGS_DESC, size=4)),
-        SHAPE("cmds",       0,  n_array("ncmds", STRUCT, (MACHO_CMD_PATTERN,))) ]
+        SHAPE("reserved",   0,  n_switch(lambda context: VALID_MAGICS[context.magic] in ('MH_MAGIC64', 'MH_CIGAM64'), {
+            True:  [SHAPE("reserved", 0, n_uint32())],
+            False: [] })),
+        SHAPE("cmds",       0,  n_array("ncmds", n_struct, (MACHO_CMD_PATTERN,))) ]
 
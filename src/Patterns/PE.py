@@ -36,6 +36,7 @@ VALID_MACHINE_TYPES = {
         0x0EBC  : "EBC",
         0x8664  : "AMD64",
         0x9041  : "M32R",
+        0xAA64  : "ARM64",
         0xC0EE  : "CEE" }
 
 VALID_SECTION_ALGINMENTS = {
@@ -81,91 +82,91 @@ DLL_CHARACTERISTICS_FALGS = {
     0x8000  : "TERMINAL_SERVER_AWARE" }
 
 ImageFileHeader = [
-        SHAPE("Machine",            0, c_uint16(list(VALID_MACHINE_TYPES.keys()))),
-        SHAPE("NumberOfSections",   0, c_uint16()),
+        SHAPE("Machine",            0, n_uint16(list(VALID_MACHINE_TYPES.keys()))),
+        SHAPE("NumberOfSections",   0, n_uint16()),
         SHAPE("TimeDateStamp",      0, n_ctime()),
-        SHAPE("PointerToSymTable",  0, c_uint32()),
-        SHAPE("NumberOfSymbols",    0, c_uint32()),
-        SHAPE("OptionalHeaderSize", 0, c_uint16()),
-        SHAPE("Characteristics",    0, c_uint16()) ]
+        SHAPE("PointerToSymTable",  0, n_uint32()),
+        SHAPE("NumberOfSymbols",    0, n_uint32()),
+        SHAPE("OptionalHeaderSize", 0, n_uint16()),
+        SHAPE("Characteristics",    0, n_uint16()) ]
 
 ImageSectionHeader = [
         SHAPE("Name",           0, n_buffer(size=8)),
-        SHAPE("VirtualSize",    0, c_uint32()),
-        SHAPE("VirtualAddress", 0, c_uint32()),
-        SHAPE("RawDataSize",  0, c_uint32()),
-        SHAPE("PointerToRawData", 0, c_uint32()),
-        SHAPE("PointerToRelocations", 0, c_uint32()),
-        SHAPE("PointerToLinenumbers", 0, c_uint32()),
-        SHAPE("NumberOfRelocations", 0, c_uint16()),
-        SHAPE("NumberOfLinenumbers", 0, c_uint16()),
-        SHAPE("Characteristics", 0, c_uint32()) ]
+        SHAPE("VirtualSize",    0, n_uint32()),
+        SHAPE("VirtualAddress", 0, n_uint32()),
+        SHAPE("RawDataSize",  0, n_uint32()),
+        SHAPE("PointerToRawData", 0, n_uint32()),
+        SHAPE("PointerToRelocations", 0, n_uint32()),
+        SHAPE("PointerToLinenumbers", 0, n_uint32()),
+        SHAPE("NumberOfRelocations", 0, n_uint16()),
+        SHAPE("NumberOfLinenumbers", 0, n_uint16()),
+        SHAPE("Characteristics", 0, n_uint32()) ]
 
 ImageDataDirectory = [
-        SHAPE("VirtualAddress",     0, c_uint32()),
-        SHAPE("Size",               0, c_uint32()) ]
+        SHAPE("VirtualAddress",     0, n_uint32()),
+        SHAPE("Size",               0, n_uint32()) ]
 
 ImageExportDirectory = [
-        SHAPE("Characteristics", 0, c_uint32()),
+        SHAPE("Characteristics", 0, n_uint32()),
         SHAPE("TimeDateStamp", 0, n_ctime()),
-        SHAPE("MajorVersion", 0, c_uint16()),
-        SHAPE("MinorVersion", 0, c_uint16()),
-        SHAPE("Name", 0, c_uint32()),
-        SHAPE("Base", 0, c_uint32()),
-        SHAPE("NumberOfFunctions", 0, c_uint32()),
-        SHAPE("NumberOfNames", 0, c_uint32()),
-        SHAPE("FunctionsAddress", 0, c_uint32()),
-        SHAPE("NamesAddress", 0, c_uint32()),
-        SHAPE("NameOrdinalsAddress", 0, c_uint32())
+        SHAPE("MajorVersion", 0, n_uint16()),
+        SHAPE("MinorVersion", 0, n_uint16()),
+        SHAPE("Name", 0, n_uint32()),
+        SHAPE("Base", 0, n_uint32()),
+        SHAPE("NumberOfFunctions", 0, n_uint32()),
+        SHAPE("NumberOfNames", 0, n_uint32()),
+        SHAPE("FunctionsAddress", 0, n_uint32()),
+        SHAPE("NamesAddress", 0, n_uint32()),
+        SHAPE("NameOrdinalsAddress", 0, n_uint32())
         ]
 
 ImageImportDescriptor = [
-        SHAPE("Characteristics", 0, c_uint32()),
+        SHAPE("Characteristics", 0, n_uint32()),
         SHAPE("TimeDateStamp", 0, n_ctime()),
-        SHAPE("ForwarderChain", 0, c_uint32()),
-        SHAPE("Name", 0, c_uint32()),
-        SHAPE("FirstThunk", 0, c_uint32())
+        SHAPE("ForwarderChain", 0, n_uint32()),
+        SHAPE("Name", 0, n_uint32()),
+        SHAPE("FirstThunk", 0, n_uint32())
         ]
 
 ImageDebugDirectory = [
-        SHAPE("Characteristics",  0, c_uint32()),
+        SHAPE("Characteristics",  0, n_uint32()),
         SHAPE("TimeDateStamp",    0, n_ctime()),
-        SHAPE("MajorVersion",     0, c_uint16()),
-        SHAPE("MinorVersion",     0, c_uint16()),
-        SHAPE("Type",             0, c_uint32()),
-        SHAPE("DataSize",         0, c_uint32()),
-        SHAPE("AddrOfRawData",    0, c_uint32()),
-        SHAPE("PointerToRawData", 0, c_uint32()) ]
+        SHAPE("MajorVersion",     0, n_uint16()),
+        SHAPE("MinorVersion",     0, n_uint16()),
+        SHAPE("Type",             0, n_uint32()),
+        SHAPE("DataSize",         0, n_uint32()),
+        SHAPE("AddrOfRawData",    0, n_uint32()),
+        SHAPE("PointerToRawData", 0, n_uint32()) ]
 
 ResourceDirectoryString = [
-        SHAPE("Length", 0,  c_uint16()),
+        SHAPE("Length", 0,  n_uint16()),
         SHAPE("Data",   0,  n_string(size="Length", isUnicode=True)) ]
 
 ResourceDataEntry = [
-        SHAPE("DataRVA",        0, c_uint32()),
-        SHAPE("DataEntrySize",  0, c_uint32()),
-        SHAPE("Codepage",       0, c_uint32()),
-        SHAPE("Reserved",       0, c_uint32(0)) ]
+        SHAPE("DataRVA",        0, n_uint32()),
+        SHAPE("DataEntrySize",  0, n_uint32()),
+        SHAPE("Codepage",       0, n_uint32()),
+        SHAPE("Reserved",       0, n_uint32(0)) ]
 
 ResourceDirectoryNameEntry = [
-        SHAPE("NameRVA",        0, c_uint32()),
-        SHAPE("DataEntryRVA",   0, c_uint32()),
+        SHAPE("NameRVA",        0, n_uint32()),
+        SHAPE("DataEntryRVA",   0, n_uint32()),
         ASSIGN("isDataEntry",       lambda pf, ctx: 0 == (ctx.DataEntryRVA & 0x80000000)),
         ASSIGN("subdirectoryRVA",   lambda pf, ctx: ctx.DataEntryRVA & 0x7fffffff) ]
 
 ResourceDirectoryIdEntry = [
-        SHAPE("Id",        0, c_uint32()),
-        SHAPE("DataEntryRVA",   0, c_uint32()),
+        SHAPE("Id",        0, n_uint32()),
+        SHAPE("DataEntryRVA",   0, n_uint32()),
         ASSIGN("isDataEntry",       lambda pf, ctx: 0 == (ctx.DataEntryRVA & 0x80000000)),
         ASSIGN("subdirectoryRVA",   lambda pf, ctx: ctx.DataEntryRVA & 0x7fffffff) ]
 
 ImageResourceDirectory = [
-        SHAPE("Characteristics",  0, c_uint32()),
+        SHAPE("Characteristics",  0, n_uint32()),
         SHAPE("TimeDateStamp",    0, n_ctime()),
-        SHAPE("MajorVersion",     0, c_uint16()),
-        SHAPE("MinorVersion",     0, c_uint16()),
-        SHAPE("NumOfNamedEntries", 0, c_uint16()),
-        SHAPE("NumOfIdEntries",   0, c_uint16()),
+        SHAPE("MajorVersion",     0, n_uint16()),
+        SHAPE("MinorVersion",     0, n_uint16()),
+        SHAPE("NumOfNamedEntries", 0, n_uint16()),
+        SHAPE("NumOfIdEntries",   0, n_uint16()),
         SHAPE("NamedEntries",   0,
             n_array("NumOfNamedEntries",  n_struct, (ResourceDirectoryNameEntry,))),
         SHAPE("IdEntries",   0,
@@ -186,12 +187,12 @@ RESOURCE_TYPES = {
         16  : "VERSION" }
 
 ResourceVersionInfo = [
-        SHAPE("VersionLength",  0,  c_uint16()),
-        SHAPE("ValueLength",    0,  c_uint16()),
-        SHAPE("dataType",       0,  c_uint16([0,1])),
+        SHAPE("VersionLength",  0,  n_uint16()),
+        SHAPE("ValueLength",    0,  n_uint16()),
+        SHAPE("dataType",       0,  n_uint16([0,1])),
         SHAPE("VsVersionInfoStr",   0,  n_string(fixedValue="VS_VERSION_INFO", isUnicode=True)),
-        SHAPE("Algin",          0,  c_uint32(0)),
-        SHAPE("Vs_FixedFileInfo",   0,  c_uint32(0xfeef04bd)) ]
+        SHAPE("Algin",          0,  n_uint32(0)),
+        SHAPE("Vs_FixedFileInfo",   0,  n_uint32(0xfeef04bd)) ]
 
 def getAllResData(pe, offset=0, isDir=True):
     resAddr = None
@@ -229,52 +230,52 @@ def getAllResData(pe, offset=0, isDir=True):
             getAllResData(resAddr, pe, item.subdirectoryRVA, True)
 
 ImageOptionalHeader = [
-        SHAPE("Magic",              0,  c_uint16(list(VALID_PE_FORMATS.keys()))),
-        SHAPE("MajorLinkerVersion", 0,  BYTE()),
-        SHAPE("MinorLinkerVersion", 0,  BYTE()),
-        SHAPE("CodeSize",         0,  c_uint32()),
-        SHAPE("InitializedDataSize", 0, c_uint32()),
-        SHAPE("UninitializedDataSize", 0, c_uint32()),
-        SHAPE("EntryPointAddress", 0, c_uint32()),
-        SHAPE("BaseOfCode",         0, c_uint32()),
+        SHAPE("Magic",              0,  n_uint16(list(VALID_PE_FORMATS.keys()))),
+        SHAPE("MajorLinkerVersion", 0,  n_uint8()),
+        SHAPE("MinorLinkerVersion", 0,  n_uint8()),
+        SHAPE("CodeSize",         0,  n_uint32()),
+        SHAPE("InitializedDataSize", 0, n_uint32()),
+        SHAPE("UninitializedDataSize", 0, n_uint32()),
+        SHAPE("EntryPointAddress", 0, n_uint32()),
+        SHAPE("BaseOfCode",         0, n_uint32()),
         SHAPE("BaseOfDataImageBase", 0, n_switch( "Magic",
             {
                 PE32_MAGIC  : [
-                    SHAPE("BaseOfData",         0, c_uint32()),
-                    SHAPE("ImageBase",          0, c_uint32()) ],
+                    SHAPE("BaseOfData",         0, n_uint32()),
+                    SHAPE("ImageBase",          0, n_uint32()) ],
                 PE32P_MAGIC : [
-                    SHAPE("ImageBase",          0, c_uint64()) ],
+                    SHAPE("ImageBase",          0, n_uint64()) ],
                 "default" : [
-                    SHAPE("ImageBase",          0, c_uint64()) ] }) ),
-        SHAPE("SectionAlignment",   0, c_uint32()), #list(VALID_SECTION_ALGINMENTS.keys()))),
-        SHAPE("FileAlignment",      0, c_uint32()),
-        SHAPE("MajorOSVersion", 0, c_uint16()),
-        SHAPE("MinorOSVersion", 0, c_uint16()),
-        SHAPE("MajorImageVer",  0, c_uint16()),
-        SHAPE("MinorImageVer",  0, c_uint16()),
-        SHAPE("MajorSubsystemVer", 0, c_uint16()),
-        SHAPE("MinorSubsystemVer", 0, c_uint16()),
-        SHAPE("Win32VersionValue",  0, c_uint32()),
-        SHAPE("ImageSize",        0, c_uint32()),
-        SHAPE("HeadersSize",      0, c_uint32()),
-        SHAPE("CheckSum",           0, c_uint32()),
-        SHAPE("Subsystem",          0, c_uint16(list(WINDOWS_SUBSYSTEMS.keys()))),
+                    SHAPE("ImageBase",          0, n_uint64()) ] }) ),
+        SHAPE("SectionAlignment",   0, n_uint32()), #list(VALID_SECTION_ALGINMENTS.keys()))),
+        SHAPE("FileAlignment",      0, n_uint32()),
+        SHAPE("MajorOSVersion", 0, n_uint16()),
+        SHAPE("MinorOSVersion", 0, n_uint16()),
+        SHAPE("MajorImageVer",  0, n_uint16()),
+        SHAPE("MinorImageVer",  0, n_uint16()),
+        SHAPE("MajorSubsystemVer", 0, n_uint16()),
+        SHAPE("MinorSubsystemVer", 0, n_uint16()),
+        SHAPE("Win32VersionValue",  0, n_uint32()),
+        SHAPE("ImageSize",        0, n_uint32()),
+        SHAPE("HeadersSize",      0, n_uint32()),
+        SHAPE("CheckSum",           0, n_uint32()),
+        SHAPE("Subsystem",          0, n_uint16(list(WINDOWS_SUBSYSTEMS.keys()))),
         SHAPE("DllCharacteristics", 0, n_flags(DLL_CHARACTERISTICS_FALGS, size=2)),
         SHAPE("Stack", 0, n_switch( lambda ctx: ctx.Magic,
             {
                 PE32_MAGIC  : [
-                    SHAPE("StackReserveSize", 0, c_uint32()),
-                    SHAPE("StackCommitSize",  0, c_uint32()),
-                    SHAPE("HeapReserveSize",  0, c_uint32()),
-                    SHAPE("HeapCommitSize",   0, c_uint32()) ],
+                    SHAPE("StackReserveSize", 0, n_uint32()),
+                    SHAPE("StackCommitSize",  0, n_uint32()),
+                    SHAPE("HeapReserveSize",  0, n_uint32()),
+                    SHAPE("HeapCommitSize",   0, n_uint32()) ],
                 PE32P_MAGIC  : [
-                    SHAPE("StackReserveSize", 0, c_uint64()),
-                    SHAPE("StackCommitSize",  0, c_uint64()),
-                    SHAPE("HeapReserveSize",  0, c_uint64()),
-                    SHAPE("HeapCommitSize",   0, c_uint64()) ]
+                    SHAPE("StackReserveSize", 0, n_uint64()),
+                    SHAPE("StackCommitSize",  0, n_uint64()),
+                    SHAPE("HeapReserveSize",  0, n_uint64()),
+                    SHAPE("HeapCommitSize",   0, n_uint64()) ]
                 }) ),
-        SHAPE("LoaderFlags",        0, c_uint32(0)),
-        SHAPE("NumOfRvaAndSizes", 0, c_uint32()),
+        SHAPE("LoaderFlags",        0, n_uint32(0)),
+        SHAPE("NumOfRvaAndSizes", 0, n_uint32()),
         SHAPE("ExportDir",      0, n_struct(ImageDataDirectory)),
         SHAPE("ImportDir",      0, n_struct(ImageDataDirectory)),
         SHAPE("ResDir",         0, n_struct(ImageDataDirectory)),
@@ -301,24 +302,24 @@ ImageNtHeaders = [
 
 ImageDosHeader = [
         SHAPE("e_magic", 0, n_string(fixedValue=b"MZ")),
-        SHAPE("e_cblp", 0, c_uint16()),
-        SHAPE("e_cp", 0, c_uint16()),
-        SHAPE("e_crlc", 0, c_uint16()),
-        SHAPE("e_cparhdr", 0, c_uint16()),
-        SHAPE("e_minalloc", 0, c_uint16()),
-        SHAPE("e_maxalloc", 0, c_uint16()),
-        SHAPE("e_ss", 0, c_uint16()),
-        SHAPE("e_sp", 0, c_uint16()),
-        SHAPE("e_csum", 0, c_uint16()),
-        SHAPE("e_ip", 0, c_uint16()),
-        SHAPE("e_cs", 0, c_uint16()),
-        SHAPE("e_lfarlc", 0, c_uint16()),
-        SHAPE("e_ovno", 0, c_uint16()),
-        SHAPE("e_res", 0, n_array(4, c_uint16, ())),
-        SHAPE("e_oemid", 0, c_uint16()),
-        SHAPE("e_oeminfo", 0, c_uint16()),
-        SHAPE("e_res2", 0, n_array(10, c_uint16, ())),
-        SHAPE("e_lfanew", 0, c_uint32()),
+        SHAPE("e_cblp", 0, n_uint16()),
+        SHAPE("e_cp", 0, n_uint16()),
+        SHAPE("e_crlc", 0, n_uint16()),
+        SHAPE("e_cparhdr", 0, n_uint16()),
+        SHAPE("e_minalloc", 0, n_uint16()),
+        SHAPE("e_maxalloc", 0, n_uint16()),
+        SHAPE("e_ss", 0, n_uint16()),
+        SHAPE("e_sp", 0, n_uint16()),
+        SHAPE("e_csum", 0, n_uint16()),
+        SHAPE("e_ip", 0, n_uint16()),
+        SHAPE("e_cs", 0, n_uint16()),
+        SHAPE("e_lfarlc", 0, n_uint16()),
+        SHAPE("e_ovno", 0, n_uint16()),
+        SHAPE("e_res", 0, n_array(4, n_uint16, ())),
+        SHAPE("e_oemid", 0, n_uint16()),
+        SHAPE("e_oeminfo", 0, n_uint16()),
+        SHAPE("e_res2", 0, n_array(10, n_uint16, ())),
+        SHAPE("e_lfanew", 0, n_uint32()),
         SHAPE("PE", lambda ctx, addr: (addr + ctx.e_lfanew, ctx.e_lfanew), n_struct(ImageNtHeaders))
         ]
 
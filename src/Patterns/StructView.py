@@ -0,0 +1,331 @@
+#
+#   StructView.py
+#
+#   StructView - Fixed layout views of objects found by the PatternFinder, that refresh
+#   all of their fields with a single read
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+# Usage:
+#   result = patFinder.searchOne(pattern, address)
+#   view = compileView(reader, result)
+#   while True:
+#       view.refresh()
+#       for name, (old, new) in view.changes.items():
+#           print(name, old, new)
+
+from ..Interfaces import ReadError
+from ..Utilities import integer_types
+from .Finder import SearchContext
+
+import struct
+
+INTEGER_FORMATS = {1 : 'B', 2 : 'H', 4 : 'L', 8 : 'Q'}
+SIGNED_FORMATS  = {1 : 'b', 2 : 'h', 4 : 'l', 8 : 'q'}
+FLOAT_FORMATS   = {4 : 'f', 8 : 'd'}
+
+def compileView(reader, context, followDepth=1, fieldsFormats=None):
+    """
+    Compiles the layout of a search result and returns a view of it.
+    followDepth     - How many levels of struct pointers to follow
+    fieldsFormats   - Dict of field name to struct format char, for fields that can not be
+                      told from their value, like signed numbers that are positive
+    """
+    return StructView(reader, compileLayout(context, reader.getPointerSize(), reader.getEndianity(), followDepth, fieldsFormats), context._val if hasattr(context, '_val') else None, context)
+
+def compilePattern(patFinder, pattern, address, followDepth=1, fieldsFormats=None):
+    """ Searches the pattern once at address and returns a view of the result, None if not found """
+    for result in patFinder.search(pattern, address):
+        return StructView(patFinder.memReader, compileLayout(result, patFinder.getPointerSize(), patFinder.getEndianity(), followDepth, fieldsFormats), None, result)
+    return None
+
+def _contextBase(context):
+    """ The address the fields of a context are relative to """
+    if hasattr(context, '_val'):
+        return context._val
+    addresses = [getattr(context, name) for name in context.__dict__.keys() if name.startswith('AddressOf')]
+    if not addresses:
+        raise Exception("Search result has no fields")
+    return min(addresses)
+
+def _valueFormat(value, size, pointerSize, name, fieldsFormats):
+    if None != fieldsFormats and name in fieldsFormats:
+        return fieldsFormats[name]
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, integer_types):
+        if value < 0:
+            return SIGNED_FORMATS.get(size)
+        return INTEGER_FORMATS.get(size)
+    if isinstance(value, float):
+        return FLOAT_FORMATS.get(size)
+    if isinstance(value, (bytes, str)):
+        return '%ds' % size
+    return None
+
+def compileLayout(context, pointerSize, endianity, followDepth=1, fieldsFormats=None, base=None):
+    """
+    Builds the StructLayout of a search result.
+    Numbers, floats, pointers, strings and buffers of fixed size become fields,
+    inlined structs are flattened into the layout, arrays and fields of no fixed size are left out.
+    """
+    if None == base:
+        base = _contextBase(context)
+    layout = StructLayout(endianity)
+    _addContextFields(layout, context, (), base, pointerSize, followDepth, fieldsFormats)
+    layout.compile()
+    return layout
+
+def _addContextFields(layout, context, path, base, pointerSize, followDepth, fieldsFormats):
+    for name in context._getItemNames():
+        if not hasattr(context, 'AddressOf' + name) or not hasattr(context, 'SizeOf' + name):
+            continue
+        value = getattr(context, name)
+        address = getattr(context, 'AddressOf' + name)
+        size = getattr(context, 'SizeOf' + name)
+        offset = address - base
+        fieldPath = path + (name,)
+        if 0 == size or offset < 0:
+            continue
+        if isinstance(value, SearchContext):
+            pointer = getattr(value, '_val', address)
+            if pointer == address:
+                # Struct inside the struct
+                _addContextFields(layout, value, fieldPath, base, pointerSize, followDepth, fieldsFormats)
+                continue
+            childLayout = None
+            if followDepth > 0 and 0 != pointer:
+                childLayout = compileLayout(value, pointerSize, layout.endianity, followDepth - 1, fieldsFormats, pointer)
+            layout.addField(fieldPath, offset, INTEGER_FORMATS[pointerSize], childLayout)
+            continue
+        fieldFormat = _valueFormat(value, size, pointerSize, '.'.join(fieldPath), fieldsFormats)
+        if None != fieldFormat:
+            layout.addField(fieldPath, offset, fieldFormat)
+
+class StructLayout( object ):
+    """
+    Fields at fixed offsets unpacked with a single struct.
+    Every field has a path of names, longer than one for fields of inlined structs,
+    pointers can have the layout of what they point to.
+    """
+    def __init__(self, endianity='='):
+        self.endianity = endianity
+        self.fields = []
+        self.size = 0
+        self.unpacker = None
+        self.pointers = {}
+
+    def addField(self, path, offset, fieldFormat, childLayout=None):
+        self.fields.append((offset, path, fieldFormat))
+        if None != childLayout:
+            self.pointers[path] = childLayout
+
+    def compile(self):
+        self.fields.sort()
+        fieldsFormat = [self.endianity]
+        position = 0
+        fields = []
+        for offset, path, fieldFormat in self.fields:
+            if offset < position:
+                # Overlaps the field before it, like a union member
+                continue
+            if offset > position:
+                fieldsFormat.append('%dx' % (offset - position))
+            fieldsFormat.append(fieldFormat)
+            position = offset + struct.calcsize('=' + fieldFormat)
+            fields.append((offset, path, fieldFormat))
+        self.fields = fields
+        self.paths = [path for offset, path, fieldFormat in fields]
+        self.names = ['.'.join(path) for path in self.paths]
+        self.unpacker = struct.Struct(''.join(fieldsFormat))
+        self.size = self.unpacker.size
+
+    def offsetOf(self, name):
+        return self.fields[self.names.index(name)][0]
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return '\n'.join(['+%04x %-4s %s' % (offset, fieldFormat, '.'.join(path)) for offset, path, fieldFormat in self.fields])
+
+class StructFields( object ):
+    """ Holds the fields of an inlined struct """
+    pass
+
+class StructView( object ):
+    """
+    Refreshes all the fields of an object with one readMemory and one unpack_from.
+    Fields are attributes of the view, fields of inlined structs are attributes of
+    sub objects, and followed pointers are views of their own with the pointer as _val.
+    After every refresh, changes holds the (old, new) values of every field that changed,
+    by its dotted name, including the fields of followed pointers.
+    """
+    def __init__(self, reader, layout, address=None, context=None):
+        self._reader = reader
+        self._layout = layout
+        if None == address:
+            address = _contextBase(context)
+        self._val = address
+        self._values = None
+        self._generation = None
+        self._children = {}
+        self.changes = {}
+        self.refreshCount = 0
+
+    def __repr__(self):
+        lines = ['View @0x%x' % self._val]
+        for name, path in zip(self._layout.names, self._layout.paths):
+            value = self._getPath(path)
+            if isinstance(value, StructView):
+                value = value._val
+            if isinstance(value, integer_types):
+                value = hex(value).replace('L', '')
+            else:
+                value = repr(value)
+            lines.append('  %-24s %s' % (name, value))
+        return '\n'.join(lines)
+
+    def getLayout(self):
+        return self._layout
+
+    def getAddressOf(self, name):
+        return self._val + self._layout.offsetOf(name)
+
+    def getValues(self):
+        """ Dict of dotted field name to its value, pointers are given as numbers """
+        if None == self._values:
+            return {}
+        return dict(zip(self._layout.names, self._values))
+
+    @property
+    def dirtyFields(self):
+        return list(self.changes.keys())
+
+    def isDirty(self, name=None):
+        if None == name:
+            return 0 != len(self.changes)
+        return name in self.changes
+
+    def _getPath(self, path):
+        target = self
+        for name in path:
+            target = getattr(target, name)
+        return target
+
+    def _setPath(self, path, value):
+        target = self
+        for name in path[:-1]:
+            child = target.__dict__.get(name)
+            if None == child:
+                child = StructFields()
+                setattr(target, name, child)
+            target = child
+        setattr(target, path[-1], value)
+
+    def _apply(self, data, generation):
+        """ Sets the fields from the data read, returns the views of the pointers to follow """
+        self._generation = generation
+        layout = self._layout
+        values = layout.unpacker.unpack_from(data)
+        oldValues = self._values
+        self.changes = {}
+        toFollow = []
+        for index, path in enumerate(layout.paths):
+            value = values[index]
+            if None != oldValues and oldValues[index] != value:
+                self.changes[layout.names[index]] = (oldValues[index], value)
+            childLayout = layout.pointers.get(path)
+            if None == childLayout:
+                self._setPath(path, value)
+                continue
+            child = self._children.get(path)
+            if 0 == value:
+                self._children.pop(path, None)
+                self._setPath(path, value)
+                continue
+            if None == child or child._val != value:
+                child = StructView(self._reader, childLayout, value)
+                self._children[path] = child
+            self._setPath(path, child)
+            toFollow.append(child)
+        self._values = values
+        self.refreshCount += 1
+        return toFollow
+
+    def _collectChanges(self, generation):
+        for path, child in self._children.items():
+            if child._generation is not generation:
+                continue
+            prefix = '.'.join(path) + '.'
+            child._collectChanges(generation)
+            for name, change in child.changes.items():
+                self.changes[prefix + name] = change
+
+    def refresh(self):
+        """ Reads the object again, returns True when any field changed """
+        refreshViews([self])
+        return self.isDirty()
+
+def refreshViews(views):
+    """
+    Refreshes many views with as few reads as possible.
+    All the views of the same pointers depth are read together with readMemoryBatch when
+    the reader has it, so polling objects over a MemoryClient is a round trip per depth.
+    Views of objects that can no longer be read are left as they are, and are returned.
+    """
+    generation = object()
+    failed = []
+    level = list(views)
+    while level:
+        nextLevel = []
+        for reader, readerViews in _groupByReader(level):
+            for view, data in zip(readerViews, _readBatch(reader, [(view._val, view._layout.size) for view in readerViews])):
+                if None == data:
+                    view.changes = {}
+                    failed.append(view)
+                    continue
+                nextLevel.extend(view._apply(data, generation))
+        level = nextLevel
+    for view in views:
+        if view._generation is generation:
+            view._collectChanges(generation)
+    return failed
+
+def _groupByReader(views):
+    groups = {}
+    for view in views:
+        groups.setdefault(id(view._reader), (view._reader, []))[1].append(view)
+    return list(groups.values())
+
+def _readBatch(reader, requests):
+    if hasattr(reader, 'readMemoryBatch'):
+        return reader.readMemoryBatch(requests)
+    datas = []
+    for address, length in requests:
+        try:
+            datas.append(reader.readMemory(address, length))
+        except ReadError:
+            datas.append(None)
+    return datas
+
+__all__ = [
+        "StructView",
+        "StructLayout",
+        "compileView",
+        "compilePattern",
+        "compileLayout",
+        "refreshViews" ]
@@ -1,4 +1,5 @@
 __all__ = [
         "Macho",
         "PE",
+        "StructView",
         "Finder"]
@@ -0,0 +1,317 @@
+#
+#   PointerGraph.py
+#
+#   PointerGraph - Exports all the pointers in the memory of a reader as a graph
+#   of columns in .npy files, and loads it back for graph queries
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+# Usage:
+#   exportPointerGraph(reader, 'graph', objects=heapBlocks)
+#   graph = PointerGraph('graph')
+#   leaks = graph.unreachable(graph.externalRoots())
+#   print(graph.inDegrees()[graph.nodeOf(address)])
+#
+# Every edge is a pointer found in memory, with the columns:
+#   sourceAddress   - Address of the node the pointer is in
+#   sourceOffset    - Offset of the pointer in that node
+#   sourceNode      - Index of that node, -1 for pointers that are not in any node
+#   targetAddress   - The pointer
+#   targetRegion    - Index of the memory region the pointer points to
+#   targetNode      - Index of the node the pointer points to, -1 if it is not in any
+# Nodes are the objects given to the export, or all the memory regions when none are given.
+
+from __future__ import print_function
+import os
+import json
+
+try:
+    import numpy
+    IS_NUMPY_FOUND = True
+except ImportError as e:
+    IS_NUMPY_FOUND = False
+
+from .MemReaderBase import SCAN_CHUNK_SIZE
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+# Header is written before the length of the column is known, so it has a fixed size
+NPY_HEADER_SIZE = 128
+
+EDGES_COLUMNS = [
+        ('sourceAddress',   '<u8'),
+        ('sourceOffset',    '<u8'),
+        ('sourceNode',      '<i8'),
+        ('targetAddress',   '<u8'),
+        ('targetRegion',    '<i4'),
+        ('targetNode',      '<i8') ]
+NODES_COLUMNS = [
+        ('nodeAddress',     '<u8'),
+        ('nodeSize',        '<u8'),
+        ('nodeRegion',      '<i4') ]
+GRAPH_INFO_FILE = 'graph.json'
+
+def _checkNumpy():
+    if not IS_NUMPY_FOUND:
+        raise Exception("Pointer graphs need numpy")
+
+class NpyColumnWriter( object ):
+    """ Writes a one dimensional .npy file by appending to it, the length is set on close """
+    def __init__(self, fileName, dtype):
+        self.fileName = fileName
+        self.dtype = numpy.dtype(dtype)
+        self.count = 0
+        self._file = open(fileName, 'wb')
+        self._writeHeader()
+
+    def _writeHeader(self):
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (self.dtype.str, self.count)
+        header = header.ljust(NPY_HEADER_SIZE - len(NPY_MAGIC) - 2 - 1) + '\n'
+        self._file.seek(0)
+        self._file.write(NPY_MAGIC + numpy.array(len(header), '<u2').tobytes() + header.encode('latin1'))
+
+    def append(self, values):
+        values = numpy.ascontiguousarray(values, dtype=self.dtype)
+        self._file.seek(0, 2)
+        self._file.write(values.tobytes())
+        self.count += len(values)
+
+    def close(self):
+        if None == self._file:
+            return
+        self._writeHeader()
+        self._file.close()
+        self._file = None
+
+def lookupRanges(starts, ends, addresses):
+    """ Index of the range every address is in, -1 where it is not in any, the ranges are sorted """
+    indexes = numpy.searchsorted(starts, addresses, side='right') - 1
+    isInside = indexes >= 0
+    isInside[isInside] = addresses[isInside] < ends[indexes[isInside]]
+    indexes[~isInside] = -1
+    return indexes
+
+def pointerType(reader):
+    """ numpy type of the pointers of the reader """
+    endianity = reader.getEndianity()
+    if '=' == endianity:
+        endianity = '<' if numpy.little_endian else '>'
+    return numpy.dtype('%su%d' % (endianity, reader.getPointerSize()))
+
+def chunkPointers(address, data, ownedSize, alignment, dtype):
+    """
+    Returns the (values, addresses) of all the aligned pointers that start in the first
+    ownedSize bytes of the data, as arrays of uint64, None when there are none
+    """
+    first = (-address) % alignment
+    count = 0
+    if first < ownedSize:
+        count = min((ownedSize - first - 1) // alignment + 1, (len(data) - first - dtype.itemsize) // alignment + 1)
+    if 0 >= count:
+        return None
+    values = numpy.ndarray((count,), dtype=dtype, buffer=data, offset=first, strides=(alignment,)).astype(numpy.uint64)
+    addresses = numpy.arange(count, dtype=numpy.uint64) * numpy.uint64(alignment) + numpy.uint64(address + first)
+    return values, addresses
+
+def exportPointerGraph(reader, directory, objects=None, attributesMask=None, targetsMask=None, alignment=None, chunkSize=SCAN_CHUNK_SIZE, workers=None):
+    """
+    Walks all the readable memory of the reader, and writes every aligned value that points
+    into a memory region as an edge. Returns the number of edges.
+    objects         - Sorted list of (address, size) to use as the nodes, like heap blocks
+    attributesMask  - Only look for pointers in regions with any of these attributes
+    targetsMask     - Only keep pointers to regions with any of these attributes
+    alignment       - Alignment of pointers, default is the pointer size
+    """
+    _checkNumpy()
+    pointerSize = reader.getPointerSize()
+    if None == alignment:
+        alignment = pointerSize
+    dtype = pointerType(reader)
+    regions = reader.getMemoryRegions()
+    regionsStarts = numpy.array([region[0] for region in regions], dtype=numpy.uint64)
+    regionsEnds = numpy.array([region[0] + region[1] for region in regions], dtype=numpy.uint64)
+    if objects is None:
+        nodes = [(region[0], region[1]) for region in regions]
+    else:
+        nodes = sorted(objects)
+    nodesStarts = numpy.array([node[0] for node in nodes], dtype=numpy.uint64)
+    nodesEnds = numpy.array([node[0] + node[1] for node in nodes], dtype=numpy.uint64)
+    isTargetRegion = numpy.array([None == targetsMask or 0 != (region[3] & targetsMask) for region in regions], dtype=bool)
+    def scanChunk(address, data, ownedSize):
+        pointers = chunkPointers(address, data, ownedSize, alignment, dtype)
+        if None == pointers:
+            return None
+        values, sources = pointers
+        targetRegions = lookupRanges(regionsStarts, regionsEnds, values)
+        isPointer = targetRegions >= 0
+        isPointer[isPointer] = isTargetRegion[targetRegions[isPointer]]
+        positions = numpy.nonzero(isPointer)[0]
+        if 0 == len(positions):
+            return None
+        values = values[positions]
+        sources = sources[positions]
+        sourceNodes = lookupRanges(nodesStarts, nodesEnds, sources)
+        isInNode = sourceNodes >= 0
+        sourceAddresses = sources.copy()
+        sourceAddresses[isInNode] = nodesStarts[sourceNodes[isInNode]]
+        return (sourceAddresses,
+                sources - sourceAddresses,
+                sourceNodes,
+                values,
+                targetRegions[positions],
+                lookupRanges(nodesStarts, nodesEnds, values))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    writers = [NpyColumnWriter(os.path.join(directory, name + '.npy'), dtype) for name, dtype in EDGES_COLUMNS]
+    try:
+        # Untouched pages are all zeros, that are not pointers unless some region starts at 0
+        isSkippingUntouched = not (regions and 0 == regions[0][0])
+        for columns in reader.mapMemoryChunks(scanChunk, chunkSize, pointerSize - 1, attributesMask, workers=workers, isSkippingUntouched=isSkippingUntouched):
+            if None == columns:
+                continue
+            for writer, column in zip(writers, columns):
+                writer.append(column)
+    finally:
+        for writer in writers:
+            writer.close()
+    nodesRegions = lookupRanges(regionsStarts, regionsEnds, nodesStarts)
+    for (name, dtype), column in zip(NODES_COLUMNS, (nodesStarts, nodesEnds - nodesStarts, nodesRegions)):
+        numpy.save(os.path.join(directory, name + '.npy'), column.astype(dtype))
+    with open(os.path.join(directory, GRAPH_INFO_FILE), 'w') as infoFile:
+        json.dump({
+            'pointerSize'   : pointerSize,
+            'alignment'     : alignment,
+            'edgesCount'    : writers[0].count,
+            'regions'       : [list(region) for region in regions] }, infoFile)
+    return writers[0].count
+
+class PointerGraph( object ):
+    """
+    Loads a pointer graph that was exported with exportPointerGraph.
+    All the columns are memory mapped, so only what a query touches is read from the disk.
+    """
+    def __init__(self, directory):
+        _checkNumpy()
+        self.directory = directory
+        with open(os.path.join(directory, GRAPH_INFO_FILE), 'r') as infoFile:
+            info = json.load(infoFile)
+        self.pointerSize = info['pointerSize']
+        self.alignment = info['alignment']
+        self.regions = [tuple(region) for region in info['regions']]
+        for name, dtype in EDGES_COLUMNS + NODES_COLUMNS:
+            setattr(self, name, numpy.load(os.path.join(directory, name + '.npy'), mmap_mode='r'))
+        self._outIndex = None
+        self._inDegrees = None
+
+    def __repr__(self):
+        return 'PointerGraph(%s: %d nodes, %d edges)' % (self.directory, self.nodesCount(), self.edgesCount())
+
+    def nodesCount(self):
+        return len(self.nodeAddress)
+
+    def edgesCount(self):
+        return len(self.targetAddress)
+
+    def nodeOf(self, address):
+        """ Index of the node address is in, -1 if it is not in any """
+        index = int(numpy.searchsorted(self.nodeAddress, address, side='right')) - 1
+        if index < 0 or address >= int(self.nodeAddress[index]) + int(self.nodeSize[index]):
+            return -1
+        return index
+
+    def regionOf(self, address):
+        for index, region in enumerate(self.regions):
+            if region[0] <= address < region[0] + region[1]:
+                return index
+        return -1
+
+    def _getOutIndex(self):
+        """ Edges ordered by source node, and where the edges of every node start in that order """
+        if self._outIndex is None:
+            sourceNodes = numpy.asarray(self.sourceNode)
+            order = numpy.argsort(sourceNodes, kind='stable')
+            sortedSources = sourceNodes[order]
+            starts = numpy.searchsorted(sortedSources, numpy.arange(self.nodesCount() + 1), side='left')
+            self._outIndex = (order, starts)
+        return self._outIndex
+
+    def inDegrees(self):
+        """ Number of pointers to every node """
+        # Compared with is, as comparing an array to None is done element by element
+        if self._inDegrees is None:
+            targets = numpy.asarray(self.targetNode)
+            self._inDegrees = numpy.bincount(targets[targets >= 0], minlength=self.nodesCount())
+        return self._inDegrees
+
+    def inDegree(self, node):
+        return int(self.inDegrees()[node])
+
+    def outEdges(self, node):
+        """ Indexes of the edges that go out of a node """
+        order, starts = self._getOutIndex()
+        return order[starts[node]:starts[node + 1]]
+
+    def referrers(self, node):
+        """ Indexes of the edges that point into a node """
+        return numpy.nonzero(numpy.asarray(self.targetNode) == node)[0]
+
+    def externalRoots(self):
+        """ Nodes pointed to from memory that is not in any node, like stacks and globals when the nodes are heap blocks """
+        sourceNodes = numpy.asarray(self.sourceNode)
+        targets = numpy.asarray(self.targetNode)[sourceNodes < 0]
+        return numpy.unique(targets[targets >= 0])
+
+    def nodesOfRegion(self, regionIndex):
+        return numpy.nonzero(numpy.asarray(self.nodeRegion) == regionIndex)[0]
+
+    def reachable(self, roots, maxDepth=None):
+        """ Boolean array of the nodes that can be reached from the roots by following pointers """
+        order, starts = self._getOutIndex()
+        targets = numpy.asarray(self.targetNode)[order]
+        isReached = numpy.zeros(self.nodesCount(), dtype=bool)
+        frontier = numpy.unique(numpy.asarray(roots, dtype=numpy.int64))
+        frontier = frontier[frontier >= 0]
+        isReached[frontier] = True
+        depth = 0
+        while len(frontier) and (None == maxDepth or depth < maxDepth):
+            # All the out edges of the frontier at once
+            edgesStarts = starts[frontier]
+            edgesCounts = starts[frontier + 1] - edgesStarts
+            total = int(edgesCounts.sum())
+            if 0 == total:
+                break
+            offsets = numpy.repeat(edgesStarts - numpy.cumsum(edgesCounts) + edgesCounts, edgesCounts)
+            nextNodes = targets[offsets + numpy.arange(total)]
+            nextNodes = numpy.unique(nextNodes[nextNodes >= 0])
+            frontier = nextNodes[~isReached[nextNodes]]
+            isReached[frontier] = True
+            depth += 1
+        return isReached
+
+    def unreachable(self, roots):
+        """ Indexes of the nodes that can not be reached from the roots, the leak candidates """
+        return numpy.nonzero(~self.reachable(roots))[0]
+
+def loadPointerGraph(directory):
+    return PointerGraph(directory)
+
+__all__ = [
+        "exportPointerGraph",
+        "loadPointerGraph",
+        "PointerGraph",
+        "NpyColumnWriter",
+        "lookupRanges",
+        "pointerType",
+        "chunkPointers" ]
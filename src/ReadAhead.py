@@ -0,0 +1,245 @@
+#
+#   ReadAhead.py
+#
+#   ReadAhead - Memory reader wrapper that detects sequential reads and prefetches
+#   growing windows of memory ahead of them
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from __future__ import print_function
+import threading
+from bisect import bisect_right
+
+from .Interfaces import ReadError
+from .MemReaderBase import MemReaderBase
+
+def readAhead(reader, **kw):
+    return ReadAheadReader(reader, **kw)
+
+class ReadAheadStream( object ):
+    """ One sequential access stream, and the memory prefetched for it """
+    def __init__(self, lastEnd, window):
+        self.lastEnd = lastEnd
+        self.window = window
+        self.bufferStart = lastEnd
+        self.buffer = b''
+        self.pending = None
+
+    def bufferEnd(self):
+        return self.bufferStart + len(self.buffer)
+
+class PendingRead( object ):
+    """ A prefetch that runs on a background thread """
+    def __init__(self, readFunction, address, length):
+        self.address = address
+        self.length = length
+        self.data = None
+        self.error = None
+        self._readFunction = readFunction
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.data = self._readFunction(self.address, self.length)
+        except Exception as e:
+            # Raised again by wait, in the thread that uses the data
+            self.error = e
+
+    def wait(self):
+        self._thread.join()
+        if None != self.error:
+            raise self.error
+        return self.data
+
+class ReadAheadReader( MemReaderBase ):
+    """
+    Wraps a memory reader. A read that starts where a previous read of the same stream ended,
+    or a little after it, is sequential. Sequential reads are served from a prefetched buffer,
+    and every refill doubles the window up to maxWindow. Several streams are tracked at once,
+    so interleaved forward walks keep their windows.
+    With isBackground the next window is read on a thread while the current one is consumed,
+    that is only done for readers that are thread safe, the rest are always read in the
+    calling thread. An error of a background read is raised by the read that needed its data.
+    Prefetching never crosses the end of a region, and a window that fails to read is shrunk
+    until it fits. Call invalidate when the target memory changes.
+    Methods that are not reads are forwarded to the wrapped reader.
+    """
+    # Methods of the base classes that must reach the wrapped reader
+    FORWARDED_METHODS = [
+            'getMemoryMap',
+            'getMemoryRegions',
+            'isAddressValid',
+            'isThreadSafe',
+            'isLive' ]
+
+    def __init__(self, reader, minWindow=0x1000, maxWindow=0x100000, maxStreams=4, maxGap=0x100, isBackground=False):
+        """
+        reader      - Any memory reader to wrap
+        minWindow   - Size of the first prefetch of a stream
+        maxWindow   - Largest prefetch
+        maxStreams  - Number of sequential streams tracked at once
+        maxGap      - Reads that skip up to that many bytes are still sequential
+        isBackground - Prefetch the next window on a background thread, ignored when the
+                       reader is not thread safe
+        """
+        MemReaderBase.__init__(self)
+        self._reader = reader
+        self._POINTER_SIZE = reader.getPointerSize()
+        self._DEFAULT_DATA_SIZE = reader.getDefaultDataSize()
+        self._ENDIANITY = reader.getEndianity()
+        self.minWindow = minWindow
+        self.maxWindow = maxWindow
+        self.maxStreams = maxStreams
+        self.maxGap = maxGap
+        isThreadSafe = getattr(reader, 'isThreadSafe', None)
+        self.isBackground = isBackground and (None == isThreadSafe or isThreadSafe())
+        # Readers are not expected to be thread safe
+        self._readerLock = threading.Lock()
+        for name in self.FORWARDED_METHODS:
+            if hasattr(reader, name):
+                setattr(self, name, getattr(reader, name))
+        self.invalidate()
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the wrapper itself
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.__dict__['_reader'], name)
+
+    def getReader(self):
+        return self._reader
+
+    def invalidate(self):
+        """ Drops everything prefetched, and raises the error of a background read that failed """
+        pendings = [stream.pending for stream in getattr(self, '_streams', []) if None != stream.pending]
+        self._streams = []
+        self._regions = None
+        self.resetStats()
+        for pending in pendings:
+            pending.wait()
+
+    def resetStats(self):
+        self.hits = 0
+        self.misses = 0
+        self.prefetches = 0
+        self.prefetchedBytes = 0
+
+    def getStats(self):
+        return {
+                'hits'      : self.hits,
+                'misses'    : self.misses,
+                'prefetches' : self.prefetches,
+                'prefetchedBytes' : self.prefetchedBytes }
+
+    def _loadRegions(self):
+        try:
+            regions = self._reader.getMemoryRegions()
+        except (AttributeError, NotImplementedError, ReadError):
+            regions = []
+        self._regions = [(address, address + size) for address, size, name, attributes in regions]
+        self._regionsStarts = [region[0] for region in self._regions]
+
+    def _regionEnd(self, address):
+        """ End of the region that holds address, None when unknown """
+        if None == self._regions:
+            self._loadRegions()
+        index = bisect_right(self._regionsStarts, address) - 1
+        if index < 0 or address >= self._regions[index][1]:
+            return None
+        return self._regions[index][1]
+
+    def _directRead(self, address, length):
+        with self._readerLock:
+            return self._reader.readMemory(address, length)
+
+    def _prefetch(self, address, minLength, window):
+        """ Reads at least minLength bytes and up to window bytes, None when even minLength fails """
+        regionEnd = self._regionEnd(address)
+        if None != regionEnd:
+            window = max(min(window, regionEnd - address), minLength)
+        while True:
+            try:
+                data = self._directRead(address, window)
+            except ReadError:
+                if window <= minLength:
+                    return None
+                window = max(window // 2, minLength)
+                continue
+            self.prefetches += 1
+            self.prefetchedBytes += len(data)
+            return data
+
+    def _startBackground(self, stream):
+        address = stream.bufferEnd()
+        regionEnd = self._regionEnd(address)
+        if None == regionEnd:
+            return
+        window = min(stream.window, regionEnd - address)
+        if window > 0:
+            stream.pending = PendingRead(lambda address, length: self._prefetch(address, 1, length), address, window)
+
+    def _findStream(self, address):
+        for stream in self._streams:
+            if stream.lastEnd <= address <= stream.lastEnd + self.maxGap:
+                return stream
+            if stream.bufferStart <= address < stream.bufferEnd():
+                return stream
+        return None
+
+    def readMemory(self, address, length):
+        end = address + length
+        stream = self._findStream(address)
+        if None == stream:
+            self.misses += 1
+            data = self._directRead(address, length)
+            if len(self._streams) >= self.maxStreams:
+                self._streams.pop(0)
+            self._streams.append(ReadAheadStream(end, self.minWindow))
+            return data
+        # Move the stream to the end of the list, so the least recently used is replaced
+        if stream is not self._streams[-1]:
+            self._streams.remove(stream)
+            self._streams.append(stream)
+        if end > stream.bufferEnd() or address < stream.bufferStart:
+            pending = stream.pending
+            stream.pending = None
+            if None != pending and pending.address <= address and (end <= pending.address + len(pending.wait() or b'')):
+                stream.bufferStart = pending.address
+                stream.buffer = pending.data
+            else:
+                data = self._prefetch(address, length, max(length, stream.window))
+                if None == data:
+                    # Let the reader raise the right error
+                    self._directRead(address, length)
+                    raise ReadError(address)
+                stream.bufferStart = address
+                stream.buffer = data
+            self.misses += 1
+            stream.window = min(stream.window * 2, self.maxWindow)
+        else:
+            self.hits += 1
+        stream.lastEnd = end
+        offset = address - stream.bufferStart
+        if self.isBackground and None == stream.pending and \
+                (stream.bufferEnd() - end) * 2 < len(stream.buffer):
+            self._startBackground(stream)
+        return stream.buffer[offset:offset + length]
+
+__all__ = [
+        "ReadAheadReader",
+        "readAhead" ]
@@ -0,0 +1,344 @@
+#
+#   ScanJob.py
+#
+#   ScanJob - Long running scans over the memory regions with progress reports,
+#   cancellation and checkpoints to resume from
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+from __future__ import print_function
+import os
+import json
+import time
+import signal
+import binascii
+
+from .Interfaces import ReadError
+from .Utilities import integer_types
+
+if hasattr(time, 'perf_counter'):
+    _timer = time.perf_counter
+else:
+    _timer = time.time
+
+CHECKPOINT_VERSION = 1
+
+class ScanCancelled( Exception ):
+    pass
+
+class CancellationToken( object ):
+    """ Shared flag a scan checks between candidates """
+    def __init__(self):
+        self.isCancelled = False
+    def cancel(self):
+        self.isCancelled = True
+    def reset(self):
+        self.isCancelled = False
+
+def cancelOnInterrupt(token, signalNumber=signal.SIGINT):
+    """
+    Makes Ctrl-C cancel the token instead of raising KeyboardInterrupt, so the scan can
+    write a checkpoint and stop cleanly. Returns the previous handler.
+    """
+    def _cancelHandler(signum, frame):
+        token.cancel()
+    return signal.signal(signalNumber, _cancelHandler)
+
+def encodeResult(result):
+    """ Makes a scan result json friendly """
+    if isinstance(result, integer_types) or isinstance(result, (float, str)) or None == result:
+        return result
+    if isinstance(result, (bytes, bytearray)):
+        return binascii.hexlify(result).decode('ascii')
+    if isinstance(result, (list, tuple)):
+        return [encodeResult(x) for x in result]
+    if hasattr(result, '_scanAddress'):
+        return result._scanAddress
+    return repr(result)
+
+class ScanProgress( object ):
+    def __init__(self, job):
+        now = _timer()
+        self.regionIndex    = job.regionIndex
+        self.regionsCount   = len(job.regions)
+        self.position       = job.position
+        self.bytesScanned   = job.bytesScanned
+        self.totalBytes     = job.totalBytes
+        self.candidates     = job.candidates
+        self.resultsCount   = len(job.results)
+        self.elapsed        = job.previousElapsed + (now - job.startTime)
+        sessionElapsed = max(now - job.startTime, 1e-9)
+        self.bytesPerSecond      = (job.bytesScanned - job.startBytes) / sessionElapsed
+        self.candidatesPerSecond = (job.candidates - job.startCandidates) / sessionElapsed
+        if job.totalBytes:
+            self.percent = (100.0 * job.bytesScanned) / job.totalBytes
+        else:
+            self.percent = 100.0
+
+    def toDict(self):
+        return dict(self.__dict__)
+
+    def __repr__(self):
+        return '%6.2f%% region %d/%d @0x%x %.2f MB/s %d candidates/s %d results %ds' % (
+                self.percent,
+                min(self.regionIndex + 1, self.regionsCount),
+                self.regionsCount,
+                self.position,
+                self.bytesPerSecond / (1024.0 * 1024.0),
+                int(self.candidatesPerSecond),
+                self.resultsCount,
+                int(self.elapsed))
+
+def printProgress(progress):
+    print(repr(progress))
+
+class ScanJob( object ):
+    """
+    Runs a scan function over all the memory regions chunk by chunk.
+    Keeps track of the position, reports the progress every progressInterval seconds,
+    stops when the cancellation token is cancelled and writes a checkpoint every
+    checkpointInterval seconds, when stopped and when it fails. Creating a job with the
+    same checkpoint file resumes the scan from where it stopped. The results found before
+    the checkpoint are restored into job.results in their encoded form.
+    """
+    def __init__(self,
+            reader,
+            regions=None,
+            attributesMask=None,
+            chunkSize=0x10000,
+            checkpointFile=None,
+            checkpointInterval=60,
+            progressInterval=5,
+            progressCallback=printProgress,
+            cancelToken=None,
+            isResume=True):
+        """
+        reader              - Memory reader to scan
+        regions             - List of (address, size), default is all the regions of the reader
+        attributesMask      - Only scan regions with these attributes, when regions are not given
+        chunkSize           - Number of bytes handed to the scan function at a time
+        checkpointFile      - Where to keep the state of the scan, None for no checkpoints
+        checkpointInterval  - Seconds between checkpoints
+        progressInterval    - Seconds between progress reports, None for no reports
+        progressCallback    - Called with a ScanProgress
+        cancelToken         - CancellationToken to stop the scan with
+        isResume            - Continue from the checkpoint file if it exists
+        """
+        self.reader = reader
+        if None == regions:
+            regions = [(region[0], region[1]) for region in reader.getMemoryRegions(attributesMask)]
+        self.regions = [(int(address), int(size)) for address, size in regions]
+        self.totalBytes = sum([size for address, size in self.regions])
+        self.chunkSize = chunkSize
+        self.checkpointFile = checkpointFile
+        self.checkpointInterval = checkpointInterval
+        self.progressInterval = progressInterval
+        self.progressCallback = progressCallback
+        if None == cancelToken:
+            cancelToken = CancellationToken()
+        self.cancelToken = cancelToken
+        self.isResume = isResume
+        self._resetState()
+
+    def _resetState(self):
+        self.regionIndex = 0
+        self.position = 0
+        self.bytesScanned = 0
+        self.candidates = 0
+        self.results = []
+        self._pendingResults = []
+        self.previousElapsed = 0.0
+        self.isDone = False
+        self.isCancelled = False
+        self.description = None
+
+    def addCandidates(self, count=1):
+        self.candidates += count
+
+    def commit(self, position):
+        """ Everything before position in the current region is scanned, and its results are final """
+        regionAddress, regionSize = self.regions[self.regionIndex]
+        self.bytesScanned += position - max(self.position, regionAddress)
+        self.position = position
+        if self._pendingResults:
+            self.results.extend(self._pendingResults)
+            self._pendingResults = []
+
+    def getProgress(self):
+        return ScanProgress(self)
+
+    def cancel(self):
+        self.cancelToken.cancel()
+
+    def _checkpointState(self):
+        return {
+                'version'       : CHECKPOINT_VERSION,
+                'description'   : self.description,
+                'regions'       : self.regions,
+                'regionIndex'   : self.regionIndex,
+                'position'      : self.position,
+                'bytesScanned'  : self.bytesScanned,
+                'candidates'    : self.candidates,
+                'elapsed'       : self.previousElapsed + (_timer() - self.startTime),
+                'isDone'        : self.isDone,
+                'results'       : self.results }
+
+    def saveCheckpoint(self):
+        if None == self.checkpointFile:
+            return
+        tempFileName = self.checkpointFile + '.tmp'
+        with open(tempFileName, 'w') as checkpoint:
+            json.dump(self._checkpointState(), checkpoint)
+        if hasattr(os, 'replace'):
+            os.replace(tempFileName, self.checkpointFile)
+        else:
+            if os.path.exists(self.checkpointFile):
+                os.remove(self.checkpointFile)
+            os.rename(tempFileName, self.checkpointFile)
+        self._lastCheckpointTime = _timer()
+
+    def loadCheckpoint(self, description):
+        """ Returns True if a matching checkpoint was loaded """
+        if None == self.checkpointFile or not os.path.exists(self.checkpointFile):
+            return False
+        with open(self.checkpointFile, 'r') as checkpoint:
+            state = json.load(checkpoint)
+        if CHECKPOINT_VERSION != state.get('version'):
+            raise Exception("Unsupported checkpoint version %r" % state.get('version'))
+        if description != state['description'] or self.regions != [tuple(x) for x in state['regions']]:
+            raise Exception("Checkpoint %s is of a different scan" % self.checkpointFile)
+        self.regionIndex = state['regionIndex']
+        self.position = state['position']
+        self.bytesScanned = state['bytesScanned']
+        self.candidates = state['candidates']
+        self.previousElapsed = state['elapsed']
+        self.isDone = state['isDone']
+        self.results = state['results']
+        return True
+
+    def _report(self, now):
+        if None != self.progressInterval and None != self.progressCallback and \
+                (now - self._lastProgressTime) >= self.progressInterval:
+            self._lastProgressTime = now
+            self.progressCallback(self.getProgress())
+        if None != self.checkpointFile and \
+                (now - self._lastCheckpointTime) >= self.checkpointInterval:
+            self.saveCheckpoint()
+
+    def run(self, scanChunk, description=None, resultEncoder=encodeResult):
+        """
+        Yields the results of scanChunk(address, length) over all the regions.
+        scanChunk can call job.commit(address) and job.addCandidates(count) while it runs,
+        otherwise every chunk is committed when it is done.
+        description identifies the scan in the checkpoint, so it is not resumed by another scan.
+        """
+        self._resetState()
+        self.description = description
+        if self.isResume:
+            self.loadCheckpoint(description)
+        self.startTime = _timer()
+        self.startBytes = self.bytesScanned
+        self.startCandidates = self.candidates
+        self._lastProgressTime = self.startTime
+        self._lastCheckpointTime = self.startTime
+        cancelToken = self.cancelToken
+        try:
+            while self.regionIndex < len(self.regions):
+                regionAddress, regionSize = self.regions[self.regionIndex]
+                regionEnd = regionAddress + regionSize
+                if self.position < regionAddress:
+                    self.position = regionAddress
+                while self.position < regionEnd:
+                    if cancelToken.isCancelled:
+                        raise ScanCancelled()
+                    chunkEnd = min(self.position + self.chunkSize, regionEnd)
+                    try:
+                        for result in scanChunk(self.position, chunkEnd - self.position):
+                            self._pendingResults.append(resultEncoder(result))
+                            yield result
+                    except ReadError:
+                        # The rest of the chunk is not readable
+                        pass
+                    if cancelToken.isCancelled:
+                        raise ScanCancelled()
+                    self.commit(chunkEnd)
+                    self._report(_timer())
+                self.regionIndex += 1
+            self.isDone = True
+        except ScanCancelled:
+            self.isCancelled = True
+        finally:
+            # Results of a chunk that was not done are found again on resume
+            self._pendingResults = []
+            self.saveCheckpoint()
+            if None != self.progressCallback and None != self.progressInterval:
+                self.progressCallback(self.getProgress())
+
+    def scanPattern(self, patFinder, pattern, alignment=None, isFirstOnly=True, description=None):
+        """
+        Yields the matches of pattern at every aligned address of the regions.
+        The address a match started at is kept as result._scanAddress and in the checkpoint.
+        """
+        if None == alignment:
+            alignment = patFinder.getPointerSize()
+        cancelToken = self.cancelToken
+        def scanChunk(address, length):
+            start = address + ((-address) % alignment)
+            for candidate in range(start, address + length, alignment):
+                if cancelToken.isCancelled:
+                    return
+                self.candidates += 1
+                try:
+                    for result in patFinder.search(pattern, candidate):
+                        result._scanAddress = candidate
+                        yield result
+                        if isFirstOnly:
+                            break
+                except ReadError:
+                    pass
+                self.commit(candidate + alignment)
+        if None == description:
+            description = 'PatternFinder %r alignment %d' % (pattern, alignment)
+        return self.run(scanChunk, description)
+
+    def scanRecursiveFind(self, target, searchLength=0x100, hops=1, targetLength=None, alignment=4, limiter=None, description=None):
+        """
+        Yields the results of reader.recursiveFind starting from every chunk of the regions,
+        searchLength is the length to search after every pointer hop.
+        The first item of every result path is the absolute address the search started from.
+        """
+        reader = self.reader
+        if isinstance(searchLength, list):
+            nextSearchLengths = searchLength
+        else:
+            nextSearchLengths = [searchLength] * hops
+        def scanChunk(address, length):
+            self.candidates += length // alignment
+            start = address + ((-address) % alignment)
+            for result in reader.recursiveFind(target, start, [address + length - start] + nextSearchLengths, hops=hops, targetLength=targetLength, alignment=alignment, limiter=limiter):
+                yield (result[0], [start + result[1][0]] + result[1][1:], result[2])
+        if None == description:
+            description = 'RecursiveFind %r hops %d alignment %d' % (target, hops, alignment)
+        return self.run(scanChunk, description)
+
+__all__ = [
+        "ScanJob",
+        "ScanProgress",
+        "ScanCancelled",
+        "CancellationToken",
+        "cancelOnInterrupt",
+        "encodeResult",
+        "printProgress" ]
@@ -0,0 +1,394 @@
+#
+#   Signatures.py
+#
+#   Signatures - Byte signatures with wildcards and jumps, many of them matched
+#   over the memory of a reader in one pass
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+# Signature syntax, tokens are separated by spaces or not at all:
+#   48 8B       Bytes in hex
+#   ??          Any byte, a single ? is the same
+#   4? ?B       Byte with only one of its nibbles known
+#   [4]         Jump over exactly 4 bytes of anything
+#   [2-6]       Jump over 2 to 6 bytes of anything
+#   (E8 | FF 15) Any of the alternatives
+#
+# Usage:
+#   signatures = SignatureSet('x64', {
+#       'callThunk' : '48 8B ?? ?? 00 00 E8',
+#       'jumpTable' : 'FF 24 C5 [4] CC' })
+#   signatures.add('vtable', '?? ?? 4? 00 00 00 00 00', attributesMask=MemReaderBase.READ_ATTRIBUTES_MASK, alignment=8)
+#   for match in signatures.scan(reader):
+#       print(match)
+
+from __future__ import print_function
+import re
+import struct
+from bisect import bisect_right
+
+from .MemReaderBase import SCAN_CHUNK_SIZE
+
+HEX_DIGITS = '0123456789abcdefABCDEF'
+# Longest jump, so a signature has a known maximal length to overlap the chunks with
+MAX_JUMP = 0x1000
+# Signatures with a run of known bytes this long at a fixed offset are found by that run
+MIN_ANCHOR_LENGTH = 2
+
+def _byteClass(values):
+    return b'[' + b''.join([b'\\x%02x' % value for value in values]) + b']'
+
+class SignatureParser( object ):
+    """
+    Compiles the text of a signature into a regex, and tells its minimal and maximal length,
+    and the longest run of known bytes at a fixed offset of it, as (offset, bytes), the anchor.
+    """
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def error(self, message):
+        return Exception("%s at %d of signature %r" % (message, self.pos, self.text))
+
+    def skipSpaces(self):
+        while self.pos < len(self.text) and self.text[self.pos] in ' \t\r\n':
+            self.pos += 1
+
+    def peek(self):
+        self.skipSpaces()
+        if self.pos >= len(self.text):
+            return None
+        return self.text[self.pos]
+
+    def parse(self):
+        regex, minLength, maxLength, tokens = self.parseSequence()
+        if None != self.peek():
+            raise self.error("Unexpected %r" % self.peek())
+        if 0 == maxLength:
+            raise self.error("Empty signature")
+        return regex, minLength, maxLength, self.findAnchor(tokens)
+
+    def findAnchor(self, tokens):
+        anchor = (0, b'')
+        offset = 0
+        run = []
+        for regex, tokenMin, tokenMax, literal in tokens + [(None, 0, 0, None)]:
+            if None != literal:
+                run.append(literal)
+            else:
+                if len(run) > len(anchor[1]):
+                    anchor = (offset - len(run), b''.join(run))
+                run = []
+            if tokenMin != tokenMax:
+                # The offset of anything after a jump of variable length is not known
+                break
+            offset += tokenMin
+        if len(anchor[1]) < MIN_ANCHOR_LENGTH:
+            return None
+        return anchor
+
+    def parseSequence(self):
+        tokens = []
+        while True:
+            char = self.peek()
+            if None == char or char in '|)':
+                break
+            tokens.append(self.parseToken())
+        return b''.join([token[0] for token in tokens]), \
+                sum([token[1] for token in tokens]), \
+                sum([token[2] for token in tokens]), \
+                tokens
+
+    def parseToken(self):
+        char = self.peek()
+        if '(' == char:
+            self.pos += 1
+            alternatives = []
+            while True:
+                alternatives.append(self.parseSequence())
+                char = self.peek()
+                if '|' == char:
+                    self.pos += 1
+                    continue
+                if ')' == char:
+                    self.pos += 1
+                    break
+                raise self.error("Missing )")
+            regex = b'(?:' + b'|'.join([alternative[0] for alternative in alternatives]) + b')'
+            return regex, min([alternative[1] for alternative in alternatives]), max([alternative[2] for alternative in alternatives]), None
+        if '[' == char:
+            end = self.text.find(']', self.pos)
+            if -1 == end:
+                raise self.error("Missing ]")
+            jump = self.text[self.pos + 1:end].replace(' ', '')
+            try:
+                if '-' in jump:
+                    minJump, maxJump = [int(x) for x in jump.split('-')]
+                else:
+                    minJump = maxJump = int(jump)
+            except ValueError:
+                raise self.error("Invalid jump %r" % jump)
+            if minJump < 0 or maxJump < minJump or maxJump > MAX_JUMP:
+                raise self.error("Invalid jump %r" % jump)
+            self.pos = end + 1
+            if minJump == maxJump:
+                return b'.{%d}' % minJump, minJump, maxJump, None
+            return b'.{%d,%d}' % (minJump, maxJump), minJump, maxJump, None
+        high = self.text[self.pos]
+        low = self.text[self.pos + 1:self.pos + 2]
+        if '?' == high and (low in ('?', '') or low not in HEX_DIGITS):
+            # A single ? is a whole byte
+            self.pos += 1
+            if '?' == low:
+                self.pos += 1
+            return b'.', 1, 1, None
+        if '' == low or (high not in HEX_DIGITS + '?') or (low not in HEX_DIGITS + '?'):
+            raise self.error("Invalid byte")
+        self.pos += 2
+        if '?' == low:
+            highValue = int(high, 16) << 4
+            return _byteClass(range(highValue, highValue + 0x10)), 1, 1, None
+        if '?' == high:
+            lowValue = int(low, 16)
+            return _byteClass(range(lowValue, 0x100, 0x10)), 1, 1, None
+        value = int(high + low, 16)
+        return b'\\x' + (high + low).encode('ascii'), 1, 1, struct.pack('B', value)
+
+def compileSignature(text):
+    """ Returns (regex, minLength, maxLength, anchor) of the text of a signature """
+    regex, minLength, maxLength, anchor = SignatureParser(text).parse()
+    return re.compile(regex, re.DOTALL), minLength, maxLength, anchor
+
+class Signature( object ):
+    """
+    A named byte signature.
+    attributesMask  - Only match in regions that have any of these attributes
+    nameFilter      - Only match in regions with this string in their name, or a function of the name
+    alignment       - Only match at addresses that divide by it
+    """
+    def __init__(self, name, text, attributesMask=None, nameFilter=None, alignment=1):
+        self.name = name
+        self.text = text
+        self.regex, self.minLength, self.maxLength, self.anchor = compileSignature(text)
+        self.attributesMask = attributesMask
+        if None != nameFilter and not hasattr(nameFilter, '__call__'):
+            nameFilter = (lambda name, text=nameFilter: text in (name or ''))
+        self.nameFilter = nameFilter
+        self.alignment = alignment
+
+    def __repr__(self):
+        return 'Signature(%s: %s)' % (self.name, self.text)
+
+    def isFiltered(self):
+        return None != self.attributesMask or None != self.nameFilter
+
+    def isRegionMatching(self, region):
+        """ region is (address, size, name, attributes) """
+        if None != self.attributesMask and 0 == (region[3] & self.attributesMask):
+            return False
+        if None != self.nameFilter and not self.nameFilter(region[2]):
+            return False
+        return True
+
+    def scan(self, reader, chunkSize=SCAN_CHUNK_SIZE, workers=None):
+        return SignatureSet(self.name, [self]).scan(reader, chunkSize, workers)
+
+class SignatureMatch( object ):
+    def __init__(self, address, signature, data):
+        self.address = address
+        self.signature = signature
+        self.data = data
+
+    @property
+    def name(self):
+        return self.signature.name
+
+    def __repr__(self):
+        return '0x%x %s %s' % (self.address, self.signature.name, ' '.join(['%02x' % x for x in bytearray(self.data)]))
+
+class SignatureSet( object ):
+    """
+    Named set of signatures that are matched together, over one read of the memory.
+    Signatures with an anchor are grouped by it, every anchor is looked for with bytes.find,
+    and the signatures of the anchor are matched only where it is found.
+    The rest of the signatures are joined into one regex of lookaheads, so the data goes
+    through the regex engine once no matter how many of them there are, and only the
+    positions where one of them matches are checked against the others.
+    """
+    def __init__(self, name, signatures=None):
+        self.name = name
+        self.signatures = []
+        self._matcher = None
+        if isinstance(signatures, dict):
+            for signatureName in sorted(signatures.keys()):
+                self.add(signatureName, signatures[signatureName])
+        elif None != signatures:
+            for signature in signatures:
+                self.addSignature(signature)
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __repr__(self):
+        return 'SignatureSet(%s: %d signatures)' % (self.name, len(self.signatures))
+
+    def add(self, name, text, attributesMask=None, nameFilter=None, alignment=1):
+        return self.addSignature(Signature(name, text, attributesMask, nameFilter, alignment))
+
+    def addSignature(self, signature):
+        if signature.name in [x.name for x in self.signatures]:
+            raise Exception("Signature %s is already in set %s" % (signature.name, self.name))
+        self.signatures.append(signature)
+        self._matcher = None
+        return signature
+
+    def getSignature(self, name):
+        for signature in self.signatures:
+            if name == signature.name:
+                return signature
+        raise KeyError(name)
+
+    def maxLength(self):
+        return max([signature.maxLength for signature in self.signatures])
+
+    def _getMatcher(self):
+        """ Returns ({anchor bytes : [(offset, signature index)]}, regex, [signature index]) """
+        if None == self._matcher:
+            if not self.signatures:
+                raise Exception("Signature set %s is empty" % self.name)
+            anchors = {}
+            unanchored = []
+            for index, signature in enumerate(self.signatures):
+                if None == signature.anchor:
+                    unanchored.append(index)
+                else:
+                    offset, anchor = signature.anchor
+                    anchors.setdefault(anchor, []).append((offset, index))
+            regex = None
+            if unanchored:
+                regex = re.compile(
+                        b'|'.join([b'(?=(' + self.signatures[index].regex.pattern + b'))' for index in unanchored]),
+                        re.DOTALL)
+            self._matcher = (anchors, regex, unanchored)
+        return self._matcher
+
+    def matchData(self, data, address=0, ownedSize=None):
+        """
+        Returns the list of (address, signature index, data) of the matches in data,
+        that start in its first ownedSize bytes, sorted by address.
+        Regions filters are not checked here, only alignments.
+        """
+        if None == ownedSize:
+            ownedSize = len(data)
+        signatures = self.signatures
+        anchors, regex, unanchored = self._getMatcher()
+        matches = []
+        for anchor, anchorSignatures in anchors.items():
+            minOffset = min([offset for offset, index in anchorSignatures])
+            maxOffset = max([offset for offset, index in anchorSignatures])
+            end = min(len(data), ownedSize + maxOffset + len(anchor) - 1)
+            anchorPosition = data.find(anchor, minOffset, end)
+            while -1 != anchorPosition:
+                for offset, index in anchorSignatures:
+                    position = anchorPosition - offset
+                    if position < 0 or position >= ownedSize or 0 != (address + position) % signatures[index].alignment:
+                        continue
+                    match = signatures[index].regex.match(data, position)
+                    if None != match:
+                        matches.append((address + position, index, match.group(0)))
+                anchorPosition = data.find(anchor, anchorPosition + 1, end)
+        if None != regex:
+            self._matchRegex(regex, unanchored, data, address, ownedSize, matches)
+        matches.sort()
+        return matches
+
+    def _matchRegex(self, regex, unanchored, data, address, ownedSize, matches):
+        signatures = self.signatures
+        for match in regex.finditer(data):
+            position = match.start()
+            if position >= ownedSize:
+                break
+            regexIndex = match.lastindex - 1
+            # The lookaheads only report the first signature that matches here
+            for index in unanchored[regexIndex:]:
+                if 0 != (address + position) % signatures[index].alignment:
+                    continue
+                if index == unanchored[regexIndex]:
+                    matches.append((address + position, index, match.group(regexIndex + 1)))
+                    continue
+                otherMatch = signatures[index].regex.match(data, position)
+                if None != otherMatch:
+                    matches.append((address + position, index, otherMatch.group(0)))
+
+    def scan(self, reader, chunkSize=SCAN_CHUNK_SIZE, workers=None):
+        """
+        Yields a SignatureMatch for every match of any signature in the memory of the reader,
+        in address order. Only the regions some signature is interested in are read.
+        """
+        signatures = self.signatures
+        self._getMatcher()
+        allRegions = reader.getMemoryRegions()
+        regionsStarts = [region[0] for region in allRegions]
+        regionsCache = {}
+        def signaturesOfRegion(regionIndex):
+            # Indexes of the signatures that can match in the region
+            if regionIndex not in regionsCache:
+                region = allRegions[regionIndex]
+                regionsCache[regionIndex] = set([index for index, signature in enumerate(signatures) if signature.isRegionMatching(region)])
+            return regionsCache[regionIndex]
+        isFiltered = True in [signature.isFiltered() for signature in signatures]
+        if isFiltered:
+            regions = [region for index, region in enumerate(allRegions) if signaturesOfRegion(index)]
+        else:
+            regions = allRegions
+        def scanChunk(address, data, ownedSize):
+            return self.matchData(data, address, ownedSize)
+        # Untouched pages are all zeros, they are read only when some signature matches zeros
+        isSkippingUntouched = True not in [None != signature.regex.match(b'\x00' * signature.maxLength) for signature in signatures]
+        for matches in reader.mapMemoryChunks(scanChunk, chunkSize, self.maxLength() - 1, regions=regions, workers=workers, isSkippingUntouched=isSkippingUntouched):
+            for address, index, data in matches:
+                if isFiltered:
+                    regionIndex = bisect_right(regionsStarts, address) - 1
+                    if regionIndex < 0 or index not in signaturesOfRegion(regionIndex):
+                        continue
+                yield SignatureMatch(address, signatures[index], data)
+
+def loadSignatures(fileName, setName=None):
+    """
+    Loads a signature set from a text file with a "name = signature" in every line,
+    and # for comments
+    """
+    if None == setName:
+        setName = fileName
+    signatures = SignatureSet(setName)
+    with open(fileName, 'r') as signaturesFile:
+        for lineNumber, line in enumerate(signaturesFile):
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+            if '=' not in line:
+                raise Exception("Invalid signature in line %d of %s" % (lineNumber + 1, fileName))
+            name, text = line.split('=', 1)
+            signatures.add(name.strip(), text.strip())
+    return signatures
+
+__all__ = [
+        "Signature",
+        "SignatureSet",
+        "SignatureMatch",
+        "SignatureParser",
+        "compileSignature",
+        "loadSignatures" ]
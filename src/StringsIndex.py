@@ -0,0 +1,363 @@
+#
+#   StringsIndex.py
+#
+#   StringsIndex - Extracts all the ASCII and UTF-16 strings of a reader's memory,
+#   and keeps them in an index file that can be searched without reading the memory again
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+# Usage:
+#   index = buildStringsIndex(reader, 'process.strings')
+#   ...
+#   index = StringsIndex('process.strings')
+#   for entry in index.find('password', isCaseSensitive=False):
+#       print(entry)
+
+from __future__ import print_function
+import os
+import re
+import sys
+import mmap
+import struct
+import shutil
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .MemReaderBase import SCAN_CHUNK_SIZE
+
+ENCODING_ASCII  = 0
+ENCODING_UTF16  = 1
+ENCODINGS_NAMES = ('ascii', 'utf-16le')
+# Printable characters strings are made of
+PRINTABLE_CHARS = b'\\t\\x20-\\x7e'
+
+INDEX_MAGIC     = b'NDSI'
+INDEX_VERSION   = 1
+# magic, version, is big endian, count, texts size
+INDEX_HEADER    = struct.Struct('<4sLLQQ')
+
+def _typeCode(size):
+    for typeCode in ('L', 'Q', 'I'):
+        if array(typeCode).itemsize == size:
+            return typeCode
+    raise Exception("No array type of %d bytes" % size)
+
+ADDRESS_TYPE_CODE = _typeCode(8)
+
+def _encodingIndex(encoding):
+    if encoding not in ENCODINGS_NAMES:
+        raise Exception("Unknown strings encoding %r" % encoding)
+    return ENCODINGS_NAMES.index(encoding)
+
+def _stringsRegex(encoding, minLength):
+    if ENCODING_ASCII == encoding:
+        return re.compile(b'[' + PRINTABLE_CHARS + b']{%d,}' % minLength)
+    return re.compile(b'(?:[' + PRINTABLE_CHARS + b']\\x00){%d,}' % minLength)
+
+def extractStrings(reader, minLength=4, encodings=ENCODINGS_NAMES, maxLength=0x1000, attributesMask=None, nameFilter=None, chunkSize=SCAN_CHUNK_SIZE, workers=None):
+    """
+    Yields (address, encoding, text) of every string of at least minLength characters in
+    the memory of the reader, in address order.
+    Strings longer than maxLength are split to pieces of maxLength characters, counted from
+    the start of the string, so the result does not depend on the chunkSize.
+    """
+    encodings = [_encodingIndex(encoding) for encoding in encodings]
+    regexes = [(encoding, _stringsRegex(encoding, minLength)) for encoding in encodings]
+    def scanChunk(address, data, ownedSize):
+        found = []
+        for encoding, regex in regexes:
+            for match in regex.finditer(data):
+                start = match.start()
+                if start >= ownedSize:
+                    break
+                # A string that reaches the end of the data may go on in the next chunk, a UTF-16
+                # one also when the data ends between a character and its zero byte
+                isOpen = match.end() > len(data) - (encoding + 1)
+                found.append((address + start, encoding, address + match.end(), isOpen, match.group(0)))
+        found.sort()
+        return address + ownedSize, found
+    # Enough overlap for the rest of a string that goes on in the next chunk to be found there
+    overlap = maxLength * 2
+    lastEnds = [0] * len(ENCODINGS_NAMES)
+    # Per encoding, [start of the string, address of its pending piece, pending bytes] of the
+    # string that was not finished yet, the pending bytes are less than a piece
+    openStrings = [None] * len(ENCODINGS_NAMES)
+    # Pieces that are ready, kept until no open string has a piece before them, and the strings
+    # of the next chunks can not start before them
+    ready = []
+    def addPieces(encoding, isFinished):
+        string = openStrings[encoding]
+        charSize = encoding + 1
+        pieceSize = maxLength * charSize
+        pieceAddress = string[1]
+        data = string[2]
+        offset = 0
+        while len(data) - offset >= pieceSize or (isFinished and offset < len(data)):
+            piece = data[offset:offset + pieceSize]
+            if pieceAddress != string[0] and len(piece) < minLength * charSize:
+                break
+            if ENCODING_UTF16 == encoding:
+                piece = piece[::2]
+            heapq.heappush(ready, (pieceAddress, encoding, piece.decode('ascii')))
+            pieceAddress += len(piece) * charSize
+            offset += pieceSize
+        if isFinished:
+            openStrings[encoding] = None
+        else:
+            string[1] = pieceAddress
+            string[2] = data[offset:]
+    # Strings have no zero characters, so the untouched pages are not read
+    for ownedEnd, found in reader.mapMemoryChunks(scanChunk, chunkSize, overlap, attributesMask, nameFilter, workers=workers, isSkippingUntouched=True):
+        for start, encoding, end, isOpen, data in found:
+            lastEnd = lastEnds[encoding]
+            if start < lastEnd:
+                # Continues a string of the previous chunk
+                if end <= lastEnd:
+                    continue
+                data = data[lastEnd - start:]
+                start = lastEnd
+            if None != openStrings[encoding] and start == lastEnd:
+                openStrings[encoding][2] += data
+            else:
+                if None != openStrings[encoding]:
+                    addPieces(encoding, True)
+                openStrings[encoding] = [start, start, data]
+            lastEnds[encoding] = end
+            addPieces(encoding, not isOpen)
+        releaseEnd = min([ownedEnd] + [string[1] for string in openStrings if None != string])
+        while ready and ready[0][0] < releaseEnd:
+            address, encoding, text = heapq.heappop(ready)
+            yield (address, ENCODINGS_NAMES[encoding], text)
+    for encoding, string in enumerate(openStrings):
+        if None != string:
+            addPieces(encoding, True)
+    while ready:
+        address, encoding, text = heapq.heappop(ready)
+        yield (address, ENCODINGS_NAMES[encoding], text)
+
+class StringEntry( object ):
+    __slots__ = ('address', 'encoding', 'text')
+    def __init__(self, address, encoding, text):
+        self.address = address
+        self.encoding = encoding
+        self.text = text
+
+    def __len__(self):
+        return len(self.text)
+
+    def size(self):
+        """ Number of bytes the string takes in memory """
+        if ENCODINGS_NAMES[ENCODING_UTF16] == self.encoding:
+            return len(self.text) * 2
+        return len(self.text)
+
+    def __repr__(self):
+        return '0x%x %-8s %r' % (self.address, self.encoding, self.text)
+
+class StringsIndexWriter( object ):
+    """
+    Writes an index of strings that are added in address order.
+    The index file has a header, a column of addresses, a column of text offsets, a column
+    of encodings, and then all the texts separated by zeros.
+    Texts are written to a side file as they come, so only the columns are kept in memory.
+    """
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self._textsFileName = fileName + '.texts'
+        self._texts = open(self._textsFileName, 'wb')
+        self._textsSize = 0
+        self._addresses = array(ADDRESS_TYPE_CODE)
+        self._offsets = array(ADDRESS_TYPE_CODE)
+        self._encodings = array('B')
+
+    def __len__(self):
+        return len(self._addresses)
+
+    def add(self, address, encoding, text):
+        if len(self._addresses) and address < self._addresses[-1]:
+            raise Exception("Strings must be added in address order")
+        self._addresses.append(address)
+        self._offsets.append(self._textsSize)
+        self._encodings.append(_encodingIndex(encoding))
+        data = text.encode('ascii') + b'\x00'
+        self._texts.write(data)
+        self._textsSize += len(data)
+
+    def close(self):
+        if None == self._texts:
+            return
+        self._texts.close()
+        self._texts = None
+        with open(self.fileName, 'wb') as indexFile:
+            indexFile.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, int('big' == sys.byteorder), len(self._addresses), self._textsSize))
+            for column in (self._addresses, self._offsets, self._encodings):
+                indexFile.write(column.tobytes())
+            with open(self._textsFileName, 'rb') as textsFile:
+                shutil.copyfileobj(textsFile, indexFile)
+        os.remove(self._textsFileName)
+
+def buildStringsIndex(reader, fileName, minLength=4, encodings=ENCODINGS_NAMES, maxLength=0x1000, attributesMask=None, nameFilter=None, chunkSize=SCAN_CHUNK_SIZE, workers=None):
+    """ Extracts the strings of the reader to an index file, and returns the loaded StringsIndex """
+    writer = StringsIndexWriter(fileName)
+    try:
+        for address, encoding, text in extractStrings(reader, minLength, encodings, maxLength, attributesMask, nameFilter, chunkSize, workers):
+            writer.add(address, encoding, text)
+    finally:
+        writer.close()
+    return StringsIndex(fileName)
+
+class StringsIndex( object ):
+    """
+    Index of strings written by StringsIndexWriter, the file is mapped to memory.
+    Substring searches go over all the texts with a single find per hit, and lookups by
+    address are binary searches.
+    """
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self._file = open(fileName, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, isBigEndian, count, textsSize = INDEX_HEADER.unpack_from(self._map, 0)
+        if INDEX_MAGIC != magic:
+            raise Exception("%s is not a strings index" % fileName)
+        if INDEX_VERSION != version:
+            raise Exception("Unsupported strings index version %d" % version)
+        offset = INDEX_HEADER.size
+        self._addresses = array(ADDRESS_TYPE_CODE)
+        self._addresses.frombytes(self._map[offset:offset + count * 8])
+        offset += count * 8
+        self._offsets = array(ADDRESS_TYPE_CODE)
+        self._offsets.frombytes(self._map[offset:offset + count * 8])
+        offset += count * 8
+        self._encodings = array('B')
+        self._encodings.frombytes(self._map[offset:offset + count])
+        offset += count
+        if bool(isBigEndian) != ('big' == sys.byteorder):
+            self._addresses.byteswap()
+            self._offsets.byteswap()
+        self._textsStart = offset
+        self._textsEnd = offset + textsSize
+        self._lowerTexts = None
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if None != getattr(self, '_map', None):
+            self._lowerTexts = None
+            self._map.close()
+            self._map = None
+            self._file.close()
+
+    def __len__(self):
+        return len(self._addresses)
+
+    def _textRange(self, index):
+        """ Start and end of the text of a string in the file """
+        start = self._textsStart + self._offsets[index]
+        if index + 1 < len(self._offsets):
+            end = self._textsStart + self._offsets[index + 1] - 1
+        else:
+            end = self._textsEnd - 1
+        return start, end
+
+    def _text(self, index):
+        start, end = self._textRange(index)
+        return self._map[start:end].decode('ascii')
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError(index)
+        return StringEntry(self._addresses[index], ENCODINGS_NAMES[self._encodings[index]], self._text(index))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def _indexOfTextOffset(self, offset):
+        return bisect_right(self._offsets, offset) - 1
+
+    def find(self, text, isCaseSensitive=True, encoding=None):
+        """
+        Yields every string that contains text, in address order.
+        The texts are searched in the mapped file, a case insensitive search keeps
+        a lower case copy of all the texts in memory.
+        """
+        if isinstance(text, str) or not isinstance(text, bytes):
+            text = text.encode('ascii')
+        if 0 == len(self):
+            return
+        if isCaseSensitive:
+            texts = self._map
+            base = self._textsStart
+        else:
+            if None == self._lowerTexts:
+                self._lowerTexts = self._map[self._textsStart:self._textsEnd].lower()
+            texts = self._lowerTexts
+            base = 0
+            text = text.lower()
+        textsEnd = base + self._textsEnd - self._textsStart
+        encodingIndex = None
+        if None != encoding:
+            encodingIndex = _encodingIndex(encoding)
+        position = texts.find(text, base, textsEnd)
+        while -1 != position:
+            index = self._indexOfTextOffset(position - base)
+            if None == encodingIndex or encodingIndex == self._encodings[index]:
+                yield self[index]
+            # Continue from the next string
+            nextIndex = index + 1
+            if nextIndex >= len(self):
+                break
+            position = texts.find(text, base + self._offsets[nextIndex], textsEnd)
+
+    def search(self, pattern, flags=0, encoding=None):
+        """ Yields every string the regex pattern is found in, in address order """
+        if not hasattr(pattern, 'search'):
+            if not isinstance(pattern, bytes):
+                pattern = pattern.encode('ascii')
+            pattern = re.compile(pattern, flags)
+        for index in range(len(self)):
+            if None != encoding and ENCODINGS_NAMES[self._encodings[index]] != encoding:
+                continue
+            entry = self[index]
+            if None != pattern.search(entry.text.encode('ascii')):
+                yield entry
+
+    def getStringsInRange(self, start, end):
+        """ All the strings that start between start and end """
+        return [self[index] for index in range(bisect_left(self._addresses, start), bisect_left(self._addresses, end))]
+
+    def getStringAt(self, address):
+        """ The string address is in, None if it is not in any string """
+        index = bisect_right(self._addresses, address) - 1
+        # An ASCII string can end on the first character of a UTF-16 string
+        for index in (index, index - 1):
+            if index < 0:
+                break
+            entry = self[index]
+            if address < entry.address + entry.size():
+                return entry
+        return None
+
+__all__ = [
+        "StringEntry",
+        "StringsIndex",
+        "StringsIndexWriter",
+        "extractStrings",
+        "buildStringsIndex" ]
@@ -75,6 +75,9 @@ class SharedMemReader( MemReaderBase ):
             sharedMem.reader = reader
             self.memMap.append(sharedMem)
 
+    def isLive(self):
+        return True
+
     def __del__(self):
         self.__detach()
 
@@ -27,15 +27,34 @@ import codecs
 import struct
 import sys
 import os
-import subprocess
+import importlib
 
 if sys.platform == 'win32':
     from .Win32.Win32Utilities import *
 
 if sys.version_info < (3,):
     integer_types = (int, long,)
+    from future.utils import bind_method
 else:
     integer_types = (int,)
+    def bind_method(cls, name, func):
+        """ Same as future.utils.bind_method, without the cost of importing future.utils """
+        setattr(cls, name, func)
+
+_optionalModules = {}
+
+def optionalImport(moduleName):
+    """
+    Imports an optional dependency on first use and returns it, or None if it is not installed.
+    Heavy modules like the disassembler, Qt or RPyC are only loaded by the functions that
+    need them, so importing NativDebugging stays fast.
+    """
+    if moduleName not in _optionalModules:
+        try:
+            _optionalModules[moduleName] = importlib.import_module(moduleName)
+        except ImportError:
+            _optionalModules[moduleName] = None
+    return _optionalModules[moduleName]
 
 def DATA( data, base = 0, itemsInRow=0x10 ):
     result = ''
@@ -241,6 +260,7 @@ def getIpcsInfo(isVerbose=True):
         command = ['ipcs', '-mb']
     else:
         command = ['ipcs', '-m']
+    import subprocess
     p = subprocess.Popen(command, stdout=subprocess.PIPE)
     out,err = p.communicate()
     lines = out.split(os.linesep)
@@ -252,6 +272,10 @@ def getIpcsInfo(isVerbose=True):
 def getAllShmidsInfo(ownerFilter=None):
     if sys.platform.lower().startswith('win32'):
         raise Exception("This function is not supported under Windows platform")
+    if sys.platform.lower().startswith('linux'):
+        from .Linux.ShmDiscovery import isSysVShmSupported, getShmSegments
+        if isSysVShmSupported():
+            return [(x.key, x.shmid, x.size) for x in getShmSegments(ownerFilter, isCollectingPids=False)]
     if sys.platform.lower().startswith('linux'):
         SHMID_INDEX = 1
         KEY_INDEX = 0
@@ -318,7 +342,27 @@ def getMemMapFromPMaap(pid):
         raise Exception("This function is not supported under Windows platform")
     elif sys.platform.startswith('aix'):
         raise Exception("This function is not supported under AIX")
-    lines = subprocess.Popen("pmap %d" % pid, stdout=PIPE, shell=True).communicate()[0].split('\n')
+    if sys.platform.lower().startswith('linux') and os.path.exists('/proc/%d/maps' % pid):
+        # Same output pmap gives, without running it
+        from .Linux.ProcMaps import readMapsData, parseMaps
+        memInfo = []
+        for region in parseMaps(readMapsData(pid)):
+            perm = 0
+            if region.read:
+                perm |= 0x40
+            elif region.write:
+                perm |= 0x80
+            elif region.execute:
+                perm |= 0x20
+            # pmap shows the file name without its directory, and "[ anon ]" or "[ stack ]" for the rest
+            if region.pathName and not region.pathName.startswith('['):
+                name = os.path.basename(region.pathName)
+            else:
+                name = '['
+            memInfo.append((name, region.start, region.size, perm))
+        return memInfo
+    import subprocess
+    lines = subprocess.Popen("pmap %d" % pid, stdout=subprocess.PIPE, shell=True).communicate()[0].split('\n')
     memInfo = []
     for l in lines:
         l = l.strip()
@@ -419,3 +463,23 @@ def padBuffer(x, alignment=8):
         x += b'\x00'
     return x
 
+def subtractRanges(ranges, holes):
+    """ The parts of the (address, size) ranges that are not in any of the (address, size) holes """
+    holes = sorted([hole for hole in holes if 0 < hole[1]])
+    result = []
+    index = 0
+    for address, size in sorted(ranges):
+        end = address + size
+        while index < len(holes) and holes[index][0] + holes[index][1] <= address:
+            index += 1
+        holeIndex = index
+        while address < end and holeIndex < len(holes) and holes[holeIndex][0] < end:
+            holeStart, holeSize = holes[holeIndex]
+            if holeStart > address:
+                result.append((address, holeStart - address))
+            address = max(address, holeStart + holeSize)
+            holeIndex += 1
+        if address < end:
+            result.append((address, end - address))
+    return result
+
@@ -0,0 +1,193 @@
+#
+#   VtableScanner.py
+#
+#   VtableScanner - Finds the vtables of C++ objects in memory, by counting how many times
+#   every pointer value to read only memory appears in the writable memory
+#   https://github.com/assafnativ/NativDebugging.git
+#   Nativ.Assaf@gmail.com
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+#
+# Usage:
+#   for vtable in findVtables(reader, minCount=0x10):
+#       print(vtable)
+#       for address in vtable.instances[:4]:
+#           reader.readNPrintUInt64(address, 0x40)
+
+from __future__ import print_function
+
+from .Interfaces import ReadError
+from .MemReaderBase import MemReaderBase, SCAN_CHUNK_SIZE
+from .PointerGraph import IS_NUMPY_FOUND, lookupRanges, pointerType, chunkPointers
+
+if IS_NUMPY_FOUND:
+    import numpy
+
+# Number of histogram entries that are kept before they are merged
+MERGE_THRESHOLD = 0x400000
+
+def _checkNumpy():
+    if not IS_NUMPY_FOUND:
+        raise Exception("Vtables scanner needs numpy")
+
+def isReadOnlyRegion(region):
+    """ Default filter of regions vtables can be in, readable and not writable """
+    attributes = region[3]
+    return 0 != (attributes & MemReaderBase.READ_ATTRIBUTES_MASK) and 0 == (attributes & MemReaderBase.WRITE_ATTRIBUTES_MASK)
+
+def _mergeCounts(values, counts):
+    """ Sums the counts of equal values, returns the sorted unique values and their counts """
+    order = numpy.argsort(values, kind='stable')
+    values = values[order]
+    counts = counts[order]
+    if 0 == len(values):
+        return values, counts
+    starts = numpy.flatnonzero(numpy.concatenate(([True], values[1:] != values[:-1])))
+    return values[starts], numpy.add.reduceat(counts, starts)
+
+class VtableCandidate( object ):
+    def __init__(self, address, count, region):
+        self.address = address
+        self.count = count
+        self.region = region
+        self.instances = []
+
+    @property
+    def name(self):
+        """ Region name and offset of the vtable, like module.dll+0x1234 """
+        regionName = self.region[2] or ('0x%x' % self.region[0])
+        return '%s+0x%x' % (regionName, self.address - self.region[0])
+
+    def __repr__(self):
+        return '0x%x %8d %s' % (self.address, self.count, self.name)
+
+def pointersHistogram(reader, sourcesMask=MemReaderBase.WRITE_ATTRIBUTES_MASK, targetsFilter=isReadOnlyRegion, alignment=None, chunkSize=SCAN_CHUNK_SIZE, workers=None):
+    """
+    Counts the aligned values in the sources regions that point into regions accepted by
+    targetsFilter(region). Returns (values, counts) as numpy arrays sorted by value.
+    Every chunk is counted with numpy, so only the distinct values are handled in python.
+    """
+    _checkNumpy()
+    if None == alignment:
+        alignment = reader.getPointerSize()
+    dtype = pointerType(reader)
+    regions = reader.getMemoryRegions()
+    targets = [region for region in regions if targetsFilter(region)]
+    if not targets:
+        return numpy.zeros(0, dtype=numpy.uint64), numpy.zeros(0, dtype=numpy.int64)
+    targetsStarts = numpy.array([region[0] for region in targets], dtype=numpy.uint64)
+    targetsEnds = numpy.array([region[0] + region[1] for region in targets], dtype=numpy.uint64)
+    def countChunk(address, data, ownedSize):
+        pointers = chunkPointers(address, data, ownedSize, alignment, dtype)
+        if None == pointers:
+            return None
+        values = pointers[0]
+        values = values[lookupRanges(targetsStarts, targetsEnds, values) >= 0]
+        if 0 == len(values):
+            return None
+        return numpy.unique(values, return_counts=True)
+    allValues = numpy.zeros(0, dtype=numpy.uint64)
+    allCounts = numpy.zeros(0, dtype=numpy.int64)
+    pendingValues = []
+    pendingCounts = []
+    pendingSize = 0
+    # Untouched pages are all zeros, that are not counted unless a target starts at 0
+    isSkippingUntouched = 0 != targets[0][0]
+    for histogram in reader.mapMemoryChunks(countChunk, chunkSize, reader.getPointerSize() - 1, sourcesMask, workers=workers, isSkippingUntouched=isSkippingUntouched):
+        if None == histogram:
+            continue
+        pendingValues.append(histogram[0])
+        pendingCounts.append(histogram[1])
+        pendingSize += len(histogram[0])
+        if pendingSize >= MERGE_THRESHOLD:
+            allValues, allCounts = _mergeCounts(numpy.concatenate([allValues] + pendingValues), numpy.concatenate([allCounts] + pendingCounts))
+            pendingValues = []
+            pendingCounts = []
+            pendingSize = 0
+    return _mergeCounts(numpy.concatenate([allValues] + pendingValues), numpy.concatenate([allCounts] + pendingCounts))
+
+def _isFunctionsTable(reader, address, functionsToCheck, executableStarts, executableEnds):
+    """ True if the first entries of the table point into executable memory """
+    try:
+        entries = [reader.readAddr(address + i * reader.getPointerSize()) for i in range(functionsToCheck)]
+    except ReadError:
+        return False
+    entries = numpy.array(entries, dtype=numpy.uint64)
+    return bool((lookupRanges(executableStarts, executableEnds, entries) >= 0).all())
+
+def findVtables(reader, minCount=4, maxCandidates=None, functionsToCheck=1, isCollectingInstances=True, maxInstances=None, sourcesMask=MemReaderBase.WRITE_ATTRIBUTES_MASK, targetsFilter=isReadOnlyRegion, alignment=None, chunkSize=SCAN_CHUNK_SIZE, workers=None):
+    """
+    Returns a list of VtableCandidate, the most frequent first.
+    A vtable candidate is a value found at least minCount times in the sources regions,
+    that points into read only memory, and its first functionsToCheck entries point into
+    executable memory (0 not to check). With isCollectingInstances the memory is read a
+    second time to collect the addresses the vtable is found at, which are usually the
+    start of the objects.
+    """
+    _checkNumpy()
+    if None == alignment:
+        alignment = reader.getPointerSize()
+    values, counts = pointersHistogram(reader, sourcesMask, targetsFilter, alignment, chunkSize, workers)
+    isFrequent = counts >= minCount
+    values = values[isFrequent]
+    counts = counts[isFrequent]
+    order = numpy.argsort(-counts, kind='stable')
+    regions = reader.getMemoryRegions()
+    regionsStarts = numpy.array([region[0] for region in regions], dtype=numpy.uint64)
+    regionsEnds = numpy.array([region[0] + region[1] for region in regions], dtype=numpy.uint64)
+    executable = [region for region in regions if 0 != (region[3] & MemReaderBase.EXECUTE_ATTRIBUTES_MASK)]
+    executableStarts = numpy.array([region[0] for region in executable], dtype=numpy.uint64)
+    executableEnds = numpy.array([region[0] + region[1] for region in executable], dtype=numpy.uint64)
+    candidates = []
+    for index in order:
+        address = int(values[index])
+        if 0 < functionsToCheck and not _isFunctionsTable(reader, address, functionsToCheck, executableStarts, executableEnds):
+            continue
+        region = regions[int(lookupRanges(regionsStarts, regionsEnds, numpy.array([address], dtype=numpy.uint64))[0])]
+        candidates.append(VtableCandidate(address, int(counts[index]), region))
+        if None != maxCandidates and len(candidates) >= maxCandidates:
+            break
+    if isCollectingInstances and candidates:
+        _collectInstances(reader, candidates, maxInstances, sourcesMask, alignment, chunkSize, workers)
+    return candidates
+
+def _collectInstances(reader, candidates, maxInstances, sourcesMask, alignment, chunkSize, workers):
+    dtype = pointerType(reader)
+    byAddress = dict([(candidate.address, candidate) for candidate in candidates])
+    vtables = numpy.array(sorted(byAddress.keys()), dtype=numpy.uint64)
+    def findChunk(address, data, ownedSize):
+        pointers = chunkPointers(address, data, ownedSize, alignment, dtype)
+        if None == pointers:
+            return None
+        values, addresses = pointers
+        isVtable = numpy.isin(values, vtables)
+        return values[isVtable], addresses[isVtable]
+    for found in reader.mapMemoryChunks(findChunk, chunkSize, reader.getPointerSize() - 1, sourcesMask, workers=workers, isSkippingUntouched=(0 not in byAddress)):
+        if None == found:
+            continue
+        for value, address in zip(found[0].tolist(), found[1].tolist()):
+            instances = byAddress[value].instances
+            if None == maxInstances or len(instances) < maxInstances:
+                instances.append(address)
+
+def printVtables(candidates, maxCount=None):
+    for candidate in candidates[:maxCount]:
+        print(repr(candidate))
+
+__all__ = [
+        "VtableCandidate",
+        "findVtables",
+        "pointersHistogram",
+        "printVtables",
+        "isReadOnlyRegion" ]
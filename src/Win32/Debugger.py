@@ -37,12 +37,6 @@ import traceback
 import sys
 # For making debugger blocking free
 from threading import Thread, Lock
-# Arkon's disassembler
-try:
-    import distorm3
-    IS_DISTORM_SUPPORTED = True
-except ImportError as e:
-    IS_DISTORM_SUPPORTED = False
 
 # Process state
 PROCESS_STATE_NO_PROCESS                    = 0
@@ -517,7 +511,9 @@ class Win32Debugger( DebuggerBase, MemoryReader, ProcessCreateAndAttach ):
             unsigned long   address
             unsigned long   lines
         """
-        if not IS_DISTORM_SUPPORTED:
+        # Arkon's disassembler
+        distorm3 = optionalImport('distorm3')
+        if None == distorm3:
             raise Exception("Distrom not found, please install the distorm3 module")
 
         if( None == address ):
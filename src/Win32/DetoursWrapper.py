@@ -1,17 +1,39 @@
 from .Win32Structs import *
 import os
 
+# Attributes that are set when the Detours DLL is loaded
+DETOURS_FUNCTIONS = (
+        'detoursDll',
+        'transactionBegin',
+        'transactionAbort',
+        'transactionCommit',
+        'transactionCommitEx',
+        'updateThread',
+        'attach',
+        'attachEx',
+        'detach' )
+
 class Detours( object ):
     def __init__( self ):
         self._POINTER_SIZE = sizeof(c_void_p)
         self._is_win64 = (self._POINTER_SIZE == 8)
+        self.originalFunctions = {}
+
+    def __getattr__(self, name):
+        # The DLL is loaded on the first use of one of its functions
+        if name in DETOURS_FUNCTIONS and 'detoursDll' not in self.__dict__:
+            self._loadDetoursDll()
+            return getattr(self, name)
+        raise AttributeError(name)
+
+    def _loadDetoursDll(self):
         dllPath = os.path.dirname(os.path.abspath(__file__))
         if self._is_win64:
-            self.detoursDll = WinDLL(os.path.join(dllPath, 'DetoursAMD64.dll'))
+            detoursDll = WinDLL(os.path.join(dllPath, 'DetoursAMD64.dll'))
         else:
-            self.detoursDll = WinDLL(os.path.join(dllPath, 'Detoursx86.dll'))
-        self._definedetoursDll(self.detoursDll)
-        self.originalFunctions = {}
+            detoursDll = WinDLL(os.path.join(dllPath, 'Detoursx86.dll'))
+        self._definedetoursDll(detoursDll)
+        self.detoursDll = detoursDll
 
     def _definedetoursDll(self, detoursDll):
         self.transactionBegin = detoursDll.DetourTransactionBegin
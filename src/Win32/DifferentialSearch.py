@@ -22,23 +22,41 @@
 
 from struct import unpack
 from copy import deepcopy
+from bisect import bisect_left
+import codecs
 from ..Interfaces import ReadError
 from .MemoryMap import *
 
+if 'WindowsError' not in globals():
+    class WindowsError(Exception):
+        pass
+
 def newDifferentialSearch(reader):
     memMap = MemoryMap(reader.getMemoryMap(), reader, atomSize=reader.getDefaultDataSize())
-    return DifferentialSearch(memMap, reader)
+    changeTracker = None
+    if hasattr(reader, 'getChangeTracker'):
+        changeTracker = reader.getChangeTracker()
+        if not changeTracker.IS_KERNEL_TRACKED:
+            # Hashing reads all the memory to find the changes, so comparing the blocks is as fast
+            changeTracker = None
+    return DifferentialSearch(memMap, reader, changeTracker=changeTracker)
 
 class DifferentialSearch( object ):
     READ_ALL_WRITABLE_MEMORY    = 1
     READ_ALL_READABLE_MEMORY    = 2
     READ_ALL_EXECUTABLE_MEMORY  = 4
-    READ_ALL_MEMORY             = UInt8
-    def __init__(self, memMap, reader, searchIn=READ_ALL_WRITABLE_MEMORY, atomSize=4, memory=None):
+    READ_ALL_MEMORY             = 8
+    def __init__(self, memMap, reader, searchIn=READ_ALL_WRITABLE_MEMORY, atomSize=4, memory=None, changeTracker=None):
+        """
+        changeTracker - Tracker of the pages the process writes to, like the SoftDirtyTracker of
+                        reader.getChangeTracker(). When set, only the pages it reports as dirty
+                        are read again when comparing the memory to the last read of it.
+        """
         self._memoryMap = memMap
         self._atomSize = atomSize
         self._reader = reader
         self._readMemory = reader.readMemory
+        self._changeTracker = changeTracker
         if None == memory:
             self._memory = {}
             readAttributesMask = 0
@@ -55,36 +73,91 @@ class DifferentialSearch( object ):
             self._memory = memory
 
     def readAllMemoryWithAttributes(self, attributesMask):
+        if None != self._changeTracker:
+            self._changeTracker.reset()
         for block in self._memoryMap.filteredMap(attributesMask):
-            try:
-                self._memory[block.address] = self._readMemory(block.address, block.length)
-            except (WindowsError, ReadError):
+            pieces = [(block.address, block.length)]
+            if hasattr(self._reader, 'getResidentRuns'):
+                # Pages that were never touched are left out of the search
+                pieces = self._reader.getResidentRuns(pieces)
+            for address, length in pieces:
+                try:
+                    self._memory[address] = self._readMemory(address, length)
+                except (WindowsError, ReadError):
+                    continue
+
+    def _memoryRanges(self):
+        """ The (address, size) of the kept blocks, with adjacent blocks joined """
+        ranges = []
+        for addr in sorted(self._memory.keys()):
+            size = len(self._memory[addr])
+            if ranges and ranges[-1][0] + ranges[-1][1] >= addr:
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], addr + size - ranges[-1][0]))
+            else:
+                ranges.append((addr, size))
+        return ranges
+
+    def _readChangedBlock(self, addr, data, dirtyRanges, dirtyStarts):
+        """ The current data of a block, only the parts of it in dirty pages are read """
+        end = addr + len(data)
+        index = max(0, bisect_left(dirtyStarts, addr) - 1)
+        newData = None
+        while index < len(dirtyRanges) and dirtyRanges[index][0] < end:
+            dirtyStart = max(addr, dirtyRanges[index][0])
+            dirtyEnd = min(end, dirtyRanges[index][0] + dirtyRanges[index][1])
+            index += 1
+            if dirtyStart >= dirtyEnd:
                 continue
+            if None == newData:
+                newData = bytearray(data)
+            newData[dirtyStart - addr:dirtyEnd - addr] = self._readMemory(dirtyStart, dirtyEnd - dirtyStart)
+        if None == newData:
+            return data
+        return bytes(newData)
 
-    def filterMemoryOldWithNew(self, comperator, atomSize=None):
+    def filterMemoryOldWithNew(self, comperator, atomSize=None, unchangedResult=None):
+        """
+        Keeps the atoms for which comperator(newData, oldData) is True.
+        Every block is read once, or only its dirty pages when there is a change tracker.
+        unchangedResult - The result of comperator on equal data when it is known, so a block
+                          that did not change is kept or removed as a whole
+        """
         newMemory = {}
         if None == atomSize:
             atomSize = self._atomSize
+        dirtyRanges = None
+        if None != self._changeTracker:
+            dirtyRanges = self._changeTracker.getDirtyRanges(self._memoryRanges())
+            dirtyStarts = [dirtyRange[0] for dirtyRange in dirtyRanges]
+            self._changeTracker.reset()
         for addr, data in self._memory.items():
             try:
-                newBlockAddress = addr
-                newBlockSize = 0
-                for offset in range(0, len(data), atomSize):
-                    if not comperator( \
-                            self._readMemory(addr + offset, atomSize), \
-                            data[offset:offset+atomSize] ):
-                        if newBlockSize > 0:
-                            newMemory[newBlockAddress] = \
-                                self._readMemory(newBlockAddress, newBlockSize)
-                        newBlockAddress = addr + offset + atomSize
-                        newBlockSize = 0
-                    else:
-                        newBlockSize += atomSize
+                if None != dirtyRanges:
+                    newData = self._readChangedBlock(addr, data, dirtyRanges, dirtyStarts)
+                else:
+                    newData = self._readMemory(addr, len(data))
             except (WindowsError, ReadError) as e:
                 continue
+            if None != unchangedResult and newData == data:
+                if unchangedResult:
+                    newMemory[addr] = newData
+                continue
+            newBlockAddress = addr
+            newBlockSize = 0
+            for offset in range(0, len(data), atomSize):
+                if not comperator( \
+                        newData[offset:offset+atomSize], \
+                        data[offset:offset+atomSize] ):
+                    if newBlockSize > 0:
+                        newMemory[newBlockAddress] = \
+                            newData[newBlockAddress - addr:newBlockAddress - addr + newBlockSize]
+                    newBlockAddress = addr + offset + atomSize
+                    newBlockSize = 0
+                else:
+                    newBlockSize += atomSize
             if newBlockSize > 0:
                 newMemory[newBlockAddress] = \
-                    self._readMemory(newBlockAddress, newBlockSize)
+                    newData[newBlockAddress - addr:newBlockAddress - addr + newBlockSize]
         self._memory = newMemory
 
     def filterMemoryWithConst(self, comperator, const, atomSize=None, alignment=None):
@@ -93,6 +166,8 @@ class DifferentialSearch( object ):
             atomSize = self._atomSize
         if None == alignment:
             alignment = atomSize
+        if None != self._changeTracker:
+            self._changeTracker.reset()
         for addr, data in self._memory.items():
             try:
                 for offset in range(0, len(data), alignment):
@@ -106,9 +181,9 @@ class DifferentialSearch( object ):
         self._memory = newMemory
 
     def removeChangedMemory(self):
-        self.filterMemoryOldWithNew(bytes.__eq__)
+        self.filterMemoryOldWithNew(bytes.__eq__, unchangedResult=True)
     def removeUnchangedMemory(self):
-        self.filterMemoryOldWithNew(bytes.__ne__)
+        self.filterMemoryOldWithNew(bytes.__ne__, unchangedResult=False)
 
     def searchUInt64(self, x, alignment=None):
         if x > 0xffffffffffffffff or x < 0:
@@ -22,18 +22,16 @@ from builtins import bytes
 from ..MemReaderBase import *
 from .Win32Structs import *
 from .Win32Utilities import *
-from ..Utilities import printIfVerbose, integer_types
-try:
-    import distorm3
-    IS_DISASSEMBLER_FOUND = True
-except ImportError as e:
-    IS_DISASSEMBLER_FOUND = False
+from ..Utilities import printIfVerbose, integer_types, optionalImport
 
 class MemReaderBaseWin( MemReaderBase ):
     def __init__(self, *argv, **argm):
         self._ENDIANITY = '<' # Intel is always Little-endian
         MemReaderBase.__init__(self, *argv, **argm)
 
+    def isLive(self):
+        return True
+
     def enumModulesAddresses(self):
         ALLOCATION_GRANULARITY = 0x1000
         mem_basic_info = MEMORY_BASIC_INFORMATION()
@@ -336,7 +334,8 @@ class MemReaderBaseWin( MemReaderBase ):
         return 0 != (self.getAddressAttributes(addr) & self.EXECUTE_ATTRIBUTES_MASK)
 
     def disasm(self, addr, length=0x100, decodeType=1):
-        if IS_DISASSEMBLER_FOUND:
+        distorm3 = optionalImport('distorm3')
+        if None != distorm3:
             for opcode in distorm3.Decode(
                     addr,
                     self.readMemory(addr, length),
@@ -27,10 +27,9 @@ from .InjectDll import InjectDll
 from ..GUIDisplayBase import *
 from .ProcessCreateAndAttach import *
 from ..Interfaces import ReadError
+from ..Utilities import optionalImport
 import os
 import struct
-import subprocess
-import rpyc
 import sys
 from platform import python_implementation
 
@@ -86,6 +85,9 @@ class MemReaderOverRPyCFactory( MemoryReader, ProcessCreateAndAttach ):
         return self._initRemote()
 
     def _initRemote(self):
+        rpyc = optionalImport('rpyc')
+        if None == rpyc:
+            raise Exception("RPyC not found, please install the rpyc module")
         remote = rpyc.classic.connect("localhost", port=12345)
         remote.modules.sys.stdout = sys.stdout
         remote.modules.sys.stdin = sys.stdin
@@ -30,12 +30,6 @@ from ..Interfaces import MemReaderInterface, ReadError
 from ..MemReaderBase import *
 from ..GUIDisplayBase import *
 from ..Utilities import *
-try:
-    from ..QtWidgets import *
-    IS_GUI_FOUND = True
-except ImportError as e:
-    #print("No GUI support")
-    IS_GUI_FOUND = False
 
 class SharedMemInfo(object):
     def __init__(self, id, localAddress, base, size, mappingHandle):
@@ -110,6 +104,9 @@ class SharedMemReader( MemReaderBase, GUIDisplayBase ):
                 return address + mem.delta
         raise ReadError(address)
 
+    def isLive(self):
+        return True
+
     def __del__(self):
         self.__detach()
 
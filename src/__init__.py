@@ -6,6 +6,16 @@ __all__ = [
         "GUIDisplayBase",
         "DumpBase",
         "BitsLimitedInteger",
+        "InstrumentedReader",
+        "ScanJob",
+        "MemoryServer",
+        "ReadAhead",
+        "Signatures",
+        "PointerGraph",
+        "VtableScanner",
+        "StringsIndex",
+        "PageTable",
+        "ChangeTracker",
         "Utilities" ]
 from . import File
 from . import MemoryDump